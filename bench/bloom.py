@@ -0,0 +1,70 @@
+"""
+Cost of rejecting unknown short codes with the Bloom filter vs the database.
+
+Seeds a temporary SQLite database with --codes short codes, builds a
+CodeFilter from it, then times lookups of codes that do not exist: a filter
+check per lookup against the indexed SELECT the redirect would otherwise run.
+Also reports the build time and the observed false-positive rate.
+
+    python -m bench.bloom --codes 1000000 --lookups 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import bindparam, create_engine, select
+from sqlalchemy.orm import Session
+
+from bench.load import seed
+from common.bloom import BLOOM_FILTER_ERROR_RATE, CodeFilter, sqlalchemy_code_fetcher
+from common.db import configure_engine, engine_options
+from fastapi_app.models import Base, ShortenUrl
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--codes', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--error-rate', type=float, default=BLOOM_FILTER_ERROR_RATE)
+    args = parser.parse_args(argv)
+
+    misses = [f'm{i:07d}' for i in range(args.lookups)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bloom.db')
+        url = f'sqlite:///{path}'
+        engine = configure_engine(create_engine(url, **engine_options(url)))
+        Base.metadata.create_all(engine)
+        seed(path, args.codes)
+
+        code_filter = CodeFilter(sqlalchemy_code_fetcher(lambda: engine, ShortenUrl),
+                                 capacity=args.codes, error_rate=args.error_rate, sync_interval=3600)
+        start = time.perf_counter()
+        code_filter.sync()
+        results['build_s'] = round(time.perf_counter() - start, 3)
+
+        might_exist = code_filter.might_exist
+        start = time.perf_counter()
+        passed = sum(might_exist(code) for code in misses)
+        results['filter_ns_per_miss'] = round((time.perf_counter() - start) / args.lookups * 1e9, 1)
+        results['observed_error_rate'] = round(passed / args.lookups, 5)
+
+        stmt = select(ShortenUrl.original_url).where(ShortenUrl.short_code == bindparam('code'))
+        with Session(engine) as session:
+            start = time.perf_counter()
+            for code in misses:
+                session.scalar(stmt, {'code': code})
+            results['db_ns_per_miss'] = round((time.perf_counter() - start) / args.lookups * 1e9, 1)
+        results['filter'] = code_filter.stats()
+        engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Collision benchmark for the short code generators.
+
+Generates codes for N distinct URLs with each hash configuration and compares
+the observed number of first-candidate collisions with the birthday bound.
+Also times code generation per strategy.
+
+    python -m bench.code_collisions --count 1000000
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.codes import (
+    BASE62_ALPHABET, HEX_ALPHABET, Base62CodeGenerator, BlockCodeGenerator,
+    HashCodeGenerator, collision_probability,
+)
+
+HASH_CONFIGS = [
+    ('hex', HEX_ALPHABET, 6),
+    ('hex', HEX_ALPHABET, 8),
+    ('base62', BASE62_ALPHABET, 6),
+    ('base62', BASE62_ALPHABET, 7),
+]
+
+
+def _urls(count):
+    return (f'https://example.com/article/{i}?ref=bench' for i in range(count))
+
+
+def measure_hash(count, alphabet, length):
+    gen = HashCodeGenerator(length=length, alphabet=alphabet)
+    seen = set()
+    collisions = 0
+    start = time.perf_counter()
+    for url in _urls(count):
+        code = gen.code_for(url)
+        if code in seen:
+            collisions += 1
+        seen.add(code)
+    elapsed = time.perf_counter() - start
+    space = len(alphabet) ** length
+    return {
+        'collisions': collisions,
+        'expected_collisions': round(count * (count - 1) / (2 * space), 2),
+        'p_any_collision': collision_probability(count, len(alphabet), length),
+        'ns_per_code': round(elapsed / count * 1e9, 1),
+    }
+
+
+def measure_counter(count, generator):
+    start = time.perf_counter()
+    for url in _urls(count):
+        next(generator.candidates(url))
+    return {'ns_per_code': round((time.perf_counter() - start) / count * 1e9, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--count', type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    results = {'count': args.count}
+    for name, alphabet, length in HASH_CONFIGS:
+        results[f'hash-{name}-{length}'] = measure_hash(args.count, alphabet, length)
+
+    counter = itertools.count(1)
+    results['base62'] = measure_counter(args.count, Base62CodeGenerator(lambda: next(counter)))
+    blocks = itertools.count(1, 1000)
+    results['block'] = measure_counter(args.count, BlockCodeGenerator(lambda size: next(blocks), 1000))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare two bench.load JSON reports (e.g. from two commits).
+
+Prints req/s and p99 latency per framework and endpoint side by side with the
+relative change, and exits with status 1 if any throughput dropped or p99 rose
+by more than --threshold percent.
+
+    python -m bench.compare before.json after.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(before: dict, after: dict, threshold: float):
+    """Yield one row per framework/endpoint present in both reports, and whether it regressed."""
+    for framework, result in after['results'].items():
+        old_result = before['results'].get(framework)
+        if not old_result:
+            continue
+        rows = {**result['endpoints'], 'total': result['total']}
+        old_rows = {**old_result['endpoints'], 'total': old_result['total']}
+        for endpoint, new in rows.items():
+            old = old_rows.get(endpoint)
+            if not old:
+                continue
+            rps = change(old['req_per_s'], new['req_per_s'])
+            p99 = change(old['p99_ms'], new['p99_ms'])
+            yield {
+                'framework': framework,
+                'endpoint': endpoint,
+                'req_per_s': (old['req_per_s'], new['req_per_s'], round(rps, 1)),
+                'p99_ms': (old['p99_ms'], new['p99_ms'], round(p99, 1)),
+                'regressed': rps < -threshold or p99 > threshold,
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10, help='allowed change in percent')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    print(f"{'framework':<10}{'endpoint':<10}{'req/s':>26}{'p99 ms':>26}")
+    regressed = False
+    for row in compare(before, after, args.threshold):
+        regressed |= row['regressed']
+        print(
+            f"{row['framework']:<10}{row['endpoint']:<10}"
+            f"{'{} -> {} ({:+}%)'.format(*row['req_per_s']):>26}"
+            f"{'{} -> {} ({:+}%)'.format(*row['p99_ms']):>26}"
+            f"{'  REGRESSED' if row['regressed'] else ''}"
+        )
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
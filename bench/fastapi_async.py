@@ -0,0 +1,110 @@
+"""
+Redirect latency: FastAPI threadpool (sync Session) vs async (AsyncSession).
+
+Seeds a temporary SQLite database, then fires --concurrency simultaneous
+redirect requests through each app in-process (httpx ASGITransport) and
+reports throughput and p50/p95/p99 latency. The redirect cache is shrunk to
+one entry so every request reaches the database.
+
+    python -m bench.fastapi_async --rows 10000 --requests 5000 --concurrency 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['REDIRECT_CACHE_SIZE'] = '1'
+
+import httpx
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from common.utils import url_digest
+from fastapi_app import app as sync_module
+from fastapi_app import async_app as async_module
+from fastapi_app.async_models import get_async_db
+from fastapi_app.models import Base, ShortenUrl, get_db
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def seed(db_path, rows):
+    engine = create_engine(f'sqlite:///{db_path}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(ShortenUrl), [
+            {'original_url': f'https://example.com/{i}', 'url_hash': url_digest(f'https://example.com/{i}'),
+             'short_code': f'c{i:07d}'}
+            for i in range(rows)
+        ])
+    return engine
+
+
+async def drive(app, codes, concurrency):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def one(code):
+            async with sem:
+                start = time.perf_counter()
+                response = await client.get(f'/{code}')
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 302, response.status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(code) for code in codes))
+        elapsed = time.perf_counter() - start
+    return {
+        'requests': len(codes),
+        'req_per_s': round(len(codes) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        engine = seed(db_path, args.rows)
+        SessionLocal = sessionmaker(bind=engine)
+        AsyncSessionLocal = async_sessionmaker(create_async_engine(f'sqlite+aiosqlite:///{db_path}'))
+
+        def sync_db():
+            with SessionLocal() as db:
+                yield db
+
+        async def async_db():
+            async with AsyncSessionLocal() as db:
+                yield db
+
+        sync_module.app.dependency_overrides[get_db] = sync_db
+        async_module.app.dependency_overrides[get_async_db] = async_db
+        codes = [f'c{random.randrange(args.rows):07d}' for _ in range(args.requests)]
+        results = {
+            'threadpool': asyncio.run(drive(sync_module.app, codes, args.concurrency)),
+            'async': asyncio.run(drive(async_module.app, codes, args.concurrency)),
+        }
+    print(json.dumps({'concurrency': args.concurrency, **results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
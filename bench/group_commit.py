@@ -0,0 +1,80 @@
+"""
+Shorten throughput with one commit per URL vs group commit.
+
+Runs --requests shorten() calls for distinct URLs from --concurrency threads
+against a fresh SQLite file, first committing each URL on its own session
+(the default) and then through a GroupCommitter, and reports URLs per second
+and the batch sizes the committer reached. --synchronous sets SQLite's
+synchronous pragma (the apps default to NORMAL; FULL fsyncs every commit).
+
+    python -m bench.group_commit --requests 5000 --concurrency 32 --synchronous FULL
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from common import db as db_tuning
+from common.codes import HashCodeGenerator
+from common.group_commit import GroupCommitStore, GroupCommitter, sqlalchemy_url_writer
+from common.sql_store import SQLAlchemyStore
+from common.store import shorten
+from fastapi_app.models import Base, ShortenUrl
+
+
+def run(engine, requests, concurrency, committer=None):
+    generator = HashCodeGenerator()
+
+    def one(i):
+        with Session(engine) as session:
+            store = SQLAlchemyStore(session, ShortenUrl)
+            if committer is not None:
+                store = GroupCommitStore(store, committer)
+            shorten(store, generator, f'https://bench.example.com/{i}')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return round(requests / (time.perf_counter() - start), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-delay-ms', type=float, default=2)
+    parser.add_argument('--synchronous', default=db_tuning.SQLITE_PRAGMAS['synchronous'])
+    args = parser.parse_args(argv)
+    db_tuning.SQLITE_PRAGMAS['synchronous'] = args.synchronous
+
+    results = {'synchronous': args.synchronous}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('per_request_commit', 'group_commit'):
+            url = f"sqlite:///{os.path.join(tmp, mode + '.db')}"
+            engine = db_tuning.configure_engine(create_engine(url, **db_tuning.engine_options(url)))
+            Base.metadata.create_all(engine)
+            committer = None
+            if mode == 'group_commit':
+                committer = GroupCommitter(sqlalchemy_url_writer(lambda: engine, ShortenUrl),
+                                           args.max_batch, args.max_delay_ms / 1000)
+            results[f'{mode}_urls_per_s'] = run(engine, args.requests, args.concurrency, committer)
+            if committer is not None:
+                committer.stop()
+                results['committer'] = committer.stats()
+            engine.dispose()
+    results['speedup'] = round(results['group_commit_urls_per_s'] / results['per_request_commit_urls_per_s'], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
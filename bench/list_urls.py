@@ -0,0 +1,119 @@
+"""
+Cost of GET /api/urls per framework at a realistic table size.
+
+Seeds --rows URLs into a temporary database per framework and calls the
+WSGI/ASGI app directly (no HTTP client or server in the way). Reports the
+mean time for a full page (limit=1000, the maximum) over --requests calls,
+and the time to stream every row with ?stream=json. --accept-encoding gzip
+(or br) asks for compressed responses; the page then comes from the
+pre-compressed snapshot, which LIST_SNAPSHOTS=0 turns off for comparison.
+
+    python -m bench.list_urls --rows 100000 --requests 200
+    python -m bench.list_urls --accept-encoding gzip
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.load import FRAMEWORKS, prepare, seed
+from common import pagination, serializers
+
+PAGE_QUERY = f'limit={pagination.MAX_PAGE_SIZE}'
+STREAM_QUERY = 'stream=json'
+
+
+def wsgi_get(app, query, accept_encoding=''):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/urls', 'QUERY_STRING': query}
+    if accept_encoding:
+        environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+    setup_testing_defaults(environ)
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status)
+
+    body = app(environ, start_response)
+    try:
+        size = sum(len(chunk) for chunk in body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    assert statuses[-1].startswith('200'), statuses[-1]
+    return size
+
+
+def asgi_get(app, query, accept_encoding=''):
+    headers = [(b'host', b'bench')]
+    if accept_encoding:
+        headers.append((b'accept-encoding', accept_encoding.encode()))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': '/api/urls', 'raw_path': b'/api/urls', 'root_path': '', 'query_string': query.encode(),
+        'headers': headers, 'client': ('127.0.0.1', 1), 'server': ('bench', 80),
+    }
+    statuses = []
+    sizes = []
+    requested = []
+
+    async def receive():
+        if requested:
+            # StreamingResponse listens for a disconnect until the body is sent.
+            await asyncio.get_running_loop().create_future()
+        requested.append(True)
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            sizes.append(len(message.get('body', b'')))
+
+    asyncio.run(app(scope, receive, send))
+    assert statuses[-1] == 200, statuses[-1]
+    return sum(sizes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--frameworks', default=','.join(FRAMEWORKS))
+    parser.add_argument('--accept-encoding', default='', help='Accept-Encoding sent with every request')
+    args = parser.parse_args(argv)
+
+    results = {'json_backend': serializers.BACKEND, 'accept_encoding': args.accept_encoding or None}
+    with tempfile.TemporaryDirectory() as tmp:
+        for framework in args.frameworks.split(','):
+            db_path = str(Path(tmp) / f'{framework}.db')
+            app = prepare(framework, db_path)
+            seed(db_path, args.rows)
+            get = asgi_get if framework == 'fastapi' else wsgi_get
+            get(app, PAGE_QUERY, args.accept_encoding)  # warm up connections and caches
+
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                page_bytes = get(app, PAGE_QUERY, args.accept_encoding)
+            page_ms = (time.perf_counter() - start) / args.requests * 1000
+
+            start = time.perf_counter()
+            stream_bytes = get(app, STREAM_QUERY, args.accept_encoding)
+            stream_s = time.perf_counter() - start
+            results[framework] = {
+                'page_ms': round(page_ms, 2),
+                'page_bytes': page_bytes,
+                'stream_s': round(stream_s, 3),
+                'stream_rows_per_s': round(args.rows / stream_s),
+                'stream_bytes': stream_bytes,
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
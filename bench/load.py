@@ -0,0 +1,312 @@
+"""
+Cross-framework load test: the same request mix against Flask, Django and FastAPI.
+
+Each app gets its own fresh SQLite database pre-seeded with --rows URLs, then
+--requests requests drawn from --mix (weights for redirect, shorten and list)
+are sent from --concurrency concurrent clients. Reports req/s and p50/p95/p99
+latency per endpoint and framework as JSON, so runs from two commits can be
+diffed with bench.compare.
+
+--mode inprocess (default) calls the apps directly: Flask and Django through
+httpx's WSGI transport from a thread pool, FastAPI through its ASGI transport
+on one event loop. --mode server starts each app's own runner on its usual
+port (Flask 8002, Django 8003, FastAPI 8004) and drives it over HTTP.
+
+    python -m bench.load --rows 100000 --requests 20000 --mix redirect=90,shorten=5,list=5
+    python -m bench.load --frameworks fastapi --mode server --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import httpx
+
+from common.utils import url_digest
+
+FRAMEWORKS = ('flask', 'django', 'fastapi')
+PORTS = {'flask': 8002, 'django': 8003, 'fastapi': 8004}
+EXPECTED_STATUS = {'redirect': 302, 'shorten': 201, 'list': 200}
+DEFAULT_MIX = 'redirect=90,shorten=5,list=5'
+SEED_EPOCH = datetime(2020, 1, 1)
+
+
+def parse_mix(spec: str) -> dict:
+    """Parse 'redirect=90,shorten=5,list=5' into {endpoint: weight}."""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in EXPECTED_STATUS:
+            raise ValueError(f'Unknown endpoint in mix: {name!r}')
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise ValueError('mix needs at least one positive weight')
+    return mix
+
+
+def seed_code(i: int) -> str:
+    # 's' is not a hex digit, so seeded codes never clash with hash-generated ones.
+    return f's{i:07d}'
+
+
+def build_plan(mix: dict, n: int, rows: int, rng: random.Random) -> list:
+    """n (endpoint, method, path, json body) tuples drawn from the mix."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    plan = []
+    for i, name in enumerate(rng.choices(names, weights, k=n)):
+        if name == 'redirect':
+            plan.append((name, 'GET', f'/{seed_code(rng.randrange(rows))}', None))
+        elif name == 'shorten':
+            plan.append((name, 'POST', '/api/shorten', {'url': f'https://bench.example.com/{rng.random()}/{i}'}))
+        else:
+            plan.append((name, 'GET', '/api/urls?limit=100', None))
+    return plan
+
+
+def seed(db_path: str, rows: int, chunk: int = 10000) -> None:
+    """Bulk insert rows URLs (codes s0000000...) into an already migrated database."""
+    conn = sqlite3.connect(db_path)
+    try:
+        for start in range(0, rows, chunk):
+            conn.executemany(
+                'INSERT INTO shorten_url (original_url, url_hash, short_code, created_at) VALUES (?, ?, ?, ?)',
+                [
+                    (f'https://example.com/{i}', url_digest(f'https://example.com/{i}'), seed_code(i),
+                     (SEED_EPOCH + timedelta(seconds=i)).isoformat(' ', 'microseconds'))
+                    for i in range(start, min(start + chunk, rows))
+                ],
+            )
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def prepare(framework: str, db_path: str):
+    """
+    Point one framework at db_path, create its schema and return its WSGI/ASGI app.
+    Each app reads its database location from the environment at import time.
+    """
+    if framework == 'flask':
+        os.environ['FLASK_DATABASE_URL'] = f'sqlite:///{db_path}'
+        from common.schema import upgrade_schema
+        from flask_app.app import app, db
+        with app.app_context():
+            db.create_all()
+            upgrade_schema(db.engine)
+        return app
+    if framework == 'django':
+        os.environ['DJANGO_DB_PATH'] = db_path
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_app.settings')
+        sys.path.insert(0, str(ROOT / 'django_app'))
+        import django
+        from django.core.management import call_command
+        django.setup()
+        call_command('migrate', verbosity=0)
+        from django_app.wsgi import application
+        return application
+    os.environ['FASTAPI_DATABASE_URL'] = f'sqlite:///{db_path}'
+    from fastapi_app.models import migrate
+    migrate()
+    if os.environ.get('FASTAPI_DB_MODE', 'sync') == 'async':
+        from fastapi_app.async_app import app
+    else:
+        from fastapi_app.app import app
+    return app
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    """Per-endpoint and total stats from {endpoint: [(seconds, ok), ...]}."""
+    def stats(entries):
+        latencies = sorted(seconds for seconds, _ in entries)
+        return {
+            'requests': len(entries),
+            'errors': sum(1 for _, ok in entries if not ok),
+            'req_per_s': round(len(entries) / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    result = {'endpoints': {name: stats(entries) for name, entries in samples.items() if entries}}
+    result['total'] = stats([entry for entries in samples.values() for entry in entries])
+    return result
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def drive_threads(client: httpx.Client, plan: list, concurrency: int) -> dict:
+    """Send plan from concurrency threads sharing one client; returns summarize() output."""
+    samples = {name: [] for name in EXPECTED_STATUS}
+    lock = threading.Lock()
+    requests = iter(plan)
+
+    def worker():
+        while True:
+            with lock:
+                item = next(requests, None)
+            if item is None:
+                return
+            name, method, path, body = item
+            start = time.perf_counter()
+            response = client.request(method, path, json=body)
+            seconds = time.perf_counter() - start
+            with lock:
+                samples[name].append((seconds, response.status_code == EXPECTED_STATUS[name]))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(samples, time.perf_counter() - start)
+
+
+async def drive_asgi(app, plan: list, concurrency: int) -> dict:
+    """Send plan through an in-process ASGI transport with concurrency tasks."""
+    samples = {name: [] for name in EXPECTED_STATUS}
+    requests = iter(plan)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def worker():
+            for name, method, path, body in requests:
+                start = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                samples[name].append((time.perf_counter() - start, response.status_code == EXPECTED_STATUS[name]))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(samples, time.perf_counter() - start)
+
+
+def run_inprocess(framework: str, app, warmup: list, plan: list, concurrency: int) -> dict:
+    if framework == 'fastapi':
+        asyncio.run(drive_asgi(app, warmup, concurrency))
+        return asyncio.run(drive_asgi(app, plan, concurrency))
+    transport = httpx.WSGITransport(app=app)
+    with httpx.Client(transport=transport, base_url='http://localhost') as client:
+        drive_threads(client, warmup, concurrency)
+        return drive_threads(client, plan, concurrency)
+
+
+def start_server(framework: str) -> subprocess.Popen:
+    """Start one app with its own runner (as in the Makefile), inheriting the bench environment."""
+    port = str(PORTS[framework])
+    if framework == 'flask':
+        cmd, cwd = [sys.executable, 'flask_app/app.py'], ROOT
+    elif framework == 'django':
+        cmd, cwd = [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'], ROOT / 'django_app'
+    else:
+        module = 'fastapi_app.async_app' if os.environ.get('FASTAPI_DB_MODE') == 'async' else 'fastapi_app.app'
+        cmd = [sys.executable, '-m', 'uvicorn', f'{module}:app', '--host', '127.0.0.1', '--port', port, '--no-access-log']
+        cwd = ROOT
+    return subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_up(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'{base_url}/api/urls?limit=1', timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not come up within {timeout}s')
+
+
+def run_server(framework: str, warmup: list, plan: list, concurrency: int) -> dict:
+    base_url = f'http://127.0.0.1:{PORTS[framework]}'
+    server = start_server(framework)
+    try:
+        wait_until_up(base_url)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        with httpx.Client(base_url=base_url, limits=limits, timeout=60) as client:
+            drive_threads(client, warmup, concurrency)
+            return drive_threads(client, plan, concurrency)
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frameworks', default=','.join(FRAMEWORKS), help='comma-separated subset of flask,django,fastapi')
+    parser.add_argument('--mode', choices=('inprocess', 'server'), default='inprocess')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--warmup', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the request plan')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    frameworks = [name.strip() for name in args.frameworks.split(',')]
+    unknown = set(frameworks) - set(FRAMEWORKS)
+    if unknown:
+        parser.error(f'unknown framework(s): {", ".join(sorted(unknown))}')
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().astimezone().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'mode': args.mode,
+            'rows': args.rows,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'mix': mix,
+            'fastapi_db_mode': os.environ.get('FASTAPI_DB_MODE', 'sync'),
+        },
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for framework in frameworks:
+            # Every framework gets the same warmup and measured request sequences.
+            warmup = build_plan(mix, args.warmup, args.rows, random.Random(f'{args.seed}-warmup'))
+            plan = build_plan(mix, args.requests, args.rows, random.Random(args.seed))
+            db_path = os.path.join(tmp, f'{framework}.db')
+            app = prepare(framework, db_path)
+            seed(db_path, args.rows)
+            if args.mode == 'server':
+                report['results'][framework] = run_server(framework, warmup, plan, args.concurrency)
+            else:
+                report['results'][framework] = run_inprocess(framework, app, warmup, plan, args.concurrency)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
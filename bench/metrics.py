@@ -0,0 +1,46 @@
+"""
+Per-call cost of common.metrics instrumentation, disabled and enabled.
+
+    python -m bench.metrics --calls 1000000
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import metrics
+
+
+def per_call_ns(calls, body):
+    start = time.perf_counter()
+    for _ in range(calls):
+        body()
+    return round((time.perf_counter() - start) / calls * 1e9, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    def empty():
+        pass
+
+    def timed_block():
+        with metrics.timed('bench'):
+            pass
+
+    results = {'baseline_ns': per_call_ns(args.calls, empty)}
+    metrics.set_enabled(False)
+    results['disabled_timed_ns'] = per_call_ns(args.calls, timed_block)
+    metrics.set_enabled(True)
+    results['enabled_timed_ns'] = per_call_ns(args.calls, timed_block)
+    metrics.set_enabled(False)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Per-request cost of a cached redirect with and without the fast path.
+
+Seeds a temporary database per framework, warms the redirect cache with one
+request, then calls the WSGI/ASGI app directly (no HTTP client or server in
+the way) --requests times for the same cached code: once through the full
+framework (FAST_REDIRECTS off) and once through common.fast_redirect.
+
+    python -m bench.redirects --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.load import FRAMEWORKS, prepare, seed, seed_code
+from common import fast_redirect
+
+
+def wsgi_us_per_request(app, path, requests):
+    base = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+    setup_testing_defaults(base)
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        body = app(dict(base), start_response)
+        for _ in body:
+            pass
+        if hasattr(body, 'close'):
+            body.close()
+    elapsed = time.perf_counter() - start
+    assert statuses[-1].startswith('302'), statuses[-1]
+    return round(elapsed / requests * 1e6, 2)
+
+
+def asgi_us_per_request(app, path, requests):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': [(b'host', b'bench')], 'client': ('127.0.0.1', 1), 'server': ('bench', 80),
+    }
+    statuses = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    async def run():
+        start = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), receive, send)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+    assert statuses[-1] == 302, statuses[-1]
+    return round(elapsed / requests * 1e6, 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--frameworks', default=','.join(FRAMEWORKS))
+    args = parser.parse_args(argv)
+
+    path = f'/{seed_code(0)}'
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for framework in args.frameworks.split(','):
+            db_path = str(Path(tmp) / f'{framework}.db')
+            app = prepare(framework, db_path)
+            seed(db_path, 1000)
+            measure = asgi_us_per_request if framework == 'fastapi' else wsgi_us_per_request
+            measure(app, path, 1)  # fill the redirect cache
+            fast_redirect.set_enabled(False)
+            full = measure(app, path, args.requests)
+            fast_redirect.set_enabled(True)
+            fast = measure(app, path, args.requests)
+            results[framework] = {
+                'full_us_per_request': full,
+                'fast_path_us_per_request': fast,
+                'saved_us': round(full - fast, 2),
+                'speedup': round(full / fast, 1),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
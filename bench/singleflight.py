@@ -0,0 +1,105 @@
+"""
+Redirect and shorten contention with and without single-flight.
+
+Each round lets --concurrency threads (released together by a barrier) look
+up the same cold short code through cached_redirect_lookup, then shorten the
+same new URL, against a fresh SQLite file. It runs once with plain calls and
+once with a SingleFlight per operation, and reports how many SQL statements
+each round cost and how long the rounds took.
+
+    python -m bench.singleflight --rounds 200 --concurrency 64
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from common import db as db_tuning
+from common.cache import LRUCache, cached_redirect_lookup
+from common.codes import HashCodeGenerator
+from common.singleflight import SingleFlight
+from common.sql_store import SQLAlchemyStore
+from common.store import shorten
+from fastapi_app.models import Base, ShortenUrl
+
+
+def storm(concurrency, call):
+    """Run call(i) on concurrency threads released at the same moment; seconds taken."""
+    barrier = threading.Barrier(concurrency)
+
+    def one(i):
+        barrier.wait()
+        return call(i)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(concurrency)))
+    return time.perf_counter() - start
+
+
+def run(engine, rounds, concurrency, enabled):
+    generator = HashCodeGenerator()
+    cache = LRUCache(maxsize=rounds + 1)
+    redirect_flight, shorten_flight = SingleFlight(enabled), SingleFlight(enabled)
+    statements = [0]
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.__setitem__(0, statements[0] + 1))
+
+    def lookup(code):
+        with Session(engine) as session:
+            load = SQLAlchemyStore(session, ShortenUrl).get_target
+            return cached_redirect_lookup(cache, code, load, flight=redirect_flight)
+
+    def shorten_one(url):
+        with Session(engine) as session:
+            return shorten(SQLAlchemyStore(session, ShortenUrl), generator, url, flight=shorten_flight)
+
+    with Session(engine) as session:
+        store = SQLAlchemyStore(session, ShortenUrl)
+        codes = [shorten(store, generator, f'https://bench.example.com/hot/{i}')[0].short_code for i in range(rounds)]
+
+    results = {}
+    for name, call in (
+        ('redirect', lambda r: storm(concurrency, lambda i: lookup(codes[r]))),
+        ('shorten', lambda r: storm(concurrency, lambda i: shorten_one(f'https://bench.example.com/new/{r}'))),
+    ):
+        statements[0] = 0
+        seconds = sum(call(r) for r in range(rounds))
+        results[name] = {
+            'statements_per_round': round(statements[0] / rounds, 1),
+            'ms_per_round': round(seconds / rounds * 1000, 2),
+        }
+    results['redirect']['flight'] = redirect_flight.stats()
+    results['shorten']['flight'] = shorten_flight.stats()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args(argv)
+
+    results = {'concurrency': args.concurrency}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, enabled in (('plain', False), ('single_flight', True)):
+            url = f"sqlite:///{os.path.join(tmp, mode + '.db')}"
+            options = {**db_tuning.engine_options(url), 'pool_size': args.concurrency, 'max_overflow': 0}
+            engine = db_tuning.configure_engine(create_engine(url, **options))
+            Base.metadata.create_all(engine)
+            results[mode] = run(engine, args.rounds, args.concurrency, enabled)
+            engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
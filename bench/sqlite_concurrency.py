@@ -0,0 +1,105 @@
+"""
+Concurrent read/write benchmark: default SQLite settings vs common.db tuning.
+
+Runs --writers threads inserting one row per transaction and --readers threads
+doing short-code point lookups for --seconds against a fresh database, once
+with a plain create_engine and once with engine_options() + configure_engine().
+Reports operations per second and how many operations failed with
+"database is locked".
+
+    python -m bench.sqlite_concurrency --writers 4 --readers 16 --seconds 5
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+
+from common.db import configure_engine, engine_options
+from common.utils import url_digest
+from fastapi_app.models import Base, ShortenUrl
+
+SEED_ROWS = 10000
+
+
+def run(engine, writers, readers, seconds):
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(ShortenUrl), [
+            {'original_url': f'https://seed/{i}', 'url_hash': url_digest(f'https://seed/{i}'), 'short_code': f's{i}'}
+            for i in range(SEED_ROWS)
+        ])
+    counts = {'writes': 0, 'reads': 0, 'locked': 0}
+    lock = threading.Lock()
+    ids = itertools.count()
+    deadline = time.monotonic() + seconds
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer():
+        while time.monotonic() < deadline:
+            n = next(ids)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(ShortenUrl).values(
+                        original_url=f'https://w/{n}', url_hash=url_digest(f'https://w/{n}'), short_code=f'w{n}'))
+                bump('writes')
+            except OperationalError:
+                bump('locked')
+
+    def reader():
+        while time.monotonic() < deadline:
+            code = f's{random.randrange(SEED_ROWS)}'
+            try:
+                with engine.connect() as conn:
+                    conn.execute(select(ShortenUrl.original_url).where(ShortenUrl.short_code == code)).first()
+                bump('reads')
+            except OperationalError:
+                bump('locked')
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    return {
+        'writes_per_s': round(counts['writes'] / seconds, 1),
+        'reads_per_s': round(counts['reads'] / seconds, 1),
+        'locked_errors': counts['locked'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'default.db')}"
+        results['default'] = run(
+            create_engine(url, connect_args={'check_same_thread': False}), args.writers, args.readers, args.seconds)
+        url = f"sqlite:///{os.path.join(tmp, 'tuned.db')}"
+        results['tuned'] = run(
+            configure_engine(create_engine(url, **engine_options(url))), args.writers, args.readers, args.seconds)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
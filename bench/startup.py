@@ -0,0 +1,146 @@
+"""
+Worker cold start per framework: import cost and time to the first redirect.
+
+Seeds a temporary database per framework, then starts fresh interpreters:
+once under ``-X importtime`` to see where import time goes (summed per
+top-level package and per module, by self time), and --runs times to time
+spawning a process that imports the app and serves one redirect (a cache
+miss, so it includes the first database query). The app is called in-process,
+without a server in the way.
+
+    python -m bench.startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.load import FRAMEWORKS, seed, seed_code
+
+IMPORTS = {
+    'flask': 'from flask_app.app import app',
+    'fastapi': 'from fastapi_app.app import app',
+    'fastapi-async': 'from fastapi_app.async_app import app',
+    'django': (
+        "import os, sys; sys.path.insert(0, 'django_app'); "
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_app.settings'); "
+        'from django_app.wsgi import application as app'
+    ),
+}
+
+WSGI_REDIRECT = '''
+from wsgiref.util import setup_testing_defaults
+environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': PATH}
+setup_testing_defaults(environ)
+statuses = []
+body = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+b''.join(body)
+getattr(body, 'close', lambda: None)()
+assert statuses[0].startswith('302'), statuses
+'''
+
+ASGI_REDIRECT = '''
+import asyncio
+scope = {
+    'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+    'path': PATH, 'raw_path': PATH.encode(), 'root_path': '', 'query_string': b'',
+    'headers': [(b'host', b'bench')], 'client': ('127.0.0.1', 1), 'server': ('bench', 80),
+}
+statuses = []
+
+async def receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+async def send(message):
+    if message['type'] == 'http.response.start':
+        statuses.append(message['status'])
+
+asyncio.run(app(scope, receive, send))
+assert statuses[0] == 302, statuses
+'''
+
+
+def migrate(framework: str, env: dict) -> None:
+    """Create the schema in a separate process, as a deploy step would."""
+    app = 'fastapi' if framework.startswith('fastapi') else framework
+    subprocess.run([sys.executable, '-m', 'common.startup', 'migrate', '--app', app],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+def importtime_report(framework: str, env: dict, top: int) -> dict:
+    """Import time of the app module, summed by top-level package and per module (self time)."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORTS[framework]],
+                            cwd=ROOT, env=env, check=True, capture_output=True, text=True)
+    packages = defaultdict(int)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        packages[name.split('.')[0]] += int(self_us)
+        modules.append((int(self_us), name))
+    modules.sort(reverse=True)
+    return {
+        'import_ms': round(sum(packages.values()) / 1000, 1),
+        'packages_ms': {
+            name: round(us / 1000, 1)
+            for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        },
+        'modules_ms': {name: round(us / 1000, 1) for us, name in modules[:top]},
+    }
+
+
+def first_redirect_ms(framework: str, env: dict, path: str) -> float:
+    """Milliseconds from spawning the interpreter until it has served one redirect."""
+    request = ASGI_REDIRECT if framework.startswith('fastapi') else WSGI_REDIRECT
+    code = f'{IMPORTS[framework]}\nPATH = {path!r}\n{request}\nprint("ok", flush=True)\n'
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = child.stdout.readline()
+    elapsed = time.perf_counter() - start
+    _, stderr = child.communicate()
+    if line.strip() != 'ok':
+        raise RuntimeError(f'{framework} did not serve the redirect:\n{stderr}')
+    return elapsed * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--top', type=int, default=8, help='packages and modules listed per framework')
+    parser.add_argument('--frameworks', default=','.join(FRAMEWORKS + ('fastapi-async',)))
+    args = parser.parse_args(argv)
+
+    path = f'/{seed_code(0)}'
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for framework in args.frameworks.split(','):
+            db_path = str(Path(tmp) / f'{framework}.db')
+            env = dict(os.environ, FLASK_DATABASE_URL=f'sqlite:///{db_path}',
+                       FASTAPI_DATABASE_URL=f'sqlite:///{db_path}', DJANGO_DB_PATH=db_path)
+            migrate(framework, env)
+            seed(db_path, args.rows)
+            report = importtime_report(framework, env, args.top)
+            runs = [first_redirect_ms(framework, env, path) for _ in range(args.runs)]
+            results[framework] = {
+                'first_redirect_ms': round(statistics.median(runs), 1),
+                'first_redirect_ms_min': round(min(runs), 1),
+                **report,
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
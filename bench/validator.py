@@ -0,0 +1,120 @@
+"""
+Microbenchmark for URL validation: the original per-call implementation vs
+common.validators.
+
+Builds a corpus of realistic valid URLs and common invalid inputs (bare
+domains, other schemes, whitespace, bot paths, oversized URLs), checks that
+both implementations agree, and reports nanoseconds per call for each, split by
+valid and invalid input, plus validate_many over the whole corpus.
+
+    python -m bench.validator --size 200000
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.validators import MAX_URL_LENGTH, is_valid_url, validate_many
+
+DOMAINS = [
+    'google.com', 'www.youtube.com', 'en.wikipedia.org', 'github.com', 'news.ycombinator.com',
+    'docs.python.org', 'stackoverflow.com', 'www.amazon.co.uk', 'medium.com', 'www.bbc.co.uk',
+    'api.example.io', 'localhost', '127.0.0.1', '192.168.1.10', 'sub.domain.example.travel',
+]
+PATHS = [
+    '', '/', '/search?q=url+shortener', '/watch?v=dQw4w9WgXcQ', '/wiki/Python_(programming_language)',
+    '/anthropics/claude/pull/123#discussion', '/questions/1234/how-to?answertab=votes',
+    '/dp/B00X4WHP5E/ref=sr_1_1', '/@user/a-long-post-title-1a2b3c', '/news/world-12345678',
+    '/v1/items/42?fields=id,name&sort=-created', ':8080/health', ':443/',
+]
+# Valid URLs the scheme x domain x path product does not produce; schemes and hosts are case-insensitive.
+VALID_EXTRA = ['HTTPS://EXAMPLE.COM/UPPER']
+INVALID = [
+    '', '   ', 'not-a-valid-url', 'example.com', 'www.example.com/path', 'ftp://files.example.com/a.zip',
+    'javascript:alert(1)', 'mailto:someone@example.com', 'http://', 'https://', 'http:/example.com',
+    'http://exa mple.com', 'https://example.com/has space', 'http://-bad-.com', 'http://example.c',
+    '/wp-login.php', '/favicon.ico', 'data:text/html;base64,PGgxPg==', 'http://例子.测试',
+    'https://example.com/' + 'a' * MAX_URL_LENGTH,
+]
+
+_LEGACY_PATTERN = (
+    r'^https?://'
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'
+    r'localhost|'
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
+    r'(?::\d+)?'
+    r'(?:/?|[/?]\S+)$'
+)
+
+
+def legacy_is_valid_url(url):
+    """The implementation common.utils shipped before common.validators."""
+    if not url or not isinstance(url, str):
+        return False
+    url = url.strip()
+    if not url:
+        return False
+    url_pattern = re.compile(_LEGACY_PATTERN, re.IGNORECASE)
+    try:
+        result = urlparse(url)
+        return all([result.scheme in ('http', 'https'), result.netloc, url_pattern.match(url)])
+    except Exception:
+        return False
+
+
+def build_corpus(size, seed=0):
+    rng = random.Random(seed)
+    valid = [f'{scheme}://{d}{p}' for scheme in ('http', 'https') for d in DOMAINS for p in PATHS] + VALID_EXTRA
+    corpus = []
+    for _ in range(size):
+        if rng.random() < 0.7:
+            corpus.append(rng.choice(valid))
+        else:
+            corpus.append(rng.choice(INVALID))
+    return corpus
+
+
+def time_per_call(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return round((time.perf_counter() - start) / len(items) * 1e9, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.size)
+    # Oversized URLs are the one intended difference: they are now rejected.
+    disagreements = [
+        u for u in set(corpus)
+        if legacy_is_valid_url(u) != is_valid_url(u) and len(u.strip()) <= MAX_URL_LENGTH
+    ]
+    valid = [u for u in corpus if is_valid_url(u)]
+    invalid = [u for u in corpus if not is_valid_url(u)]
+
+    start = time.perf_counter()
+    validate_many(corpus)
+    batch_ns = (time.perf_counter() - start) / len(corpus) * 1e9
+
+    print(json.dumps({
+        'corpus': len(corpus),
+        'disagreements': disagreements,
+        'legacy_ns': {'valid': time_per_call(legacy_is_valid_url, valid),
+                      'invalid': time_per_call(legacy_is_valid_url, invalid)},
+        'new_ns': {'valid': time_per_call(is_valid_url, valid),
+                   'invalid': time_per_call(is_valid_url, invalid)},
+        'validate_many_ns_per_url': round(batch_ns, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
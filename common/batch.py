@@ -0,0 +1,149 @@
+"""
+Bulk shortening shared by the POST /api/shorten/batch endpoints.
+
+The framework views only supply three small database callbacks; everything
+else (parsing, validation, in-batch dedupe, code allocation and result
+ordering) happens here, so a batch of N URLs costs a handful of IN queries and
+one bulk insert instead of N request round trips.
+"""
+import json
+from itertools import islice
+
+from common.codes import MAX_ATTEMPTS, CodeAllocationError
+from common.expiry import expired
+from common.utils import url_digest
+from common.validators import validate_many
+
+MAX_BATCH_SIZE = 50000
+# Stay well below SQLite's bound-parameter limit for IN (...) lists.
+IN_CHUNK_SIZE = 500
+
+
+def chunked(items, size: int = IN_CHUNK_SIZE):
+    """Yield lists of up to size items, consuming items lazily."""
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def parse_batch_body(body: bytes, content_type: str = '') -> list:
+    """
+    Parse a batch request body into a list of raw items.
+    Accepts a JSON array, {"urls": [...]}, or NDJSON (one item per line).
+    Items are URL strings or {"url": ...} objects. Raises ValueError on bad input.
+    """
+    try:
+        if 'ndjson' in (content_type or ''):
+            items = [json.loads(line) for line in body.decode().splitlines() if line.strip()]
+        else:
+            items = json.loads(body.decode()) if body else None
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError('Invalid JSON') from exc
+    if isinstance(items, dict):
+        items = items.get('urls')
+    if not isinstance(items, list) or not items:
+        raise ValueError('A non-empty list of URLs is required')
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f'At most {MAX_BATCH_SIZE} URLs per batch')
+    return items
+
+
+def _item_url(item):
+    url = item.get('url') if isinstance(item, dict) else item
+    return url.strip() if isinstance(url, str) else ''
+
+
+def shorten_batch(items, generator, fetch_existing, fetch_taken_codes, insert_rows, revived=()):
+    """
+    Shorten every item and return one result dict per item, in input order.
+
+    fetch_existing(digests) -> {url_hash: record dict} for already stored URLs;
+        it adds the digests of expired links it revived to revived, and those
+        count as created, as in common.store.shorten().
+    fetch_taken_codes(codes) -> set of codes that are already in use.
+    insert_rows(rows) -> {url_hash: record dict}; inserts all rows in one
+        transaction, or returns None if a unique constraint fired (a concurrent
+        writer got there first), in which case the batch is re-planned.
+    """
+    urls = [_item_url(item) for item in items]
+    results = [None] * len(urls)
+    valid = validate_many(urls)
+    wanted = {}  # url_hash -> (url, [indices])
+    for i, (url, ok) in enumerate(zip(urls, valid)):
+        if not url:
+            results[i] = {'status': 400, 'url': url, 'message': 'URL is required'}
+        elif not ok:
+            results[i] = {'status': 400, 'url': url, 'message': 'Invalid or unavailable URL'}
+        else:
+            wanted.setdefault(url_digest(url), (url, []))[1].append(i)
+
+    records = {}
+    for _ in range(MAX_ATTEMPTS):
+        pending = {h: v for h, v in wanted.items() if h not in records}
+        for digests in chunked(pending):
+            records.update(fetch_existing(digests))
+        existing = set(records)
+        new = {h: v for h, v in pending.items() if h not in records}
+        if not new:
+            break
+        inserted = insert_rows(_allocate_codes(new, generator, fetch_taken_codes))
+        if inserted is not None:
+            records.update(inserted)
+            break
+    else:
+        raise CodeAllocationError('Could not allocate short codes for batch')
+
+    for digest, (url, indices) in wanted.items():
+        created = digest not in existing or digest in revived
+        for n, i in enumerate(indices):
+            results[i] = {'status': 201, 'created': created and n == 0, **records[digest]}
+    return results
+
+
+def _allocate_codes(new, generator, fetch_taken_codes):
+    """Pick one free code per new URL, checking candidates in bulk against the DB."""
+    candidates = {h: generator.candidates(url) for h, (url, _) in new.items()}
+    chosen = {h: next(it) for h, it in candidates.items()}
+    for _ in range(MAX_ATTEMPTS):
+        taken = set()
+        for codes in chunked(chosen.values()):
+            taken |= fetch_taken_codes(codes)
+        seen = set()
+        clashes = []
+        for h, code in chosen.items():
+            if code in taken or code in seen:
+                clashes.append(h)
+            seen.add(code)
+        if not clashes:
+            return [
+                {'original_url': new[h][0], 'url_hash': h, 'short_code': code}
+                for h, code in chosen.items()
+            ]
+        for h in clashes:
+            try:
+                chosen[h] = next(candidates[h])
+            except StopIteration:
+                raise CodeAllocationError('Could not allocate a short code') from None
+    raise CodeAllocationError('Could not allocate a short code')
+
+
+def shorten_batch_in_store(store, items, generator):
+    """shorten_batch backed by a common.store.Store."""
+    revived = set()
+
+    def fetch_existing(digests):
+        records = store.get_by_hashes(digests)
+        for digest, record in records.items():
+            if expired(record.expires_at):
+                # Not swept yet: revive it rather than collide with its url_hash.
+                records[digest] = store.renew(record)
+                revived.add(digest)
+        return {digest: record.to_dict() for digest, record in records.items()}
+
+    def insert_rows(rows):
+        inserted = store.insert_many(rows)
+        if inserted is None:
+            return None
+        return {digest: record.to_dict() for digest, record in inserted.items()}
+
+    return shorten_batch(items, generator, fetch_existing, store.taken_codes, insert_rows, revived)
@@ -0,0 +1,218 @@
+"""
+Bloom filter of stored short codes, used to turn away unknown codes early.
+
+Scanners request paths such as /wp-login.php or /favicon.ico that were never
+shortened. When such a code misses the redirect cache, the redirect lookup
+asks the CodeFilter first. A "no" from a Bloom filter is certain, so the
+request gets its 404 without a database query and without adding a negative
+entry to the LRU cache. A "maybe" (a real code, or a false positive at
+roughly BLOOM_FILTER_ERROR_RATE) falls through to the normal lookup.
+
+The filter is built from the store on the first lookup. Codes this process
+creates are added as they are inserted. Codes created by other worker
+processes are picked up by an incremental sync (rows with an id above the
+last one seen). That sync runs when the filter says "no" and at least
+BLOOM_FILTER_SYNC_INTERVAL seconds have passed since the last one. As a
+result, a code created in another worker can 404 here for up to that long.
+This is bounded by the interval, and a shared redirect cache usually serves
+such codes first. When the number of codes grows past the configured
+capacity, the filter is rebuilt at twice the size so its false-positive
+rate stays near the target.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BLOOM_FILTER = os.environ.get('BLOOM_FILTER', '1') != '0'
+BLOOM_FILTER_CAPACITY = int(os.environ.get('BLOOM_FILTER_CAPACITY', 1000000))
+BLOOM_FILTER_ERROR_RATE = float(os.environ.get('BLOOM_FILTER_ERROR_RATE', 0.01))
+BLOOM_FILTER_SYNC_INTERVAL = float(os.environ.get('BLOOM_FILTER_SYNC_INTERVAL', 1.0))
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter sized for capacity keys at error_rate.
+    Positions come from one blake2b digest split into two 64-bit hashes
+    (Kirsch-Mitzenmacher double hashing).
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        if capacity <= 0:
+            raise ValueError('capacity must be positive')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        bits = self._bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def estimated_error_rate(self) -> float:
+        """False-positive rate expected at the current number of keys."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class CodeFilter:
+    """
+    Bloom filter over every stored short code, kept in step with the store.
+    fetch(after_id) yields (id, short_code) for rows with an id above after_id,
+    in id order.
+    """
+
+    def __init__(self, fetch, capacity: int = BLOOM_FILTER_CAPACITY, error_rate: float = BLOOM_FILTER_ERROR_RATE,
+                 sync_interval: float = BLOOM_FILTER_SYNC_INTERVAL, enabled: bool = True):
+        self.fetch = fetch
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget every code; the next lookup rebuilds the filter from the store."""
+        with self._lock:
+            self._bloom = BloomFilter(self.capacity, self.error_rate)
+            self._last_id = 0
+            self._loaded = False
+            self._synced_at = 0.0
+            self.rejected = self.passed = self.syncs = self.rebuilds = 0
+
+    def add(self, code: str) -> None:
+        """Record a code this process just stored."""
+        # Lock-free: a code added to a filter that a rebuild is replacing is
+        # still in the store, so the next incremental sync picks it up.
+        self._bloom.add(code)
+
+    def sync(self, deadline: float | None = None) -> bool:
+        """
+        Add codes stored since the last sync (all of them on the first call).
+        With a time.monotonic() deadline, stop there and return False; the
+        next sync carries on from the last code added.
+        """
+        with self._lock:
+            return self._sync(deadline)
+
+    def _sync(self, deadline: float | None = None) -> bool:
+        bloom = self._bloom
+        last_id = self._last_id
+        rows = self.fetch(last_id)
+        for n, (row_id, code) in enumerate(rows, 1):
+            bloom.add(code)
+            last_id = row_id
+            if deadline is not None and not n % 1024 and time.monotonic() >= deadline:
+                self._last_id = last_id
+                getattr(rows, 'close', lambda: None)()
+                return False
+        self._last_id = last_id
+        self._loaded = True
+        self._synced_at = time.monotonic()
+        self.syncs += 1
+        if bloom.count > bloom.capacity:
+            self._rebuild(bloom.capacity * 2)
+        return True
+
+    def _rebuild(self, capacity: int) -> None:
+        logger.info('Rebuilding short code Bloom filter for %d codes', capacity)
+        bloom = BloomFilter(capacity, self.error_rate)
+        last_id = 0
+        for row_id, code in self.fetch(0):
+            bloom.add(code)
+            last_id = row_id
+        self._bloom, self._last_id = bloom, last_id
+        self.rebuilds += 1
+
+    def _sync_due(self) -> bool:
+        return not self._loaded or time.monotonic() - self._synced_at >= self.sync_interval
+
+    def might_exist(self, code: str) -> bool:
+        """False only if code is certainly not stored."""
+        if not self.enabled:
+            return True
+        if not self._loaded:
+            self.sync()
+        if code in self._bloom:
+            self.passed += 1
+            return True
+        if self._sync_due():
+            self.sync()
+            if code in self._bloom:
+                self.passed += 1
+                return True
+        self.rejected += 1
+        return False
+
+    async def might_exist_async(self, code: str) -> bool:
+        """Like might_exist, running any sync in a worker thread."""
+        if not self.enabled:
+            return True
+        if self._loaded and code in self._bloom:
+            self.passed += 1
+            return True
+        if self._sync_due():
+            await asyncio.to_thread(self.sync)
+        if code in self._bloom:
+            self.passed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def stats(self) -> dict:
+        bloom = self._bloom
+        return {
+            'enabled': self.enabled,
+            'codes': bloom.count,
+            'capacity': bloom.capacity,
+            'bits': bloom.size,
+            'hashes': bloom.hashes,
+            'target_error_rate': bloom.error_rate,
+            'estimated_error_rate': bloom.estimated_error_rate(),
+            'rejected': self.rejected,
+            'passed': self.passed,
+            'syncs': self.syncs,
+            'rebuilds': self.rebuilds,
+        }
+
+
+def sqlalchemy_code_fetcher(get_engine, model):
+    """fetch(after_id) reading model's table in a short-lived session."""
+    from sqlalchemy.orm import Session
+
+    from common.sql_store import SQLAlchemyStore
+
+    def fetch(after_id):
+        with Session(get_engine()) as session:
+            yield from SQLAlchemyStore(session, model).codes_after(after_id)
+    return fetch
+
+
+def make_code_filter(fetch) -> CodeFilter:
+    """Build a filter configured by the BLOOM_FILTER_* environment variables."""
+    return CodeFilter(fetch, BLOOM_FILTER_CAPACITY, BLOOM_FILTER_ERROR_RATE, BLOOM_FILTER_SYNC_INTERVAL, BLOOM_FILTER)
@@ -0,0 +1,219 @@
+"""
+In-process LRU cache with optional TTL, shared by all framework versions.
+
+Used in front of the redirect lookup so hot short codes are served without
+touching the database. Missing codes can be cached too (negative caching) by
+storing ``None`` with a shorter TTL, and links with an expiry are cached no
+longer than they live.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from common.expiry import link_ttl
+from common.shared_store import open_shared_store
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded mapping with least-recently-used eviction.
+    Entries may carry a per-entry TTL (seconds); expired entries are dropped lazily.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float | None = None):
+        if maxsize <= 0:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        """Return the cached value for key, or default on miss/expiry."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = MISSING) -> None:
+        """Store value under key. ttl overrides the cache default; None means no expiry."""
+        if ttl is MISSING:
+            ttl = self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def _env_float(name: str, default: float | None = None):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# Tunables for the redirect cache; TTLs are in seconds.
+REDIRECT_CACHE_SIZE = int(os.environ.get('REDIRECT_CACHE_SIZE', 10000))
+REDIRECT_CACHE_TTL = _env_float('REDIRECT_CACHE_TTL')
+REDIRECT_CACHE_NEGATIVE_TTL = _env_float('REDIRECT_CACHE_NEGATIVE_TTL', 30.0)
+
+
+class SharedBackedCache(LRUCache):
+    """
+    LRUCache with a cross-process SharedRedirectStore behind it.
+    Local misses fall through to the shared store and are promoted on a hit;
+    URLs set here are published to the shared store for the other workers.
+    Entries with a TTL of their own (negative entries, expiring links) stay
+    process-local, since shared entries never expire.
+    """
+
+    def __init__(self, shared, maxsize: int = 10000, ttl: float | None = None):
+        super().__init__(maxsize, ttl)
+        self.shared = shared
+        self.shared_hits = 0
+
+    def get(self, key, default=MISSING):
+        value = super().get(key, MISSING)
+        if value is not MISSING:
+            return value
+        value = self.shared.get(key)
+        if value is None:
+            return default
+        self.shared_hits += 1
+        super().set(key, value)
+        return value
+
+    def set(self, key, value, ttl: float | None = MISSING) -> None:
+        super().set(key, value, ttl)
+        if value is not None and ttl is MISSING:
+            self.shared.set(key, value)
+
+    def delete(self, key) -> None:
+        super().delete(key)
+        self.shared.delete(key)
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'shared_hits': self.shared_hits, 'shared': self.shared.stats()}
+
+
+def make_redirect_cache(name: str) -> LRUCache:
+    """
+    Build the short_code -> original_url cache used by redirect_to_original.
+    name identifies the app's database; it is backed by a shared memory store
+    when SHARED_REDIRECT_CACHE_DIR is set (see common.shared_store).
+    """
+    shared = open_shared_store(name)
+    if shared is not None:
+        return SharedBackedCache(shared, maxsize=REDIRECT_CACHE_SIZE, ttl=REDIRECT_CACHE_TTL)
+    return LRUCache(maxsize=REDIRECT_CACHE_SIZE, ttl=REDIRECT_CACHE_TTL)
+
+
+class ExpiringUrl(str):
+    """
+    The cached target of a link with an expiry. Compares and hashes as the
+    plain URL; the redirect responses read expires_at to keep clients from
+    caching the link past it (see common.http_cache).
+    """
+
+    def __new__(cls, url: str, expires_at):
+        self = super().__new__(cls, url)
+        self.expires_at = expires_at
+        return self
+
+
+def cache_redirect(cache: LRUCache, code: str, url: str, expires_at=None) -> str:
+    """Cache code -> url, until expires_at at the latest, and return the cached value."""
+    if expires_at is None:
+        cache.set(code, url)
+        return url
+    url = ExpiringUrl(url, expires_at)
+    cache.set(code, url, ttl=link_ttl(expires_at, cache.ttl))
+    return url
+
+
+def _cache_target(cache: LRUCache, code: str, target):
+    if target is None:
+        # A negative TTL of 0 turns negative caching off rather than filling slots with expired entries.
+        if REDIRECT_CACHE_NEGATIVE_TTL:
+            cache.set(code, None, ttl=REDIRECT_CACHE_NEGATIVE_TTL)
+        return None
+    url, expires_at = target
+    return cache_redirect(cache, code, url, expires_at)
+
+
+def _load_and_cache(cache: LRUCache, code: str, load):
+    return _cache_target(cache, code, load(code))
+
+
+async def _load_and_cache_async(cache: LRUCache, code: str, load):
+    return _cache_target(cache, code, await load(code))
+
+
+def cached_redirect_lookup(cache: LRUCache, code: str, load, code_filter=None, flight=None):
+    """
+    Return the original URL for code (an ExpiringUrl if the link expires), or
+    None if it does not exist.
+    load(code) returns (original_url, expires_at), or None for a missing or
+    expired code, and is only called on a cache miss; its result (including
+    None) is cached. On a miss, a common.bloom.CodeFilter rejects codes that
+    are certainly not stored, without calling load or caching anything, and a
+    common.singleflight.SingleFlight lets concurrent misses for one code share
+    a single load.
+    """
+    url = cache.get(code)
+    if url is MISSING:
+        if code_filter is not None and not code_filter.might_exist(code):
+            return None
+        if flight is None:
+            return _load_and_cache(cache, code, load)
+        url, _ = flight.do(code, _load_and_cache, cache, code, load)
+    return url
+
+
+async def cached_redirect_lookup_async(cache: LRUCache, code: str, load, code_filter=None, flight=None):
+    """Like cached_redirect_lookup, for an async load(code) and an AsyncSingleFlight."""
+    url = cache.get(code)
+    if url is MISSING:
+        if code_filter is not None and not await code_filter.might_exist_async(code):
+            return None
+        if flight is None:
+            return await _load_and_cache_async(cache, code, load)
+        url, _ = await flight.do(code, _load_and_cache_async, cache, code, load)
+    return url
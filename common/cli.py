@@ -0,0 +1,267 @@
+"""
+Bulk import and export of shortened URLs for any of the three app databases.
+
+    python -m common.cli import --app flask urls.csv
+    python -m common.cli import --app django --format ndjson - < urls.ndjson
+    python -m common.cli export --app fastapi --format csv urls.csv
+
+Records are (url, code, created_at, expires_at): CSV with that header row,
+or NDJSON objects with those keys. On import created_at is optional and
+defaults to now, and expires_at is optional and defaults to never. Input is
+read lazily and written in chunked executemany calls inside large
+transactions, so memory stays flat however big the file is. Rows whose code
+or URL is already stored are skipped (ON CONFLICT DO NOTHING). Rows with an
+invalid URL, lines that are not a JSON object, and codes no redirect could
+reach (empty, reserved like "api", containing "/", or longer than the column)
+are counted as invalid and skipped too. Non-unique indexes on
+shorten_url (partial ones included) are dropped for the import and rebuilt
+once at the end. The unique ones stay, since they are what detects the
+duplicates.
+Export streams rows in id order. Progress in rows per second goes to stderr.
+
+The database is the one the app itself would use (FLASK_DATABASE_URL,
+FASTAPI_DATABASE_URL, DJANGO_DB_PATH or their defaults) unless --database
+gives a SQLAlchemy URL. The app must have created its schema first.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import create_engine, inspect, text
+
+from common.batch import chunked
+from common.db import configure_engine, engine_options
+from common.fast_redirect import RESERVED_PATHS
+from common.store import DB_DATETIME_FORMAT, INSERT_URLS_SQL
+from common.utils import url_digest
+from common.validators import is_valid_url
+
+ROOT = Path(__file__).resolve().parent.parent
+FORMATS = ('csv', 'ndjson')
+FIELDS = ('url', 'code', 'created_at', 'expires_at')
+MAX_CODE_LENGTH = 50  # short_code is String(50) in every app
+
+IMPORT_CHUNK_SIZE = 10000
+IMPORT_COMMIT_EVERY = 200000
+EXPORT_CHUNK_SIZE = 10000
+
+INSERT_SQL = text(INSERT_URLS_SQL)
+EXPORT_SQL = text('SELECT original_url, short_code, created_at, expires_at FROM shorten_url ORDER BY id')
+
+
+def database_url(app: str) -> str:
+    """The SQLAlchemy URL app reads and writes, resolved the way the app resolves it."""
+    if app == 'flask':
+        return os.environ.get('FLASK_DATABASE_URL', f"sqlite:///{ROOT / 'flask_app' / 'shorten_url.db'}")
+    if app == 'fastapi':
+        return os.environ.get('FASTAPI_DATABASE_URL', 'sqlite:///./fastapi_shorten_url.db')
+    if app == 'django':
+        return f"sqlite:///{os.environ.get('DJANGO_DB_PATH', ROOT / 'django_app' / 'db.sqlite3')}"
+    raise ValueError(f'Unknown app: {app!r}')
+
+
+def _db_datetime(value) -> str:
+    """created_at in the naive-UTC text form SQLAlchemy and Django store on SQLite."""
+    if value:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc)
+    else:
+        parsed = datetime.now(timezone.utc)
+    return parsed.strftime(DB_DATETIME_FORMAT)
+
+
+def read_records(stream, fmt: str):
+    """
+    Lazily yield {'url', 'code', 'created_at', 'expires_at'} dicts from a CSV or
+    NDJSON text stream. An NDJSON line that is not JSON yields None.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def write_records(stream, fmt: str, records) -> None:
+    """Write (url, code, created_at, expires_at) tuples as CSV or NDJSON."""
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        writer.writerows(records)
+        return
+    for record in records:
+        stream.write(json.dumps(dict(zip(FIELDS, record))) + '\n')
+
+
+class Progress:
+    """Periodic 'N rows, R rows/s' reports on stderr."""
+
+    def __init__(self, verb: str, interval: float = 1.0, out=sys.stderr):
+        self.verb = verb
+        self.interval = interval
+        self.out = out
+        self.rows = 0
+        self.start = self._reported = time.perf_counter()
+
+    def update(self, n: int) -> None:
+        self.rows += n
+        now = time.perf_counter()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            print(f'{self.verb} {self.rows} rows ({self.rate(now)} rows/s)', file=self.out, flush=True)
+
+    def rate(self, now: float | None = None) -> int:
+        elapsed = (now or time.perf_counter()) - self.start
+        return round(self.rows / elapsed) if elapsed > 0 else 0
+
+    def summary(self, **counts) -> dict:
+        return {'rows': self.rows, **counts, 'seconds': round(time.perf_counter() - self.start, 3),
+                'rows_per_s': self.rate()}
+
+
+def _routable_code(code: str) -> bool:
+    """Whether GET /<code> would reach the redirect for code."""
+    return 0 < len(code) <= MAX_CODE_LENGTH and '/' not in code and code not in RESERVED_PATHS
+
+
+def _rows(records, counts: dict):
+    """Turn records into insert parameters, counting the ones that cannot be imported."""
+    for record in records:
+        if not isinstance(record, dict):
+            counts['invalid'] += 1
+            continue
+        url = record.get('url') or ''
+        code = record.get('code') or ''
+        if not isinstance(url, str) or not isinstance(code, str):
+            counts['invalid'] += 1
+            continue
+        url, code = url.strip(), code.strip()
+        if not _routable_code(code) or not is_valid_url(url):
+            counts['invalid'] += 1
+            continue
+        try:
+            created_at = _db_datetime(record.get('created_at'))
+            expires_at = _db_datetime(record['expires_at']) if record.get('expires_at') else None
+        except (TypeError, ValueError):
+            counts['invalid'] += 1
+            continue
+        yield {'original_url': url, 'url_hash': url_digest(url), 'short_code': code, 'created_at': created_at,
+               'expires_at': expires_at}
+
+
+def _deferrable_indexes(conn) -> list:
+    """Non-unique indexes on shorten_url as (name, columns, WHERE clause of a partial index or None)."""
+    return [
+        (index['name'], index['column_names'], index.get('dialect_options', {}).get('sqlite_where'))
+        for index in inspect(conn).get_indexes('shorten_url')
+        if not index['unique']
+    ]
+
+
+def import_records(engine, records, chunk_size: int = IMPORT_CHUNK_SIZE,
+                   commit_every: int = IMPORT_COMMIT_EVERY, progress: Progress | None = None) -> dict:
+    """Insert records into shorten_url and return row counts."""
+    progress = progress or Progress('imported')
+    counts = {'inserted': 0, 'invalid': 0}
+    with engine.connect() as conn:
+        if not inspect(conn).has_table('shorten_url'):
+            raise RuntimeError('shorten_url does not exist; start the app or run its migrations first')
+        deferred = _deferrable_indexes(conn)
+        for name, _, _ in deferred:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+        conn.commit()
+        try:
+            in_transaction = 0
+            for rows in chunked(_rows(records, counts), chunk_size):
+                counts['inserted'] += conn.execute(INSERT_SQL, rows).rowcount
+                in_transaction += len(rows)
+                if in_transaction >= commit_every:
+                    conn.commit()
+                    in_transaction = 0
+                progress.update(len(rows))
+            conn.commit()
+        finally:
+            conn.rollback()
+            for name, columns, where in deferred:
+                cols = ', '.join(f'"{column}"' for column in columns)
+                partial = f' WHERE {where}' if where is not None else ''
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON shorten_url ({cols}){partial}'))
+            conn.commit()
+    return progress.summary(skipped=progress.rows - counts['inserted'], **counts)
+
+
+def _iso(value):
+    return datetime.fromisoformat(str(value)).isoformat() if value else None
+
+
+def export_records(engine, chunk_size: int = EXPORT_CHUNK_SIZE, progress: Progress | None = None):
+    """Lazily yield (url, code, created_at, expires_at) for every stored URL, oldest first."""
+    progress = progress or Progress('exported')
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(EXPORT_SQL)
+        for rows in result.partitions():
+            progress.update(len(rows))
+            for url, code, created_at, expires_at in rows:
+                yield url, code, _iso(created_at), _iso(expires_at)
+
+
+def _detect_format(path: str, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return 'csv'
+    if suffix in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    raise SystemExit(f'Cannot tell the format of {path!r}; pass --format csv or --format ndjson')
+
+
+def _open(path: str, mode: str, std):
+    if path == '-':
+        return nullcontext(std)
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('import', 'export'):
+        command = commands.add_parser(name)
+        command.add_argument('path', help="file to read or write, '-' for stdin/stdout")
+        command.add_argument('--app', choices=('flask', 'django', 'fastapi'), required=True)
+        command.add_argument('--database', help='SQLAlchemy URL overriding the app database')
+        command.add_argument('--format', choices=FORMATS)
+        command.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    commands.choices['import'].add_argument('--commit-every', type=int, default=IMPORT_COMMIT_EVERY)
+    args = parser.parse_args(argv)
+
+    fmt = _detect_format(args.path, args.format) if args.path != '-' else (args.format or 'ndjson')
+    url = args.database or database_url(args.app)
+    engine = configure_engine(create_engine(url, **engine_options(url)))
+    try:
+        if args.command == 'import':
+            with _open(args.path, 'r', sys.stdin) as stream:
+                summary = import_records(engine, read_records(stream, fmt), args.chunk_size, args.commit_every)
+        else:
+            progress = Progress('exported')
+            with _open(args.path, 'w', sys.stdout) as stream:
+                write_records(stream, fmt, export_records(engine, args.chunk_size, progress))
+            summary = progress.summary()
+    finally:
+        engine.dispose()
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Click analytics kept off the redirect path, shared by all framework versions.
+
+A redirect only appends (short_code, timestamp) to an in-memory ring buffer,
+which costs a deque append. A daemon thread wakes every CLICK_FLUSH_INTERVAL
+seconds, drains the buffer, aggregates the events per code and hands the
+aggregates to a framework-specific writer that upserts them into the
+shorten_url_clicks table in one executemany. Stats are therefore eventually
+consistent, lagging by at most one flush interval per worker process.
+
+If redirects outpace the flusher the buffer drops the oldest events instead of
+growing without bound; ``dropped`` counts them. With CLICK_FLUSH_INTERVAL=0
+no thread is started and events are only written by flush() (and at exit).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+CLICK_TRACKING = os.environ.get('CLICK_TRACKING', '1') != '0'
+CLICK_BUFFER_SIZE = int(os.environ.get('CLICK_BUFFER_SIZE', 100000))
+CLICK_FLUSH_INTERVAL = float(os.environ.get('CLICK_FLUSH_INTERVAL', 1.0))
+
+CLICKS_TABLE = 'shorten_url_clicks'
+UPSERT_CLICKS_SQL = (
+    f'INSERT INTO {CLICKS_TABLE} (short_code, clicks, first_clicked_at, last_clicked_at) '
+    'VALUES (:short_code, :clicks, :first_clicked_at, :last_clicked_at) '
+    'ON CONFLICT (short_code) DO UPDATE SET '
+    'clicks = clicks + excluded.clicks, '
+    'last_clicked_at = MAX(last_clicked_at, excluded.last_clicked_at)'
+)
+
+
+def _db_timestamp(ts: float) -> str:
+    # Same naive-UTC text format SQLAlchemy and Django use for DateTime on SQLite.
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def aggregate(events) -> dict:
+    """Fold (code, timestamp) events into {code: [clicks, first_ts, last_ts]}."""
+    totals = {}
+    for code, ts in events:
+        entry = totals.get(code)
+        if entry is None:
+            totals[code] = [1, ts, ts]
+        else:
+            entry[0] += 1
+            if ts < entry[1]:
+                entry[1] = ts
+            if ts > entry[2]:
+                entry[2] = ts
+    return totals
+
+
+def upsert_rows(totals: dict) -> list:
+    """Parameter dicts for UPSERT_CLICKS_SQL, one per code."""
+    return [
+        {'short_code': code, 'clicks': clicks,
+         'first_clicked_at': _db_timestamp(first), 'last_clicked_at': _db_timestamp(last)}
+        for code, (clicks, first, last) in totals.items()
+    ]
+
+
+class ClickRecorder:
+    """
+    Ring buffer of click events plus the background thread that flushes it.
+    write(rows) must upsert a list of UPSERT_CLICKS_SQL parameter dicts.
+    """
+
+    def __init__(self, write, capacity: int = 100000, interval: float = 1.0, enabled: bool = True):
+        self.write = write
+        self.capacity = capacity
+        self.interval = interval
+        self.enabled = enabled
+        self._events = deque(maxlen=capacity)
+        self._pending = {}  # aggregates a failed write still owes the database
+        self._flush_lock = threading.Lock()
+        self._started = False
+        self._thread = None
+        self._stop = threading.Event()
+        self.dropped = 0
+        self.flushed = 0
+
+    def record(self, code: str) -> None:
+        """Note one click on code. Called on the redirect path, so it must stay O(1)."""
+        if not self.enabled:
+            return
+        events = self._events
+        if len(events) == self.capacity:
+            self.dropped += 1
+        events.append((code, time.time()))
+        if not self._started:
+            self._start()
+
+    def _start(self) -> None:
+        # Started lazily so each forked worker process gets its own flusher.
+        with self._flush_lock:
+            if self._started:
+                return
+            self._started = True
+            atexit.register(self.stop)
+            if self.interval > 0:
+                self._thread = threading.Thread(target=self._run, name='click-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """Drain the buffer and write aggregated counts. Returns the number of events flushed."""
+        with self._flush_lock:
+            events = self._events
+            drained = []
+            while True:
+                try:
+                    drained.append(events.popleft())
+                except IndexError:
+                    break
+            totals = aggregate(drained)
+            for code, (clicks, first, last) in self._pending.items():
+                entry = totals.get(code)
+                if entry is None:
+                    totals[code] = [clicks, first, last]
+                else:
+                    entry[0] += clicks
+                    entry[1] = min(entry[1], first)
+                    entry[2] = max(entry[2], last)
+            if not totals:
+                return 0
+            try:
+                self.write(upsert_rows(totals))
+            except Exception:
+                # Keep the counts and retry on the next tick rather than losing them.
+                logger.exception('Failed to flush %d click aggregates', len(totals))
+                self._pending = totals
+                return 0
+            self._pending = {}
+            self.flushed += len(drained)
+            return len(drained)
+
+    def clear(self) -> None:
+        """Discard buffered and pending events without writing them."""
+        with self._flush_lock:
+            self._events.clear()
+            self._pending = {}
+
+    def stop(self) -> None:
+        """Stop the flusher thread and write whatever is still buffered."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.interval + 5)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'buffered': len(self._events),
+            'capacity': self.capacity,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+        }
+
+
+def sqlalchemy_click_writer(get_engine):
+    """ClickRecorder write callback for the SQLAlchemy apps."""
+    from sqlalchemy import text
+
+    def write(rows):
+        with get_engine().begin() as conn:
+            conn.execute(text(UPSERT_CLICKS_SQL), rows)
+    return write
+
+
+def make_click_recorder(write) -> ClickRecorder:
+    """Build a recorder configured by the CLICK_* environment variables."""
+    return ClickRecorder(write, CLICK_BUFFER_SIZE, CLICK_FLUSH_INTERVAL, CLICK_TRACKING)
+
+
+def click_stats(code: str, original_url: str, clicks: int = 0, first=None, last=None) -> dict:
+    """Response body for the per-code stats endpoints."""
+    return {
+        'short_code': code,
+        'original_url': original_url,
+        'clicks': clicks,
+        'first_clicked_at': first.isoformat() if first else None,
+        'last_clicked_at': last.isoformat() if last else None,
+    }
@@ -0,0 +1,155 @@
+"""
+Pluggable short code generators shared by all framework versions.
+
+A generator yields candidate codes for a URL, best first. The views try to
+insert each candidate in turn and let the unique constraint on short_code
+reject collisions, so no check-then-insert query is needed.
+
+Strategies (selected with SHORT_CODE_STRATEGY):
+
+- ``hash``: digest of the URL in a configurable alphabet and length. The first
+  candidate with the default hex alphabet and length 8 matches the historical
+  MD5-based codes, so the same URL always maps to the same code.
+- ``base62``: base62 encoding of a monotonic ID, reserved one at a time.
+- ``block``: like ``base62``, but IDs are reserved in blocks so most codes need
+  no database round trip.
+"""
+import hashlib
+import math
+import os
+import threading
+
+HEX_ALPHABET = '0123456789abcdef'
+BASE62_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+MAX_ATTEMPTS = 10
+
+
+class CodeAllocationError(RuntimeError):
+    """Raised when every candidate code for a URL collided."""
+
+
+def encode(n: int, alphabet: str = BASE62_ALPHABET) -> str:
+    """Encode a non-negative integer in the given alphabet (most significant digit first)."""
+    if n < 0:
+        raise ValueError('n must be non-negative')
+    base = len(alphabet)
+    digits = []
+    while True:
+        n, rem = divmod(n, base)
+        digits.append(alphabet[rem])
+        if not n:
+            break
+    return ''.join(reversed(digits))
+
+
+def collision_probability(n: int, alphabet_size: int, length: int) -> float:
+    """Birthday-bound probability that n random codes contain at least one collision."""
+    space = alphabet_size ** length
+    return -math.expm1(-n * (n - 1) / (2 * space))
+
+
+class CodeGenerator:
+    """Base class: yields up to MAX_ATTEMPTS candidate codes for a URL."""
+
+    def candidates(self, url: str):
+        raise NotImplementedError
+
+
+class HashCodeGenerator(CodeGenerator):
+    """Codes derived from the MD5 of the URL; retries salt the URL with the attempt number."""
+
+    def __init__(self, length: int = 8, alphabet: str = HEX_ALPHABET):
+        if len(set(alphabet)) != len(alphabet) or len(alphabet) < 2:
+            raise ValueError('alphabet must contain at least two distinct characters')
+        if not 1 <= length or len(alphabet) ** length > 2 ** 128:
+            raise ValueError('length must be positive and fit in a 128-bit digest')
+        self.length = length
+        self.alphabet = alphabet
+        self._space = len(alphabet) ** length
+
+    def code_for(self, data: str) -> str:
+        if self.alphabet == HEX_ALPHABET:
+            return hashlib.md5(data.encode()).hexdigest()[:self.length]
+        n = int.from_bytes(hashlib.md5(data.encode()).digest(), 'big')
+        # Scale the digest into [0, space) using its high bits, so every position is
+        # uniform; for hex this is exactly the leading characters of the hexdigest.
+        value = (n * self._space) >> 128
+        return encode(value, self.alphabet).rjust(self.length, self.alphabet[0])
+
+    def candidates(self, url: str):
+        yield self.code_for(url)
+        for attempt in range(1, MAX_ATTEMPTS):
+            yield self.code_for(f'{url}#{attempt}')
+
+
+class Base62CodeGenerator(CodeGenerator):
+    """Base62 encoding of IDs from next_id(); collisions just move on to the next ID."""
+
+    def __init__(self, next_id, alphabet: str = BASE62_ALPHABET):
+        self.next_id = next_id
+        self.alphabet = alphabet
+
+    def candidates(self, url: str):
+        for _ in range(MAX_ATTEMPTS):
+            yield encode(self.next_id(), self.alphabet)
+
+
+class BlockCodeGenerator(Base62CodeGenerator):
+    """
+    Base62 codes from IDs handed out of preallocated blocks.
+    reserve_block(size) must atomically reserve size IDs and return the first one.
+    """
+
+    def __init__(self, reserve_block, block_size: int = 1000, alphabet: str = BASE62_ALPHABET):
+        super().__init__(self._next_from_block, alphabet)
+        self.reserve_block = reserve_block
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def _next_from_block(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self.reserve_block(self.block_size)
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+
+# One-row counter table; RETURNING needs SQLite 3.35+.
+SEQUENCE_TABLE_SQL = (
+    'CREATE TABLE IF NOT EXISTS short_code_sequence '
+    '(id INTEGER PRIMARY KEY CHECK (id = 1), next_id INTEGER NOT NULL)'
+)
+RESERVE_BLOCK_SQL = (
+    'INSERT INTO short_code_sequence (id, next_id) VALUES (1, 1 + :size) '
+    'ON CONFLICT (id) DO UPDATE SET next_id = next_id + :size '
+    'RETURNING next_id - :size'
+)
+
+
+def sqlalchemy_block_reserver(get_engine):
+    """reserve_block implementation for the SQLAlchemy apps, safe across worker processes."""
+    from sqlalchemy import text
+
+    def reserve_block(size: int) -> int:
+        with get_engine().begin() as conn:
+            conn.execute(text(SEQUENCE_TABLE_SQL))
+            return conn.execute(text(RESERVE_BLOCK_SQL), {'size': size}).scalar_one()
+    return reserve_block
+
+
+def make_code_generator(reserve_block) -> CodeGenerator:
+    """Build the generator selected by the SHORT_CODE_* environment variables."""
+    strategy = os.environ.get('SHORT_CODE_STRATEGY', 'hash')
+    if strategy == 'hash':
+        return HashCodeGenerator(
+            length=int(os.environ.get('SHORT_CODE_LENGTH', 8)),
+            alphabet=os.environ.get('SHORT_CODE_ALPHABET', HEX_ALPHABET),
+        )
+    if strategy == 'base62':
+        return Base62CodeGenerator(lambda: reserve_block(1))
+    if strategy == 'block':
+        return BlockCodeGenerator(reserve_block, int(os.environ.get('SHORT_CODE_BLOCK_SIZE', 1000)))
+    raise ValueError(f'Unknown SHORT_CODE_STRATEGY: {strategy!r}')
@@ -0,0 +1,232 @@
+"""
+Response compression for the URL listings, and pre-compressed snapshots of
+their first pages.
+
+/api/urls and the home page pick their encoding from Accept-Encoding: br when
+the brotli package is installed (``pip install brotli``) and the client
+prefers it, else gzip, else none. Whole bodies under COMPRESSION_MIN_SIZE
+bytes go out as they are; streamed ones (?stream=, home pages past the first)
+are compressed chunk by chunk as they are sent. COMPRESSION=0 turns it all
+off. The listing ETags are weak, so one tag covers every encoding.
+
+Nearly all listing traffic asks for the same first page. ListSnapshots keeps
+the encoded first page of /api/urls per limit (and the home page per base
+URL) together with the store version it was built at (Store.version, see
+common.http_cache). While the version holds, requests are answered from the
+snapshot without a query, and each encoding is compressed once, for the first
+client that asks for it. The version only moves when shorten_url changes, so
+the next request after a new link rebuilds the snapshot; requests arriving
+during the rebuild share it (common.singleflight). Stores without a version
+are never snapshotted. LIST_SNAPSHOTS=0 turns snapshots off.
+"""
+import gzip
+import os
+import threading
+import zlib
+
+from common.cache import LRUCache
+from common.singleflight import AsyncSingleFlight, SingleFlight
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSION = os.environ.get('COMPRESSION', '1') != '0'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+LIST_SNAPSHOTS = os.environ.get('LIST_SNAPSHOTS', '1') != '0'
+LIST_SNAPSHOT_SLOTS = 32
+
+# In order of preference when a client accepts several equally.
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+VARY = {'Vary': 'Accept-Encoding'}
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """The encoding to answer an Accept-Encoding header with, or None for the body as it is."""
+    if not COMPRESSION or not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output the same for the same body.
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+class _Compressor:
+    """Incremental compressor with the zlib interface, for either encoding."""
+
+    def __init__(self, encoding: str):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress, self.flush = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self.flush = compressor.compress, compressor.flush
+
+
+def _as_bytes(chunk) -> bytes:
+    return chunk.encode() if isinstance(chunk, str) else chunk
+
+
+def compress_stream(chunks, encoding: str):
+    """Yield chunks (str or bytes) compressed as one body."""
+    compressor = _Compressor(encoding)
+    for chunk in chunks:
+        out = compressor.compress(_as_bytes(chunk))
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+async def acompress_stream(chunks, encoding: str):
+    """compress_stream for an async iterable of chunks."""
+    compressor = _Compressor(encoding)
+    async for chunk in chunks:
+        out = compressor.compress(_as_bytes(chunk))
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _headers(headers: dict, encoding: str | None) -> dict:
+    if not COMPRESSION:
+        return headers
+    if encoding is None:
+        return {**headers, **VARY}
+    return {**headers, 'Content-Encoding': encoding, **VARY}
+
+
+def encode_body(body: bytes, headers: dict, accept_encoding: str | None):
+    """(body, headers) compressed for accept_encoding when it is worth it, with Content-Encoding and Vary."""
+    encoding = negotiate(accept_encoding)
+    if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+        return body, _headers(headers, None)
+    return compress(body, encoding), _headers(headers, encoding)
+
+
+def encode_stream(chunks, accept_encoding: str | None):
+    """(chunks, headers) for a streamed body: compressed chunks when accept_encoding allows."""
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return chunks, _headers({}, None)
+    return compress_stream(chunks, encoding), _headers({}, encoding)
+
+
+def aencode_stream(chunks, accept_encoding: str | None):
+    """encode_stream for an async iterable of chunks."""
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return chunks, _headers({}, None)
+    return acompress_stream(chunks, encoding), _headers({}, encoding)
+
+
+class Snapshot:
+    """An encoded listing body and its headers at one store version, with its compressed copies."""
+
+    def __init__(self, version, body: bytes, headers: dict):
+        self.version = version
+        self.body = body
+        self.headers = headers
+        self.encoded = {}
+
+
+class ListSnapshots:
+    """The latest encoded first pages of the listings, keyed by page, rebuilt when the store version moves."""
+
+    def __init__(self, slots: int = LIST_SNAPSHOT_SLOTS, enabled: bool = True):
+        self.enabled = enabled
+        self._snapshots = LRUCache(maxsize=slots)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+        self.hits = 0
+        self.builds = 0
+        self.compressions = 0
+
+    def _current(self, key, version):
+        snapshot = self._snapshots.get(key, None)
+        if snapshot is None or snapshot.version != version:
+            return None
+        self.hits += 1
+        return snapshot
+
+    def _keep(self, key, version, page) -> Snapshot:
+        snapshot = Snapshot(version, *page)
+        self.builds += 1
+        self._snapshots.set(key, snapshot)
+        return snapshot
+
+    def get(self, key, version, build) -> Snapshot:
+        """
+        The snapshot of key at Store.version() version, from build() ->
+        (body, headers) when there is none yet.
+        """
+        if not self.enabled or version is None:
+            return Snapshot(version, *build())
+        snapshot = self._current(key, version)
+        if snapshot is None:
+            snapshot, _ = self._flight.do((key, version), lambda: self._keep(key, version, build()))
+        return snapshot
+
+    async def aget(self, key, version, build) -> Snapshot:
+        """get() for an async build."""
+        if not self.enabled or version is None:
+            return Snapshot(version, *await build())
+        snapshot = self._current(key, version)
+        if snapshot is None:
+            async def rebuild():
+                return self._keep(key, version, await build())
+
+            snapshot, _ = await self._async_flight.do((key, version), rebuild)
+        return snapshot
+
+    def encode(self, snapshot: Snapshot, accept_encoding: str | None):
+        """(body, headers) of snapshot for accept_encoding, compressing it at most once per encoding."""
+        encoding = negotiate(accept_encoding)
+        if encoding is None or len(snapshot.body) < COMPRESSION_MIN_SIZE:
+            return snapshot.body, _headers(snapshot.headers, None)
+        body = snapshot.encoded.get(encoding)
+        if body is None:
+            with self._lock:
+                body = snapshot.encoded.get(encoding)
+                if body is None:
+                    body = snapshot.encoded[encoding] = compress(snapshot.body, encoding)
+                    self.compressions += 1
+        return body, _headers(snapshot.headers, encoding)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'snapshots': len(self._snapshots),
+            'hits': self.hits,
+            'builds': self.builds,
+            'compressions': self.compressions,
+        }
+
+
+def make_list_snapshots() -> ListSnapshots:
+    """ListSnapshots, enabled unless LIST_SNAPSHOTS=0."""
+    return ListSnapshots(LIST_SNAPSHOT_SLOTS, LIST_SNAPSHOTS)
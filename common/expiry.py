@@ -0,0 +1,181 @@
+"""
+Expiring links: the expires_in field of /api/shorten and the sweeper that
+deletes links once they are past their expires_at.
+
+Links without an expiry behave exactly as before. For the others, expiry is
+enforced where a link is read rather than by deleting it on time:
+
+- the redirect lookup fetches expires_at in the same query as the URL and
+  treats an expired link as missing (Store.get_target);
+- a cached redirect for an expiring link gets a TTL that ends with the link
+  (common.cache.cache_redirect). Such entries stay out of the shared
+  cross-process cache, which has no TTLs;
+- shortening a URL whose link expired but is not swept yet revives that link
+  with the new expiry instead of failing on the unique url_hash.
+
+Expired rows are deleted by an ExpirySweeper, a daemon thread per worker
+process started with the rest of the boot steps (common.startup). Every
+LINK_SWEEP_INTERVAL seconds it deletes them LINK_SWEEP_BATCH_SIZE at a time,
+oldest expiry first. Each batch is one short transaction that finds its rows
+through a partial index holding only the expiring rows, and the sweeper
+pauses between batches so request writers get the SQLite write lock in
+between. Deleted codes are evicted from the worker's redirect cache and their
+click counts are deleted with them. Listings and the home page still show an
+expired link until it is swept.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+LINK_SWEEP_INTERVAL = float(os.environ.get('LINK_SWEEP_INTERVAL', 60))
+LINK_SWEEP_BATCH_SIZE = int(os.environ.get('LINK_SWEEP_BATCH_SIZE', 500))
+LINK_SWEEP_PAUSE = 0.01
+MAX_EXPIRES_IN = 10 * 365 * 24 * 3600
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def naive_utc(value: datetime | None) -> datetime | None:
+    """value as a naive UTC datetime, the form SQLAlchemy reads back from SQLite."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_expires_in(value) -> datetime | None:
+    """
+    The expires_at for an expires_in request field (whole seconds from now),
+    or None when it is absent. Raises ValueError for anything else.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 < value <= MAX_EXPIRES_IN:
+        raise ValueError(f'expires_in must be a whole number of seconds between 1 and {MAX_EXPIRES_IN}')
+    return utcnow() + timedelta(seconds=value)
+
+
+def _seconds_left(expires_at: datetime, now: datetime | None) -> float:
+    now = now or utcnow()
+    if expires_at.tzinfo is None:
+        now = naive_utc(now)
+    return (expires_at - now).total_seconds()
+
+
+def expired(expires_at: datetime | None, now: datetime | None = None) -> bool:
+    """True once expires_at (naive UTC or aware) has passed; never for None."""
+    return expires_at is not None and _seconds_left(expires_at, now) <= 0
+
+
+def link_ttl(expires_at: datetime, ttl: float | None = None) -> float:
+    """Seconds a cache entry for a link expiring at expires_at may live, capped at ttl."""
+    left = _seconds_left(expires_at, None)
+    return left if ttl is None else min(left, ttl)
+
+
+def live_target(row):
+    """(original_url, expires_at) from a looked-up row, or None if it is missing or expired."""
+    if row is None or expired(row[1]):
+        return None
+    return row[0], row[1]
+
+
+class ExpirySweeper:
+    """
+    Background deletion of expired links in small batches.
+    delete_expired(limit) must delete up to limit expired links in one
+    transaction and return their short codes; evict(code) drops one from the
+    redirect cache.
+    """
+
+    def __init__(self, delete_expired, evict, batch_size: int = 500, interval: float = 60.0,
+                 pause: float = LINK_SWEEP_PAUSE, enabled: bool = True):
+        self.delete_expired = delete_expired
+        self.evict = evict
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.swept = 0
+        self.batches = 0
+        self.last_sweep_seconds = None
+
+    def start(self) -> None:
+        """Start the sweeper thread once per process (a no-op when disabled)."""
+        if not self.enabled or self.interval <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            atexit.register(self.stop)
+            self._thread = threading.Thread(target=self._run, name='link-sweeper', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Delete every link expired by now, batch by batch. Returns how many were deleted."""
+        started = time.perf_counter()
+        deleted = 0
+        with self._lock:
+            while True:
+                try:
+                    codes = self.delete_expired(self.batch_size)
+                except Exception:
+                    logger.exception('Sweeping expired links failed')
+                    break
+                for code in codes:
+                    self.evict(code)
+                deleted += len(codes)
+                self.batches += 1
+                # A short batch means nothing expired is left; otherwise let other writers in first.
+                if len(codes) < self.batch_size or self._stop.wait(self.pause):
+                    break
+        self.swept += deleted
+        self.last_sweep_seconds = time.perf_counter() - started
+        if deleted:
+            logger.info('Deleted %d expired links in %.3fs', deleted, self.last_sweep_seconds)
+        return deleted
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(5)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'swept': self.swept,
+            'batches': self.batches,
+            'last_sweep_seconds': self.last_sweep_seconds,
+        }
+
+
+def sqlalchemy_expiry_deleter(get_engine, model):
+    """delete_expired(limit) running in a short-lived session of the SQLAlchemy apps."""
+    from sqlalchemy.orm import Session
+
+    from common.sql_store import SQLAlchemyStore
+
+    def delete_expired(limit):
+        with Session(get_engine()) as session:
+            return SQLAlchemyStore(session, model).delete_expired(limit)
+    return delete_expired
+
+
+def make_expiry_sweeper(delete_expired, evict) -> ExpirySweeper:
+    """Build a sweeper configured by the LINK_SWEEP_* environment variables."""
+    return ExpirySweeper(delete_expired, evict, LINK_SWEEP_BATCH_SIZE, LINK_SWEEP_INTERVAL,
+                         enabled=LINK_SWEEP_INTERVAL > 0)
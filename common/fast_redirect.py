@@ -0,0 +1,140 @@
+"""
+Redirect fast path that answers cached short codes before the framework does.
+
+A GET for /<code> whose URL is already in the redirect cache gets its
+redirect (a bare 302, or the status and Cache-Control set up in
+common.http_cache) straight from a wrapper around the app:
+
+- FastAPI: ``FastRedirectASGI``, the outermost ASGI middleware, runs before
+  routing, dependency injection and the database session;
+- Flask: ``FastRedirectWSGI`` around ``app.wsgi_app``, ahead of request
+  context setup, URL matching and the before/after hooks;
+- Django: ``shortener.middleware.FastRedirectMiddleware``, the first
+  middleware, ahead of URL resolution, the other middleware and the view.
+
+The Location header is pre-encoded per target URL and memoized, so a hit is
+one cache lookup plus one write of fixed headers. Clicks are still recorded
+and, when metrics are enabled, the request is timed under the same route
+label the app would use. Anything else falls through unchanged: cache misses
+(the app fills the cache), known-missing codes (the app answers 404), other
+methods, and reserved paths. A miss is counted in the cache stats both here
+and by the app's own lookup.
+
+Disabled with FAST_REDIRECTS=0.
+"""
+import os
+from functools import lru_cache
+from time import perf_counter
+from urllib.parse import quote
+
+from common import http_cache, metrics, startup
+from common.cache import REDIRECT_CACHE_SIZE
+
+FAST_REDIRECTS = os.environ.get('FAST_REDIRECTS', '1') != '0'
+# First path segments routed to something other than a redirect.
+RESERVED_PATHS = frozenset({'', 'api', 'metrics'})
+# Characters left as-is in Location, as Starlette's RedirectResponse does.
+LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;~"
+
+_enabled = FAST_REDIRECTS
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(flag: bool) -> None:
+    global _enabled
+    _enabled = flag
+
+
+@lru_cache(maxsize=REDIRECT_CACHE_SIZE)
+def location(url: str) -> str:
+    """The Location header value for url (non-ASCII characters percent-encoded)."""
+    return quote(url, safe=LOCATION_SAFE)
+
+
+def asgi_start(url: str) -> dict:
+    """The http.response.start message for a redirect to url."""
+    return _asgi_start(url, http_cache.redirect_status(url), http_cache.redirect_cache_control(url))
+
+
+@lru_cache(maxsize=REDIRECT_CACHE_SIZE)
+def _asgi_start(url: str, status: int, cache_control: str | None) -> dict:
+    headers = [(b'location', location(url).encode('ascii')), (b'content-length', b'0')]
+    if cache_control:
+        headers.append((b'cache-control', cache_control.encode('latin-1')))
+    return {'type': 'http.response.start', 'status': status, 'headers': headers}
+
+
+def wsgi_start(url: str):
+    """(status line, headers) of a redirect to url, for start_response."""
+    status = http_cache.redirect_status(url)
+    headers = [('Location', location(url)), ('Content-Length', '0'), *http_cache.redirect_headers(url).items()]
+    return f'{status} {http_cache.REDIRECT_REASONS[status]}', headers
+
+
+ASGI_BODY = {'type': 'http.response.body', 'body': b''}
+
+
+def cached_target(cache, path: str):
+    """(code, url) if path is /<code> and code's URL is cached, else (None, None)."""
+    code = path[1:]
+    if '/' in code or code in RESERVED_PATHS:
+        return None, None
+    url = cache.get(code, None)
+    if url is None:
+        return None, None
+    return code, url
+
+
+def _served(recorder, code, framework, route, method, started, status):
+    recorder.record(code)
+    startup.mark_redirect()
+    if started is not None:
+        metrics.observe_request(framework, method, route, status, perf_counter() - started)
+
+
+class FastRedirectASGI:
+    """ASGI middleware serving cached redirects before the wrapped app sees them."""
+
+    def __init__(self, app, cache, recorder, framework: str = 'fastapi', route: str = '/{code}'):
+        self.app = app
+        self.cache = cache
+        self.recorder = recorder
+        self.framework = framework
+        self.route = route
+
+    async def __call__(self, scope, receive, send):
+        if _enabled and scope['type'] == 'http' and scope['method'] == 'GET':
+            started = perf_counter() if metrics.enabled() else None
+            code, url = cached_target(self.cache, scope['path'])
+            if url is not None:
+                start = asgi_start(url)
+                await send(start)
+                await send(ASGI_BODY)
+                _served(self.recorder, code, self.framework, self.route, 'GET', started, start['status'])
+                return
+        await self.app(scope, receive, send)
+
+
+class FastRedirectWSGI:
+    """WSGI middleware serving cached redirects before the wrapped app sees them."""
+
+    def __init__(self, app, cache, recorder, framework: str = 'flask', route: str = '/<code>'):
+        self.app = app
+        self.cache = cache
+        self.recorder = recorder
+        self.framework = framework
+        self.route = route
+
+    def __call__(self, environ, start_response):
+        if _enabled and environ['REQUEST_METHOD'] == 'GET':
+            started = perf_counter() if metrics.enabled() else None
+            code, url = cached_target(self.cache, environ.get('PATH_INFO', ''))
+            if url is not None:
+                status, headers = wsgi_start(url)
+                start_response(status, headers)
+                _served(self.recorder, code, self.framework, self.route, 'GET', started, int(status[:3]))
+                return [b'']
+        return self.app(environ, start_response)
@@ -0,0 +1,270 @@
+"""
+Optional group commit for single-URL shorten requests (write-behind batching).
+
+Normally each created URL is its own transaction, so on SQLite every request
+pays for a commit and writers queue on the database lock one at a time. With
+GROUP_COMMIT=1, Store.insert hands the row to a GroupCommitter instead. A
+single writer thread collects rows from all request threads until it has
+GROUP_COMMIT_MAX_BATCH of them or GROUP_COMMIT_MAX_DELAY_MS has passed since
+the first one. It then inserts them in one transaction (INSERT ... ON CONFLICT
+DO NOTHING) and wakes each caller with its own result. Callers still get
+their record only after the batch has committed. A caller waits at most
+GROUP_COMMIT_TIMEOUT_MS for the writer to pick its row up; if it has not by
+then, or the writer thread has died, the row is written directly on the
+caller's thread instead. A row the writer has taken is waited for until its
+batch commits or fails, since it may be committed either way.
+
+A row whose code or URL was taken, by an earlier row of the same batch or by
+anything already stored, comes back as DuplicateError. shorten() then handles
+it as it always has. The trade-off is up to GROUP_COMMIT_MAX_DELAY_MS of extra
+latency on a lone request, in exchange for far fewer commits under
+concurrency. Only the single-URL insert is grouped; batch inserts are already
+one transaction. The standalone memory/log stores and the async FastAPI app
+always write directly.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as ResultTimeout
+from datetime import datetime, timezone
+
+from common.batch import chunked
+from common.expiry import naive_utc
+from common.store import DB_DATETIME_FORMAT, INSERT_URLS_SQL, DuplicateError, Store, UrlRecord
+from common.utils import url_digest
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '0') == '1'
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 256))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get('GROUP_COMMIT_MAX_DELAY_MS', 2))
+GROUP_COMMIT_TIMEOUT_MS = float(os.environ.get('GROUP_COMMIT_TIMEOUT_MS', 5000))
+
+_STOP = object()
+
+
+def claimed(rows, inserted, stored: dict) -> list:
+    """
+    Per row, the stored record it created, or None if its code or URL was taken.
+    inserted holds each row's INSERT ... ON CONFLICT DO NOTHING rowcount (0 when
+    it conflicted, even with an identical row stored before the batch); stored
+    maps url_hash to the record now in the database.
+    """
+    return [stored.get(row['url_hash']) if count == 1 else None for row, count in zip(rows, inserted)]
+
+
+class GroupCommitter:
+    """
+    Queue of pending URL inserts plus the single thread that commits them in groups.
+    write(rows) must insert a list of INSERT_URLS_SQL parameter dicts in one
+    transaction and return claimed(rows, ...) for them. Callers fall back to
+    write([row]) themselves after waiting timeout seconds for the writer.
+    """
+
+    def __init__(self, write, max_batch: int = 256, max_delay: float = 0.002, enabled: bool = True,
+                 timeout: float = 5.0):
+        self.write = write
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.enabled = enabled
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.direct_writes = 0
+
+    def insert(self, url: str, code: str, expires_at=None):
+        """Queue url under code and return its record once committed. Raises DuplicateError."""
+        row = {
+            'original_url': url,
+            'url_hash': url_digest(url),
+            'short_code': code,
+            'created_at': datetime.now(timezone.utc).strftime(DB_DATETIME_FORMAT),
+            'expires_at': naive_utc(expires_at).strftime(DB_DATETIME_FORMAT) if expires_at else None,
+        }
+        if self._thread is None:
+            self._start()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            future = Future()
+            self._queue.put((row, future))
+            try:
+                record = future.result(self.timeout)
+            except ResultTimeout:
+                if not future.cancel():
+                    # The writer owns it now and always resolves it once the batch commits or fails.
+                    record = future.result()
+                else:
+                    logger.warning('Group commit writer did not take %s within %.1fs; writing it directly',
+                                   code, self.timeout)
+                    record = self._write_directly(row)
+        else:
+            logger.warning('Group commit writer is not running; writing %s directly', code)
+            record = self._write_directly(row)
+        if record is None:
+            raise DuplicateError(code)
+        return record
+
+    def _write_directly(self, row):
+        self.direct_writes += 1
+        return self.write([row])[0]
+
+    def _start(self) -> None:
+        # Started lazily so each forked worker process gets its own writer.
+        with self._lock:
+            if self._thread is not None:
+                return
+            atexit.register(self.stop)
+            thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+            thread.start()
+            # Published only once running, so insert() never mistakes it for a dead writer.
+            self._thread = thread
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            stopping = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch) -> None:
+        # Skip rows whose callers gave up waiting and wrote them directly.
+        batch = [(row, future) for row, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.write([row for row, _ in batch])
+        except Exception as exc:
+            logger.exception('Group commit of %d URLs failed', len(batch))
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        for (_, future), record in zip(batch, results):
+            future.set_result(record)
+        self.batches += 1
+        self.rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stop(self) -> None:
+        """Commit whatever is queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            self._queue.put(_STOP)
+            thread.join(5)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'batches': self.batches,
+            'rows': self.rows,
+            'largest_batch': self.largest_batch,
+            'direct_writes': self.direct_writes,
+            'mean_batch': self.rows / self.batches if self.batches else 0.0,
+        }
+
+
+class GroupCommitStore(Store):
+    """A store whose single inserts go through a GroupCommitter; everything else is delegated."""
+
+    def __init__(self, store: Store, committer: GroupCommitter):
+        self.store = store
+        self.committer = committer
+
+    def get_by_code(self, code):
+        return self.store.get_by_code(code)
+
+    def get_target(self, code):
+        return self.store.get_target(code)
+
+    def get_by_url(self, url):
+        return self.store.get_by_url(url)
+
+    def get_by_hashes(self, digests):
+        return self.store.get_by_hashes(digests)
+
+    def taken_codes(self, codes):
+        return self.store.taken_codes(codes)
+
+    def insert(self, url, code, expires_at=None):
+        # Waiting for the batch while holding a pooled connection could starve the writer.
+        self.store.release()
+        return self.committer.insert(url, code, expires_at)
+
+    def renew(self, record, expires_at=None):
+        return self.store.renew(record, expires_at)
+
+    def delete_expired(self, limit, now=None):
+        return self.store.delete_expired(limit, now)
+
+    def insert_many(self, rows):
+        return self.store.insert_many(rows)
+
+    def codes_after(self, after_id):
+        return self.store.codes_after(after_id)
+
+    def iter_recent(self, cursor=None, limit=None):
+        return self.store.iter_recent(cursor, limit)
+
+    def iter_recent_rows(self, cursor=None, limit=None):
+        return self.store.iter_recent_rows(cursor, limit)
+
+    def version(self):
+        return self.store.version()
+
+
+def with_group_commit(store: Store, committer: GroupCommitter) -> Store:
+    """store wrapped for group commit when the committer is enabled, else store itself."""
+    return GroupCommitStore(store, committer) if committer.enabled else store
+
+
+def sqlalchemy_url_writer(get_engine, model):
+    """GroupCommitter write callback for the SQLAlchemy apps."""
+    from sqlalchemy import select, text
+
+    table = model.__table__
+    columns = (
+        table.c.id, table.c.original_url, table.c.url_hash, table.c.short_code, table.c.created_at, table.c.expires_at,
+    )
+
+    insert = text(INSERT_URLS_SQL)
+
+    def write(rows):
+        stored = {}
+        with get_engine().begin() as conn:
+            inserted = [conn.execute(insert, row).rowcount for row in rows]
+            for digests in chunked([row['url_hash'] for row in rows]):
+                for found in conn.execute(select(*columns).where(table.c.url_hash.in_(digests))):
+                    stored[found.url_hash] = UrlRecord(*found)
+        return claimed(rows, inserted, stored)
+    return write
+
+
+def make_group_committer(write) -> GroupCommitter:
+    """Build a committer configured by the GROUP_COMMIT_* environment variables."""
+    return GroupCommitter(
+        write, GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_MAX_DELAY_MS / 1000, GROUP_COMMIT, GROUP_COMMIT_TIMEOUT_MS / 1000,
+    )
@@ -0,0 +1,73 @@
+"""
+HTML home page shared by all framework versions.
+
+The page shows the API documentation followed by one bounded window of the
+most recent shortened URLs. The static part only depends on the framework and
+the base URL, so it is rendered once per base URL and reused; rows are emitted
+one at a time so the page can be streamed.
+"""
+from functools import lru_cache
+from html import escape
+
+HOME_PAGE_SIZE = 20
+_EMPTY_ROW = '<tr><td colspan="3">No shortened URLs yet.</td></tr>'
+
+
+@lru_cache(maxsize=64)
+def page_header(framework: str, stack: str, base: str) -> str:
+    """Everything up to and including the header row of the URL table."""
+    return f'''<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>URL Shortener - {framework}</title>
+<style>body{{font-family:system-ui,sans-serif;max-width:800px;margin:2rem auto;padding:0 1rem}}h1{{color:#333}}code{{background:#f4f4f4;padding:2px 6px;border-radius:4px}}table{{width:100%;border-collapse:collapse}}th,td{{padding:8px;text-align:left;border-bottom:1px solid #ddd}}th{{background:#f8f8f8}}</style>
+</head>
+<body>
+<h1>🔗 URL Shortener API</h1>
+<p><strong>Framework:</strong> {framework}</p>
+<p>Shorten long URLs and redirect using compact short codes. Built with {stack}, and SQLite.</p>
+
+<h2>Available API Endpoints</h2>
+<table>
+<tr><th>Method</th><th>Endpoint</th><th>Description</th></tr>
+<tr><td><code>GET</code></td><td><a href="{base}/api/urls">{base}/api/urls</a></td><td>Get all shortened URLs (JSON)</td></tr>
+<tr><td><code>POST</code></td><td><a href="{base}/api/shorten">{base}/api/shorten</a></td><td>Shorten a URL (body: {{ "url": "https://example.com" }})</td></tr>
+<tr><td><code>GET</code></td><td><code>{base}/&#123;short_code&#125;</code></td><td>Redirect to original URL</td></tr>
+</table>
+
+<h2>Shortened URLs</h2>
+<table><tr><th>Short Code</th><th>Original URL</th><th>Short Link</th></tr>'''
+
+
+def render_row(base: str, code: str, original_url: str) -> str:
+    label = original_url[:60] + ('...' if len(original_url) > 60 else '')
+    return (
+        f'<tr><td>{escape(code)}</td>'
+        f'<td><a href="{escape(original_url)}" target="_blank">{escape(label)}</a></td>'
+        f'<td><a href="{base}/{escape(code)}">{base}/{escape(code)}</a></td></tr>'
+    )
+
+
+def render_nav(is_first_page: bool, next_cursor: str | None) -> str:
+    links = []
+    if not is_first_page:
+        links.append('<a href="/">&laquo; Newest</a>')
+    if next_cursor:
+        links.append(f'<a href="/?cursor={next_cursor}">Older &raquo;</a>')
+    return f'<p>{" | ".join(links)}</p>' if links else ''
+
+
+def iter_home_page(framework: str, stack: str, base: str, urls, next_cursor=None, is_first_page=True):
+    """
+    Yield the home page in chunks.
+    urls is an iterable of objects with short_code and original_url attributes.
+    """
+    yield page_header(framework, stack, base)
+    empty = True
+    for u in urls:
+        empty = False
+        yield render_row(base, u.short_code, u.original_url)
+    if empty:
+        yield _EMPTY_ROW
+    yield '</table>'
+    yield render_nav(is_first_page, next_cursor)
+    yield '\n</body>\n</html>'
@@ -0,0 +1,172 @@
+"""
+HTTP caching semantics for redirects and the URL listings.
+
+Redirects carry REDIRECT_CACHE_CONTROL as their Cache-Control header when it
+is set (e.g. ``public, max-age=86400``), so browsers and a CDN in front of
+the app can answer repeat visits themselves. REDIRECT_PERMANENT_STATUS=301 or
+308 answers links that never expire with that permanent status instead of
+302. Links with an expiry always get a 302, and any max-age they are sent
+is capped at the seconds they have left. Both apply on the fast path
+(common.fast_redirect) and in the views. Clients that reuse a cached
+redirect never reach the app, so their clicks are not counted.
+
+/api/urls and the home page send a weak ETag and a Last-Modified taken from
+the store's version (Store.version): a counter bumped by every insert,
+renewal and deletion of a link. In the SQL databases it is the single row of
+shorten_url_version, bumped by triggers on shorten_url, so every writer
+(any worker, group commit, bulk import, the sweeper) moves it without knowing
+about it. The row also holds a random epoch chosen when the table is created,
+so a recreated database never hands out an old tag for different content.
+Last-Modified has whole seconds only: it is rounded up, and only sent once that
+second is over, so a later write can never share it. A GET whose If-None-Match (or, without one, If-Modified-Since)
+still matches is answered 304 after that one-row read, before the listing
+query runs. LIST_CACHE_CONTROL (``no-cache`` by default) makes caches
+revalidate a listing on every use.
+"""
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from common.expiry import link_ttl, utcnow
+
+REDIRECT_CACHE_CONTROL = os.environ.get('REDIRECT_CACHE_CONTROL', '')
+LIST_CACHE_CONTROL = os.environ.get('LIST_CACHE_CONTROL', 'no-cache')
+
+PERMANENT_STATUSES = (301, 308)
+REDIRECT_REASONS = {301: 'Moved Permanently', 302: 'Found', 308: 'Permanent Redirect'}
+MAX_AGE = re.compile(r'\b(max-age|s-maxage)=(\d+)')
+
+
+def _permanent_status(value: str) -> int | None:
+    if not value:
+        return None
+    if not value.isdigit() or int(value) not in PERMANENT_STATUSES:
+        raise ValueError(f'REDIRECT_PERMANENT_STATUS must be 301 or 308, not {value!r}')
+    return int(value)
+
+
+REDIRECT_PERMANENT_STATUS = _permanent_status(os.environ.get('REDIRECT_PERMANENT_STATUS', ''))
+
+# The table version behind the listing validators, kept by SQLite triggers.
+CREATE_URL_VERSION_SQL = (
+    'CREATE TABLE IF NOT EXISTS shorten_url_version '
+    '(id INTEGER PRIMARY KEY CHECK (id = 1), epoch TEXT NOT NULL, version INTEGER NOT NULL, modified_at DATETIME)',
+    'INSERT OR IGNORE INTO shorten_url_version (id, epoch, version) VALUES (1, lower(hex(randomblob(4))), 0)',
+    *(
+        f'CREATE TRIGGER IF NOT EXISTS shorten_url_version_{event.lower()} AFTER {event} ON shorten_url BEGIN '
+        "UPDATE shorten_url_version SET version = version + 1, modified_at = strftime('%Y-%m-%d %H:%M:%f', 'now'); "
+        'END'
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ),
+)
+DROP_URL_VERSION_SQL = (
+    *(f'DROP TRIGGER IF EXISTS shorten_url_version_{event}' for event in ('insert', 'update', 'delete')),
+    'DROP TABLE IF EXISTS shorten_url_version',
+)
+URL_VERSION_SQL = 'SELECT epoch, version, modified_at FROM shorten_url_version'
+
+
+def url_version(row):
+    """Store.version() from a URL_VERSION_SQL row (None when the table is empty)."""
+    if row is None:
+        return None
+    epoch, version, modified_at = row
+    if isinstance(modified_at, str):
+        modified_at = datetime.fromisoformat(modified_at)
+    return f'{epoch}.{version}', modified_at
+
+
+def sqlalchemy_url_version(metadata) -> None:
+    """Have metadata.create_all() create the version table and its triggers too."""
+    from sqlalchemy import event
+
+    @event.listens_for(metadata, 'after_create')
+    def create_url_version(target, connection, **kw):
+        for sql in CREATE_URL_VERSION_SQL:
+            connection.exec_driver_sql(sql)
+
+
+def redirect_status(url: str) -> int:
+    """302, or the permanent status for a link that never expires when one is configured."""
+    if REDIRECT_PERMANENT_STATUS and getattr(url, 'expires_at', None) is None:
+        return REDIRECT_PERMANENT_STATUS
+    return 302
+
+
+def redirect_cache_control(url: str) -> str | None:
+    """The Cache-Control of a redirect to url (a cached value, see common.cache.ExpiringUrl), or None."""
+    expires_at = getattr(url, 'expires_at', None)
+    if not REDIRECT_CACHE_CONTROL or expires_at is None:
+        return REDIRECT_CACHE_CONTROL or None
+    left = max(0, int(link_ttl(expires_at)))
+    if not MAX_AGE.search(REDIRECT_CACHE_CONTROL):
+        return f'{REDIRECT_CACHE_CONTROL}, max-age={left}'
+    return MAX_AGE.sub(lambda m: f'{m[1]}={min(int(m[2]), left)}', REDIRECT_CACHE_CONTROL)
+
+
+def redirect_headers(url: str) -> dict:
+    """Headers a redirect to url carries besides Location."""
+    cache_control = redirect_cache_control(url)
+    return {'Cache-Control': cache_control} if cache_control else {}
+
+
+def http_date(value: datetime) -> str:
+    """value (naive UTC or aware) in the IMF-fixdate form of Last-Modified."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _last_modified(modified_at: datetime) -> datetime | None:
+    """
+    modified_at rounded up to the whole second Last-Modified can carry, or None
+    while that second is still running and another write could land in it.
+    """
+    if modified_at.tzinfo is None:
+        modified_at = modified_at.replace(tzinfo=timezone.utc)
+    rounded = modified_at.replace(microsecond=0)
+    if rounded < modified_at:
+        rounded += timedelta(seconds=1)
+    return rounded if rounded <= utcnow() else None
+
+
+def list_validators(version) -> dict:
+    """ETag, Last-Modified and Cache-Control for a listing at Store.version() version; {} without one."""
+    if version is None:
+        return {}
+    tag, modified_at = version
+    headers = {'ETag': f'W/"{tag}"'}
+    last_modified = _last_modified(modified_at) if modified_at is not None else None
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    if LIST_CACHE_CONTROL:
+        headers['Cache-Control'] = LIST_CACHE_CONTROL
+    return headers
+
+
+def _opaque(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def not_modified(validators: dict, headers) -> bool:
+    """
+    True when the request headers (any case-insensitive mapping) hold a
+    validator matching validators: If-None-Match by weak comparison, or
+    If-Modified-Since when there is no If-None-Match.
+    """
+    etag = validators.get('ETag')
+    if etag is None:
+        return False
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or _opaque(etag) in map(_opaque, if_none_match.split(','))
+    if_modified_since = headers.get('If-Modified-Since')
+    last_modified = validators.get('Last-Modified')
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
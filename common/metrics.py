@@ -0,0 +1,214 @@
+"""
+Lightweight request and hot-path instrumentation shared by all framework versions.
+
+Two histogram families are kept in process memory and rendered in the
+Prometheus text format by each app's GET /metrics:
+
+- ``http_request_duration_seconds{framework,method,route,status}``, fed by
+  the per-framework middleware (route is the URL pattern, not the raw path);
+- ``url_shortener_operation_seconds{operation}``, fed by ``timed()`` blocks
+  around validation, code generation, each database call and serialization.
+
+Components with their own counters (the short code Bloom filter) register a
+stats() callable with ``register_gauges`` under their app's framework label;
+its numeric values are rendered as gauges on every scrape, whether or not
+timing is enabled. Several apps imported into one process (as in the test
+suite) each keep their own series instead of replacing one another's.
+
+Timing is enabled with METRICS_ENABLED=1. When disabled, ``timed()`` returns a shared
+no-op context manager and the middleware only checks a flag, so the cost is a
+function call per instrumented block. Each worker process keeps its own
+numbers; scrape every worker (or run one) when using multi-process servers.
+"""
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; spans sub-millisecond cache hits up to slow commits.
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_enabled = METRICS_ENABLED
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(flag: bool) -> None:
+    global _enabled
+    _enabled = flag
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, seconds: float) -> None:
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self) -> dict:
+        """{labels: (count, sum)} for every series."""
+        with self._lock:
+            return {labels: (sum(counts), total) for labels, (counts, total) in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            base = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            prefix = base + ',' if base else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {cumulative}')
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency.', ('framework', 'method', 'route', 'status'))
+OPERATION_SECONDS = Histogram(
+    'url_shortener_operation_seconds', 'Time spent in instrumented hot-path operations.', ('operation',))
+HISTOGRAMS = (REQUEST_SECONDS, OPERATION_SECONDS)
+
+
+class _Timer:
+    __slots__ = ('labels', 'start')
+
+    def __init__(self, operation: str):
+        self.labels = (operation,)
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        OPERATION_SECONDS.observe(self.labels, perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(operation: str):
+    """Context manager recording the duration of the block under operation (no-op when disabled)."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(operation)
+
+
+def timed_iter(iterable, operation: str):
+    """Iterate over iterable, timing each step (e.g. each lazily generated candidate) under operation."""
+    if not _enabled:
+        return iterable
+    return _timed_iter(iter(iterable), operation)
+
+
+def _timed_iter(iterator, operation):
+    labels = (operation,)
+    while True:
+        start = perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        OPERATION_SECONDS.observe(labels, perf_counter() - start)
+        yield item
+
+
+def observe_request(framework: str, method: str, route: str, status: int, seconds: float) -> None:
+    REQUEST_SECONDS.observe((framework, method, route, str(status)), seconds)
+
+
+_gauge_sources = {}  # (framework, prefix) -> stats
+
+
+def register_gauges(prefix: str, stats, framework: str) -> None:
+    """Render the numeric values of stats() as {prefix}_{key}{framework="..."} gauges."""
+    _gauge_sources[framework, prefix] = stats
+
+
+def render() -> str:
+    """All histograms and registered gauges in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    gauges = {}
+    for (framework, prefix), stats in sorted(_gauge_sources.items(), key=lambda item: item[0]):
+        for key, value in stats().items():
+            if isinstance(value, (bool, int, float)):
+                sample = f'{prefix}_{key}{{framework="{_escape(framework)}"}} {float(value)}'
+                gauges.setdefault(f'{prefix}_{key}', []).append(sample)
+    for name, samples in gauges.items():
+        lines.append(f'# TYPE {name} gauge')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def reset() -> None:
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+
+
+class ASGIMetricsMiddleware:
+    """Pure ASGI middleware timing each HTTP request (used by the FastAPI apps)."""
+
+    def __init__(self, app, framework: str = 'fastapi'):
+        self.app = app
+        self.framework = framework
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not _enabled:
+            await self.app(scope, receive, send)
+            return
+        start = perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            observe_request(self.framework, scope['method'], route, status, perf_counter() - start)
@@ -0,0 +1,107 @@
+"""
+Keyset pagination and streaming helpers for the URL listing endpoints.
+
+Pages are ordered newest first by (created_at, id). A cursor is an opaque,
+URL-safe token naming the last row of the previous page, so fetching the next
+page is an index range scan no matter how deep the client has paged.
+"""
+import base64
+from datetime import datetime
+
+from common.batch import chunked
+from common.serializers import dumps
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 1000
+STREAM_CONTENT_TYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+STREAM_FORMATS = tuple(STREAM_CONTENT_TYPES)
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def parse_limit(value) -> int:
+    """Parse the limit query parameter. Raises ValueError when out of range."""
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return limit
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Return (created_at, id) from a cursor token. Raises ValueError if malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def split_page(records, limit: int):
+    """
+    Split limit + 1 fetched records into (page, next_cursor).
+    next_cursor is None when there are no further rows.
+    """
+    if len(records) <= limit:
+        return records, None
+    page = records[:limit]
+    last = page[-1]
+    return page, encode_cursor(last.created_at, last.id)
+
+
+def _encode_chunk(fmt: str, items, first: bool) -> bytes:
+    if fmt == 'ndjson':
+        return b''.join(dumps(item) + b'\n' for item in items)
+    body = b','.join(dumps(item) for item in items)
+    return body if first else b',' + body
+
+
+def stream_json_array(dicts):
+    """Yield a JSON array as bytes, STREAM_CHUNK_SIZE elements per chunk."""
+    yield b'['
+    first = True
+    for items in chunked(dicts, STREAM_CHUNK_SIZE):
+        yield _encode_chunk('json', items, first)
+        first = False
+    yield b']'
+
+
+def stream_ndjson(dicts):
+    """Yield newline-delimited JSON as bytes, STREAM_CHUNK_SIZE objects per chunk."""
+    for items in chunked(dicts, STREAM_CHUNK_SIZE):
+        yield _encode_chunk('ndjson', items, True)
+
+
+def stream_body(fmt: str, dicts):
+    """Return (content_type, chunk iterator) for the requested stream format."""
+    if fmt == 'ndjson':
+        return STREAM_CONTENT_TYPES[fmt], stream_ndjson(dicts)
+    return STREAM_CONTENT_TYPES['json'], stream_json_array(dicts)
+
+
+async def astream_body(fmt: str, dicts):
+    """Async counterpart of stream_body for an async iterable of dicts; yields chunks."""
+    first = True
+    items = []
+    if fmt != 'ndjson':
+        yield b'['
+    async for item in dicts:
+        items.append(item)
+        if len(items) == STREAM_CHUNK_SIZE:
+            yield _encode_chunk(fmt, items, first)
+            first = False
+            items = []
+    if items:
+        yield _encode_chunk(fmt, items, first)
+    if fmt != 'ndjson':
+        yield b']'
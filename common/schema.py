@@ -0,0 +1,88 @@
+"""
+Schema upgrade helpers for the SQLAlchemy-backed apps (Flask and FastAPI).
+
+``create_all`` only creates missing tables, it never alters existing ones, so
+databases created before a column was added are brought up to date here.
+"""
+from sqlalchemy import inspect, text
+
+from common.utils import url_digest
+
+BACKFILL_BATCH_SIZE = 1000
+# Databases from before deduplication may hold one URL several times. The
+# oldest row keeps the digest (and stays the one shorten() returns); the
+# others get a tag that no digest can equal, so the unique index builds and
+# their short codes keep redirecting.
+RETAG_DUPLICATE_HASHES_SQL = (
+    "UPDATE shorten_url SET url_hash = 'dup:' || id "
+    'WHERE id NOT IN (SELECT MIN(id) FROM shorten_url GROUP BY url_hash)'
+)
+
+
+def upgrade_schema(engine) -> None:
+    """Apply every in-place upgrade below. Safe to call on every startup."""
+    ensure_url_hash(engine)
+    ensure_created_at_index(engine)
+    ensure_expires_at(engine)
+
+
+def ensure_url_hash(engine) -> None:
+    """
+    Add and backfill the ``url_hash`` column on an existing ``shorten_url`` table.
+    Safe to call on every startup; it is a no-op once the column exists.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table('shorten_url'):
+        return
+    columns = {col['name'] for col in inspector.get_columns('shorten_url')}
+    if 'url_hash' in columns:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE shorten_url ADD COLUMN url_hash VARCHAR(64)'))
+        while True:
+            rows = conn.execute(
+                text('SELECT id, original_url FROM shorten_url WHERE url_hash IS NULL LIMIT :n'),
+                {'n': BACKFILL_BATCH_SIZE},
+            ).fetchall()
+            if not rows:
+                break
+            conn.execute(
+                text('UPDATE shorten_url SET url_hash = :h WHERE id = :id'),
+                [{'h': url_digest(url), 'id': row_id} for row_id, url in rows],
+            )
+        conn.execute(text(RETAG_DUPLICATE_HASHES_SQL))
+        conn.execute(text(
+            'CREATE UNIQUE INDEX IF NOT EXISTS ix_shorten_url_url_hash ON shorten_url (url_hash)'
+        ))
+
+
+def ensure_created_at_index(engine) -> None:
+    """
+    Create the created_at index used by keyset pagination on older databases.
+    SQLite secondary indexes carry the rowid, so this also covers (created_at, id).
+    """
+    if not inspect(engine).has_table('shorten_url'):
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_shorten_url_created_at ON shorten_url (created_at)'
+        ))
+
+
+def ensure_expires_at(engine) -> None:
+    """
+    Add the nullable expires_at column and its partial index on older databases.
+    Existing links never expire, so nothing is backfilled and the index starts empty.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table('shorten_url'):
+        return
+    columns = {col['name'] for col in inspector.get_columns('shorten_url')}
+    with engine.begin() as conn:
+        if 'expires_at' not in columns:
+            conn.execute(text('ALTER TABLE shorten_url ADD COLUMN expires_at DATETIME'))
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_shorten_url_expires_at ON shorten_url (expires_at) '
+            'WHERE expires_at IS NOT NULL'
+        ))
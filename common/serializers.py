@@ -0,0 +1,80 @@
+"""
+JSON encoding of shortened URL records for the list and shorten endpoints.
+
+The listing used to load full ORM instances, turn each one into a dict via
+to_dict() (one isoformat() call per row) and hand the list to jsonify,
+JsonResponse or FastAPI's jsonable_encoder, which walks it all over again.
+Now the stores fetch just the public columns as tuples (iter_recent_rows),
+the dicts are built here once, and the views send the encoded bytes straight
+through the framework's plain response class.
+
+orjson is used when it is installed (``pip install orjson``) and the standard
+library encoder otherwise; both produce compact UTF-8. Timestamps go through a
+small LRU cache of their ISO strings, since the same rows (the newest page,
+bulk imports sharing a created_at) are listed over and over. Full streams
+see each row once, so they skip the cache rather than flush it.
+"""
+import json
+from collections import namedtuple
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+CONTENT_TYPE = 'application/json'
+URL_COLUMNS = ('id', 'original_url', 'short_code', 'created_at', 'expires_at')
+TIMESTAMP_CACHE_SIZE = 65536
+
+UrlRow = namedtuple('UrlRow', URL_COLUMNS)
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+
+def dumps(obj) -> bytes:
+    """obj as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _encode(obj).encode()
+
+
+def isoformat(value) -> str | None:
+    """value.isoformat(); None stays None."""
+    return value.isoformat() if value is not None else None
+
+
+iso_timestamp = lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)(isoformat)
+
+
+def record_row(record) -> UrlRow:
+    """The public columns of a stored record (ORM instance or UrlRecord)."""
+    return UrlRow(record.id, record.original_url, record.short_code, record.created_at, record.expires_at)
+
+
+def url_dict(row, timestamp=iso_timestamp) -> dict:
+    """The API representation of an (id, original_url, short_code, created_at, expires_at) row."""
+    row_id, original_url, short_code, created_at, expires_at = row
+    return {
+        'id': row_id,
+        'original_url': original_url,
+        'short_code': short_code,
+        'created_at': timestamp(created_at),
+        'expires_at': isoformat(expires_at),
+    }
+
+
+def stream_dicts(rows):
+    """url_dict() for every row of a full listing, formatting timestamps uncached."""
+    return (url_dict(row, isoformat) for row in rows)
+
+
+def encode_url(record) -> bytes:
+    """One stored record as a JSON object (the shorten response)."""
+    return dumps(url_dict(record_row(record)))
+
+
+def encode_urls(rows) -> bytes:
+    """(id, original_url, short_code, created_at, expires_at) rows as a JSON array (a listing page)."""
+    return dumps([url_dict(row) for row in rows])
@@ -0,0 +1,427 @@
+"""
+Sharded storage: shortened URLs spread over several SQLite databases.
+
+One SQLite file allows one writer at a time and holds every row an app has.
+STORE_BACKEND=sharded splits the table over STORE_SHARDS databases
+(``url-shortener-<app>-<n>.db`` in STORE_SHARD_DIR), each with its own write
+lock and its own file:
+
+- A link lives on the shard that owns its short code on a consistent-hash
+  ring (HashRing), so a redirect reads exactly one database.
+- Dedupe by URL is routed the same way by the URL digest, to a small
+  shorten_url_digest table mapping url_hash to short_code on the shard that
+  owns the digest. That claim is what keeps one link per URL across shards.
+  A link is stored first and its digest claimed second, so a claim always
+  points at a stored link; a claim whose link has been deleted is taken over
+  by the next writer of that URL.
+- Listings ask every shard for its newest rows and k-way merge them, so a
+  page costs one indexed query per shard and a full stream keeps one cursor
+  open per shard.
+- Row ids are per shard. Records carry ``id * SHARD_ID_STRIDE + shard`` so
+  ids and pagination cursors stay unique across shards, and the Bloom
+  filter's sync position packs the last id seen on every shard.
+
+A shard creates its tables the first time it is used. To change the number
+of shards, stop the app's workers and move the links whose owner changes:
+
+    python -m common.sharding rebalance --app flask --from 4 --to 6
+
+Consistent hashing keeps that to roughly the share of links the new shards
+take over (or the removed ones gave up). Moved links keep their code but get
+new ids, so cursors handed out earlier may skip or repeat rows. As with the
+other standalone engines, click counts stay in the app's own database.
+"""
+import argparse
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from itertools import islice
+from operator import attrgetter, itemgetter
+from pathlib import Path
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, create_engine, delete, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, declarative_base
+
+from common import pagination
+from common.batch import chunked
+from common.db import configure_engine, engine_options
+from common.expiry import naive_utc, utcnow
+from common.http_cache import sqlalchemy_url_version
+from common.serializers import UrlRow
+from common.sql_store import SQLAlchemyStore
+from common.store import DB_DATETIME_FORMAT, EXPIRED_IDS_SQL, DuplicateError, Store, UrlRecord
+
+STORE_SHARDS = int(os.environ.get('STORE_SHARDS', 4))
+STORE_SHARD_DIR = os.environ.get('STORE_SHARD_DIR', '.')
+RING_REPLICAS = 64
+SHARD_ID_STRIDE = 256  # also the most shards a ring can have
+POSITION_BITS = 48
+REBALANCE_CHUNK_SIZE = 10000
+
+CLAIM_SQL = (
+    'INSERT INTO shorten_url_digest (url_hash, short_code) VALUES (:url_hash, :short_code) '
+    'ON CONFLICT DO NOTHING'
+)
+RELEASE_SQL = 'DELETE FROM shorten_url_digest WHERE url_hash = :url_hash AND short_code = :short_code'
+# Also returns url_hash, so the claims of swept links can be released.
+DELETE_EXPIRED_SQL = f'DELETE FROM shorten_url WHERE id IN ({EXPIRED_IDS_SQL}) RETURNING short_code, url_hash'
+
+Base = declarative_base()
+sqlalchemy_url_version(Base.metadata)
+
+
+class ShardUrl(Base):
+    """shorten_url on a shard, with the columns and indexes of the apps' ShortenUrl models."""
+    __tablename__ = 'shorten_url'
+    # AUTOINCREMENT so a dropped newest row never hands its id out again; codes_after() relies on that.
+    __table_args__ = (
+        Index('ix_shorten_url_expires_at', 'expires_at', sqlite_where=text('expires_at IS NOT NULL')),
+        {'sqlite_autoincrement': True},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    original_url = Column(String(2048), nullable=False)
+    url_hash = Column(String(64), unique=True, nullable=False, index=True)
+    short_code = Column(String(50), unique=True, nullable=False, index=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    expires_at = Column(DateTime, nullable=True)
+
+
+class ShardUrlDigest(Base):
+    """Which short code holds each URL whose digest this shard owns."""
+    __tablename__ = 'shorten_url_digest'
+
+    url_hash = Column(String(64), primary_key=True)
+    short_code = Column(String(50), nullable=False)
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing of string keys onto shards 0..shards-1, with replicas
+    points on the ring per shard. Going from N to N+1 shards only moves keys
+    onto the new shard, about 1/(N+1) of them.
+    """
+
+    def __init__(self, shards: int, replicas: int = RING_REPLICAS):
+        if not 1 <= shards <= SHARD_ID_STRIDE:
+            raise ValueError(f'shards must be between 1 and {SHARD_ID_STRIDE}')
+        self.shards = shards
+        points = sorted(
+            (_point(f'shard-{shard}-{replica}'), shard) for shard in range(shards) for replica in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> int:
+        i = bisect.bisect(self._points, _point(key))
+        return self._owners[i % len(self._owners)]
+
+    def group(self, items, key=None) -> dict:
+        """{shard: [items]} for items routed by key(item) (the item itself by default)."""
+        groups = {}
+        for item in items:
+            groups.setdefault(self.shard_for(key(item) if key else item), []).append(item)
+        return groups
+
+
+def shard_urls(name: str, shards: int = STORE_SHARDS, directory: str = STORE_SHARD_DIR) -> list:
+    """SQLAlchemy URLs of app name's shard databases."""
+    return [f"sqlite:///{Path(directory) / f'url-shortener-{name}-{shard}.db'}" for shard in range(shards)]
+
+
+def _open_engine(url: str):
+    engine = configure_engine(create_engine(url, **engine_options(url)))
+    Base.metadata.create_all(engine)
+    return engine
+
+
+class ShardedStore(Store):
+    """Store over shard databases; urls[n] is the SQLAlchemy URL of shard n."""
+
+    def __init__(self, urls, replicas: int = RING_REPLICAS):
+        self.urls = list(urls)
+        self.ring = HashRing(len(self.urls), replicas)
+        self._engines = [None] * len(self.urls)
+        self._lock = threading.Lock()
+
+    def engine(self, shard: int):
+        """The engine of a shard, creating its tables on first use."""
+        engine = self._engines[shard]
+        if engine is None:
+            with self._lock:
+                engine = self._engines[shard]
+                if engine is None:
+                    engine = self._engines[shard] = _open_engine(self.urls[shard])
+        return engine
+
+    def _session(self, shard: int) -> Session:
+        return Session(self.engine(shard))
+
+    @staticmethod
+    def _record(row, shard: int) -> UrlRecord:
+        return UrlRecord(row.id * SHARD_ID_STRIDE + shard, row.original_url, row.url_hash, row.short_code,
+                         row.created_at, row.expires_at)
+
+    def get_by_code(self, code):
+        shard = self.ring.shard_for(code)
+        with self._session(shard) as session:
+            row = SQLAlchemyStore(session, ShardUrl).get_by_code(code)
+            return self._record(row, shard) if row is not None else None
+
+    def get_target(self, code):
+        with self._session(self.ring.shard_for(code)) as session:
+            return SQLAlchemyStore(session, ShardUrl).get_target(code)
+
+    def get_by_hashes(self, digests):
+        claims = {}
+        for shard, group in self.ring.group(digests).items():
+            with self.engine(shard).connect() as conn:
+                stmt = select(ShardUrlDigest.url_hash, ShardUrlDigest.short_code)
+                claims.update(conn.execute(stmt.where(ShardUrlDigest.url_hash.in_(group))).all())
+        records = {}
+        for shard, codes in self.ring.group(claims.values()).items():
+            with self._session(shard) as session:
+                for row in session.scalars(select(ShardUrl).where(ShardUrl.short_code.in_(codes))):
+                    if claims.get(row.url_hash) == row.short_code:
+                        records[row.url_hash] = self._record(row, shard)
+        return records
+
+    def taken_codes(self, codes):
+        taken = set()
+        for shard, group in self.ring.group(codes).items():
+            with self._session(shard) as session:
+                taken |= SQLAlchemyStore(session, ShardUrl).taken_codes(group)
+        return taken
+
+    def insert(self, url, code, expires_at=None):
+        shard = self.ring.shard_for(code)
+        with self._session(shard) as session:
+            record = self._record(SQLAlchemyStore(session, ShardUrl).insert(url, code, naive_utc(expires_at)), shard)
+        if self._claim_many([record]):
+            self._drop([code])
+            raise DuplicateError(code)
+        return record
+
+    def _claim_many(self, records) -> list:
+        """Claim the digest of each stored record; returns the records whose URL another link holds."""
+        lost = []
+        for shard, group in self.ring.group(records, key=attrgetter('url_hash')).items():
+            with self.engine(shard).begin() as conn:
+                conn.execute(text(CLAIM_SQL), [{'url_hash': r.url_hash, 'short_code': r.short_code} for r in group])
+                stmt = select(ShardUrlDigest.url_hash, ShardUrlDigest.short_code)
+                held = dict(conn.execute(stmt.where(ShardUrlDigest.url_hash.in_([r.url_hash for r in group]))).all())
+            lost += [r for r in group if held.get(r.url_hash) != r.short_code and not self._take_over(r, held)]
+        return lost
+
+    def _take_over(self, record, held: dict) -> bool:
+        """Move a claim onto record if the link it points at no longer exists."""
+        current = held.get(record.url_hash)
+        holder = self.get_by_code(current) if current is not None else None
+        if holder is not None and holder.url_hash == record.url_hash:
+            return False
+        stmt = update(ShardUrlDigest).where(
+            ShardUrlDigest.url_hash == record.url_hash, ShardUrlDigest.short_code == current,
+        ).values(short_code=record.short_code)
+        with self.engine(self.ring.shard_for(record.url_hash)).begin() as conn:
+            return conn.execute(stmt).rowcount == 1
+
+    def _release(self, pairs) -> None:
+        """Drop the claims of deleted links, given as (short_code, url_hash) pairs."""
+        for shard, group in self.ring.group(pairs, key=itemgetter(1)).items():
+            with self.engine(shard).begin() as conn:
+                conn.execute(text(RELEASE_SQL), [{'short_code': code, 'url_hash': digest} for code, digest in group])
+
+    def _drop(self, codes) -> None:
+        for shard, group in self.ring.group(codes).items():
+            with self.engine(shard).begin() as conn:
+                for chunk in chunked(group):
+                    conn.execute(delete(ShardUrl).where(ShardUrl.short_code.in_(chunk)))
+
+    def renew(self, record, expires_at=None):
+        expires_at = naive_utc(expires_at)
+        stmt = update(ShardUrl).where(ShardUrl.short_code == record.short_code).values(expires_at=expires_at)
+        with self.engine(self.ring.shard_for(record.short_code)).begin() as conn:
+            conn.execute(stmt)
+        record.expires_at = expires_at
+        return record
+
+    def delete_expired(self, limit, now=None):
+        # One transaction per shard rather than one overall.
+        now = naive_utc(now or utcnow()).strftime(DB_DATETIME_FORMAT)
+        deleted = []
+        for shard in range(self.ring.shards):
+            if len(deleted) >= limit:
+                break
+            with self.engine(shard).begin() as conn:
+                deleted += conn.execute(text(DELETE_EXPIRED_SQL), {'now': now, 'limit': limit - len(deleted)}).all()
+        self._release(deleted)
+        return [code for code, _ in deleted]
+
+    def insert_many(self, rows):
+        # Each shard inserts its rows in one transaction; if any shard or claim
+        # fails, what the others stored is deleted again.
+        inserted = {}
+        failed = False
+        for shard, group in self.ring.group(rows, key=itemgetter('short_code')).items():
+            with self._session(shard) as session:
+                stored = SQLAlchemyStore(session, ShardUrl).insert_many(group)
+                if stored is None:
+                    failed = True
+                    break
+                inserted.update((digest, self._record(row, shard)) for digest, row in stored.items())
+        lost = [] if failed else self._claim_many(list(inserted.values()))
+        if failed or lost:
+            lost_codes = {r.short_code for r in lost}
+            self._release([(r.short_code, r.url_hash) for r in inserted.values() if r.short_code not in lost_codes])
+            self._drop([r.short_code for r in inserted.values()])
+            return None
+        return inserted
+
+    def codes_after(self, after_id):
+        """
+        (position, short_code) for the links stored after a sync position, shard
+        by shard. A position packs the last id seen on every shard,
+        POSITION_BITS apiece; CodeFilter only ever hands it back.
+        """
+        mask = (1 << POSITION_BITS) - 1
+        position = after_id
+        for shard in range(self.ring.shards):
+            shift = shard * POSITION_BITS
+            last = (position >> shift) & mask
+            with self._session(shard) as session:
+                for row_id, code in SQLAlchemyStore(session, ShardUrl).codes_after(last):
+                    position += (row_id - last) << shift
+                    last = row_id
+                    yield position, code
+
+    def _shard_cursor(self, cursor, shard: int):
+        """A listing cursor over record ids, as a cursor over one shard's own ids."""
+        if not cursor:
+            return None
+        created_at, row_id = pagination.decode_cursor(cursor)
+        # id * SHARD_ID_STRIDE + shard < row_id  <=>  id < (row_id - shard - 1) // SHARD_ID_STRIDE + 1
+        return pagination.encode_cursor(created_at, (row_id - shard - 1) // SHARD_ID_STRIDE + 1)
+
+    def _recent(self, shard: int, cursor, limit, rows: bool):
+        with self._session(shard) as session:
+            store = SQLAlchemyStore(session, ShardUrl)
+            if rows:
+                for row in store.iter_recent_rows(cursor, limit):
+                    yield UrlRow(row[0] * SHARD_ID_STRIDE + shard, *row[1:])
+            else:
+                for row in store.iter_recent(cursor, limit):
+                    yield self._record(row, shard)
+
+    def _merged(self, cursor, limit, rows: bool):
+        streams = [
+            self._recent(shard, self._shard_cursor(cursor, shard), limit, rows) for shard in range(self.ring.shards)
+        ]
+        merged = heapq.merge(*streams, key=attrgetter('created_at', 'id'), reverse=True)
+        if limit is None:
+            return merged
+        page = list(islice(merged, limit))
+        for stream in streams:
+            stream.close()
+        return iter(page)
+
+    def iter_recent(self, cursor=None, limit=None):
+        return self._merged(cursor, limit, rows=False)
+
+    def iter_recent_rows(self, cursor=None, limit=None):
+        return self._merged(cursor, limit, rows=True)
+
+    def version(self):
+        versions = []
+        for shard in range(self.ring.shards):
+            with self._session(shard) as session:
+                versions.append(SQLAlchemyStore(session, ShardUrl).version())
+        modified = [modified_at for _, modified_at in versions if modified_at is not None]
+        return '.'.join(tag for tag, _ in versions), max(modified, default=None)
+
+    def close(self) -> None:
+        for engine in self._engines:
+            if engine is not None:
+                engine.dispose()
+
+
+def open_sharded_store(name: str) -> ShardedStore:
+    """The STORE_SHARDS shards of app name in STORE_SHARD_DIR."""
+    return ShardedStore(shard_urls(name))
+
+
+def _move(engines, shard: int, ring: HashRing, table, key: str) -> int:
+    """Move the rows of table on shard that ring routes elsewhere (by column key); returns how many."""
+    pk = table.primary_key.columns[0]
+    columns = [column.name for column in table.columns if column.name != 'id']  # ids are per shard
+    moved = 0
+    last = None
+    while True:
+        stmt = select(table).order_by(pk).limit(REBALANCE_CHUNK_SIZE)
+        if last is not None:
+            stmt = stmt.where(pk > last)
+        with engines[shard].connect() as conn:
+            rows = conn.execute(stmt).all()
+        if not rows:
+            return moved
+        last = getattr(rows[-1], pk.name)
+        for target, group in ring.group(rows, key=attrgetter(key)).items():
+            if target == shard:
+                continue
+            # Copy first, then delete: an interrupted run leaves duplicates that the next run cleans up.
+            with engines[target].begin() as conn:
+                conn.execute(sqlite_insert(table).on_conflict_do_nothing(),
+                             [{name: getattr(row, name) for name in columns} for row in group])
+            with engines[shard].begin() as conn:
+                for chunk in chunked(getattr(row, pk.name) for row in group):
+                    conn.execute(delete(table).where(pk.in_(chunk)))
+            moved += len(group)
+
+
+def rebalance(name: str, old: int, new: int, directory: str = STORE_SHARD_DIR) -> dict:
+    """
+    Move app name's links and digest claims from old to new shards, offline.
+    Only rows whose owner differs between the two rings move; shard files
+    emptied by shrinking are removed. Returns what moved.
+    """
+    ring = HashRing(new)
+    urls = shard_urls(name, max(old, new), directory)
+    engines = [_open_engine(url) for url in urls]
+    summary = {'links': 0, 'claims': 0, 'removed': []}
+    try:
+        for shard in range(old):
+            summary['links'] += _move(engines, shard, ring, ShardUrl.__table__, 'short_code')
+            summary['claims'] += _move(engines, shard, ring, ShardUrlDigest.__table__, 'url_hash')
+    finally:
+        for engine in engines:
+            engine.dispose()
+    for url in urls[new:]:
+        path = url[len('sqlite:///'):]
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        summary['removed'].append(path)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('command', choices=('rebalance',))
+    parser.add_argument('--app', choices=('flask', 'django', 'fastapi'), required=True)
+    parser.add_argument('--from', dest='old', type=int, required=True, help='shards the data is on now')
+    parser.add_argument('--to', dest='new', type=int, required=True, help='shards to spread it over')
+    parser.add_argument('--dir', default=STORE_SHARD_DIR, help='directory of the shard files (STORE_SHARD_DIR)')
+    args = parser.parse_args(argv)
+    print(json.dumps(rebalance(args.app, args.old, args.new, args.dir)))
+
+
+if __name__ == '__main__':
+    main()
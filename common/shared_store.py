@@ -0,0 +1,170 @@
+"""
+Cross-process short_code -> original_url store in a shared memory-mapped file.
+
+Worker processes on one machine map the same file (by default under
+/dev/shm, i.e. RAM) so a code resolved by any worker is visible to all of them
+without a database query, and survives individual worker restarts.
+
+Layout: a 64-byte header followed by fixed-size slots grouped into buckets of
+BUCKET_SLOTS. A code hashes to one bucket; lookups scan only that bucket and
+inserts overwrite an existing entry for the code, then an empty slot, then a
+hash-chosen victim, so the table behaves like a set-associative cache.
+
+Each slot starts with a version counter used as a seqlock: writers make it odd
+while they modify the slot and even when done, and readers discard anything
+read while it was odd or changed. Writers serialize on an fcntl lock on the
+file, so readers never take a lock.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b'URLSHM01'
+HEADER = struct.Struct('<8sII')  # magic, slot count, slot size
+HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct('<IBxH')  # version, key length, url length
+VERSION = struct.Struct('<I')
+SLOT_SIZE = 512
+KEY_OFFSET = SLOT_HEADER.size
+KEY_MAX = 56
+URL_OFFSET = KEY_OFFSET + KEY_MAX
+URL_MAX = SLOT_SIZE - URL_OFFSET
+BUCKET_SLOTS = 4
+
+
+class SharedRedirectStore:
+    """Fixed-slot hash table of short code -> URL shared by every process mapping path."""
+
+    def __init__(self, path: str, slots: int = 65536):
+        if slots < BUCKET_SLOTS or slots % BUCKET_SLOTS:
+            raise ValueError(f'slots must be a positive multiple of {BUCKET_SLOTS}')
+        self.path = path
+        self._mutex = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = HEADER_SIZE + slots * SLOT_SIZE
+        with self._locked():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, slots, SLOT_SIZE), 0)
+        self._mm = mmap.mmap(self._fd, 0)
+        magic, self.slots, slot_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or slot_size != SLOT_SIZE:
+            raise ValueError(f'{path} is not a compatible shared redirect store')
+        self._buckets = self.slots // BUCKET_SLOTS
+        self.hits = 0
+        self.misses = 0
+
+    def _locked(self):
+        return FileLock(self._fd, self._mutex)
+
+    def _bucket(self, key: bytes):
+        h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+        first = HEADER_SIZE + (h % self._buckets) * BUCKET_SLOTS * SLOT_SIZE
+        return [first + i * SLOT_SIZE for i in range(BUCKET_SLOTS)], (h >> 32) % BUCKET_SLOTS
+
+    def get(self, code: str):
+        """Return the URL stored for code, or None."""
+        key = code.encode()
+        if len(key) > KEY_MAX:
+            return None
+        mm = self._mm
+        offsets, _ = self._bucket(key)
+        for off in offsets:
+            version, key_len, url_len = SLOT_HEADER.unpack_from(mm, off)
+            if version & 1 or key_len != len(key) or mm[off + KEY_OFFSET:off + KEY_OFFSET + key_len] != key:
+                continue
+            url = mm[off + URL_OFFSET:off + URL_OFFSET + url_len]
+            if VERSION.unpack_from(mm, off)[0] != version:
+                break  # torn read: a writer changed the slot meanwhile
+            self.hits += 1
+            return url.decode()
+        self.misses += 1
+        return None
+
+    def set(self, code: str, url: str) -> bool:
+        """Store code -> url. Returns False if either is too long for a slot."""
+        key, value = code.encode(), url.encode()
+        if len(key) > KEY_MAX or len(value) > URL_MAX:
+            return False
+        offsets, victim = self._bucket(key)
+        with self._locked():
+            target = None
+            for off in offsets:
+                _, key_len, _ = SLOT_HEADER.unpack_from(self._mm, off)
+                if key_len == len(key) and self._mm[off + KEY_OFFSET:off + KEY_OFFSET + key_len] == key:
+                    target = off
+                    break
+                if key_len == 0 and target is None:
+                    target = off
+            if target is None:
+                target = offsets[victim]
+            self._write(target, key, value)
+        return True
+
+    def delete(self, code: str) -> None:
+        key = code.encode()
+        if len(key) > KEY_MAX:
+            return
+        offsets, _ = self._bucket(key)
+        with self._locked():
+            for off in offsets:
+                _, key_len, _ = SLOT_HEADER.unpack_from(self._mm, off)
+                if key_len == len(key) and self._mm[off + KEY_OFFSET:off + KEY_OFFSET + key_len] == key:
+                    self._write(off, b'', b'')
+
+    def clear(self) -> None:
+        """Empty every slot (affects all processes sharing the file)."""
+        with self._locked():
+            for off in range(HEADER_SIZE, HEADER_SIZE + self.slots * SLOT_SIZE, SLOT_SIZE):
+                if SLOT_HEADER.unpack_from(self._mm, off)[1]:
+                    self._write(off, b'', b'')
+
+    def _write(self, off: int, key: bytes, value: bytes) -> None:
+        mm = self._mm
+        odd = (VERSION.unpack_from(mm, off)[0] + 1) | 1
+        VERSION.pack_into(mm, off, odd)
+        mm[off + KEY_OFFSET:off + KEY_OFFSET + len(key)] = key
+        mm[off + URL_OFFSET:off + URL_OFFSET + len(value)] = value
+        SLOT_HEADER.pack_into(mm, off, odd, len(key), len(value))
+        VERSION.pack_into(mm, off, odd + 1)
+
+    def stats(self) -> dict:
+        return {'slots': self.slots, 'hits': self.hits, 'misses': self.misses}
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+
+class FileLock:
+    """
+    Exclusive lock on a whole file, as a context manager.
+    fcntl locks only exclude other processes, so threads also share a mutex.
+    """
+
+    def __init__(self, fd: int, mutex):
+        self.fd = fd
+        self.mutex = mutex
+
+    def __enter__(self):
+        self.mutex.acquire()
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.mutex.release()
+
+
+def open_shared_store(name: str):
+    """
+    Open the shared store for one app, or return None when disabled.
+    Enabled by setting SHARED_REDIRECT_CACHE_DIR (e.g. /dev/shm).
+    """
+    directory = os.environ.get('SHARED_REDIRECT_CACHE_DIR')
+    if not directory:
+        return None
+    slots = int(os.environ.get('SHARED_REDIRECT_CACHE_SLOTS', 65536))
+    return SharedRedirectStore(os.path.join(directory, f'url-shortener-{name}.redirects'), slots)
@@ -0,0 +1,116 @@
+"""
+Request coalescing: one call per key in flight, its result shared by every
+concurrent caller.
+
+When a link goes viral, every request for its code arriving before the
+redirect cache is filled would run the same lookup. Concurrent shortens of
+one URL would race through the dedupe query, try the same code and settle it
+on the unique constraint. With a SingleFlight the first caller for a key runs
+the call and the callers that arrive while it runs wait for it and get the
+same result (or exception) instead of running it again. Nothing is cached:
+once the call returns, the next caller starts a new one.
+
+The redirect lookup is coalesced by short code (common.cache) and shorten()
+by URL (common.store). SingleFlight is for threads (Flask, Django and the
+sync FastAPI app); AsyncSingleFlight is its asyncio counterpart for the async
+FastAPI app. SINGLE_FLIGHT=0 turns both into plain calls.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+
+SINGLE_FLIGHT = os.environ.get('SINGLE_FLIGHT', '1') != '0'
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key across threads."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args):
+        """
+        Return (fn(*args), shared). shared is True when the result came from
+        a call another thread already had in flight for key.
+        """
+        if not self.enabled:
+            return fn(*args), False
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = self._calls[key] = Future()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args)
+        except BaseException as exc:
+            self._finish(key)
+            future.set_exception(exc)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result, False
+
+    def _finish(self, key) -> None:
+        # Forget the call before waking its waiters, so a caller arriving
+        # after the result was handed out starts a fresh one.
+        with self._lock:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {'enabled': self.enabled, 'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent awaits with the same key on one event loop.
+    The call runs as its own task, so a caller that is cancelled (a client
+    gone away) does not cancel it for the others.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, fn, *args):
+        """Return (await fn(*args), shared), like SingleFlight.do."""
+        if not self.enabled:
+            return await fn(*args), False
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            task = self._calls[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key, task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {'enabled': self.enabled, 'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+
+def make_single_flight() -> SingleFlight:
+    """A SingleFlight, enabled unless SINGLE_FLIGHT=0."""
+    return SingleFlight(SINGLE_FLIGHT)
+
+
+def make_async_single_flight() -> AsyncSingleFlight:
+    """An AsyncSingleFlight, enabled unless SINGLE_FLIGHT=0."""
+    return AsyncSingleFlight(SINGLE_FLIGHT)
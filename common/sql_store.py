@@ -0,0 +1,205 @@
+"""
+SQLAlchemy implementation of common.store.Store, used by the Flask and FastAPI apps,
+and its coroutine counterpart over an AsyncSession for the async FastAPI app.
+
+Kept apart from common.store so the Django app and the standalone engines
+never import SQLAlchemy, which is a large share of a worker's import time.
+"""
+from contextlib import asynccontextmanager
+
+from sqlalchemy import and_, insert, or_, select, text
+from sqlalchemy.exc import IntegrityError
+
+from common import pagination
+from common.batch import chunked
+from common.expiry import live_target, naive_utc, utcnow
+from common.http_cache import URL_VERSION_SQL, url_version
+from common.serializers import URL_COLUMNS
+from common.store import (
+    DB_DATETIME_FORMAT, DELETE_EXPIRED_CLICKS_SQL, DELETE_EXPIRED_URLS_SQL, DuplicateError, Store,
+)
+from common.utils import url_digest
+
+
+def recent_select(model, cursor: str | None = None, columns=None):
+    """
+    Newest-first select over a SQLAlchemy model (or just the named columns),
+    starting after cursor. Raises ValueError for a bad cursor.
+    """
+    entities = [getattr(model, name) for name in columns] if columns else [model]
+    stmt = select(*entities).order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, row_id = pagination.decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    return stmt
+
+
+class SQLAlchemyStore(Store):
+    """Store over a SQLAlchemy session and a ShortenUrl model (the Flask and FastAPI apps)."""
+
+    def __init__(self, session, model):
+        self.session = session
+        self.model = model
+
+    def get_by_code(self, code):
+        return self.session.scalar(select(self.model).where(self.model.short_code == code))
+
+    def get_target(self, code):
+        model = self.model
+        stmt = select(model.original_url, model.expires_at).where(model.short_code == code)
+        return live_target(self.session.execute(stmt).first())
+
+    def get_by_hashes(self, digests):
+        return {r.url_hash: r for r in self.session.scalars(select(self.model).where(self.model.url_hash.in_(digests)))}
+
+    def taken_codes(self, codes):
+        model = self.model
+        return set(self.session.scalars(select(model.short_code).where(model.short_code.in_(codes))))
+
+    def insert(self, url, code, expires_at=None):
+        record = self.model(original_url=url, url_hash=url_digest(url), short_code=code, expires_at=expires_at)
+        self.session.add(record)
+        try:
+            self.session.commit()
+        except IntegrityError:
+            self.session.rollback()
+            raise DuplicateError(code) from None
+        return record
+
+    def renew(self, record, expires_at=None):
+        record.expires_at = expires_at
+        self.session.commit()
+        return record
+
+    def delete_expired(self, limit, now=None):
+        params = {'now': naive_utc(now or utcnow()).strftime(DB_DATETIME_FORMAT), 'limit': limit}
+        self.session.execute(text(DELETE_EXPIRED_CLICKS_SQL), params)
+        codes = list(self.session.scalars(text(DELETE_EXPIRED_URLS_SQL), params))
+        self.session.commit()
+        return codes
+
+    def release(self):
+        self.session.commit()
+
+    def insert_many(self, rows):
+        try:
+            self.session.execute(insert(self.model), rows)
+            self.session.commit()
+        except IntegrityError:
+            self.session.rollback()
+            return None
+        inserted = {}
+        for digests in chunked(row['url_hash'] for row in rows):
+            inserted.update(self.get_by_hashes(digests))
+        return inserted
+
+    def codes_after(self, after_id):
+        model = self.model
+        stmt = select(model.id, model.short_code).where(model.id > after_id).order_by(model.id)
+        for row in self.session.execute(stmt.execution_options(yield_per=pagination.STREAM_CHUNK_SIZE)):
+            yield tuple(row)
+
+    def iter_recent(self, cursor=None, limit=None):
+        stmt = recent_select(self.model, cursor)
+        if limit is None:
+            return self._stream(stmt.execution_options(yield_per=pagination.STREAM_CHUNK_SIZE))
+        return iter(self.session.scalars(stmt.limit(limit)).all())
+
+    def iter_recent_rows(self, cursor=None, limit=None):
+        stmt = recent_select(self.model, cursor, URL_COLUMNS)
+        if limit is None:
+            return self._stream(stmt.execution_options(yield_per=pagination.STREAM_CHUNK_SIZE), rows=True)
+        return iter(self.session.execute(stmt.limit(limit)).all())
+
+    def version(self):
+        return url_version(self.session.execute(text(URL_VERSION_SQL)).first())
+
+    def _stream(self, stmt, rows=False):
+        # Deferred to the first next() so a streamed response runs the query
+        # while it is being sent, inside the session the framework keeps open.
+        yield from self.session.execute(stmt) if rows else self.session.scalars(stmt)
+
+
+class AsyncSQLAlchemyStore:
+    """
+    The Store interface over an AsyncSession, with coroutine methods (the async
+    FastAPI app). Only the request paths are async; bulk work (batch shortens)
+    runs on a SQLAlchemyStore over the same connection through run_sync().
+    """
+
+    def __init__(self, session, model):
+        self.session = session
+        self.model = model
+
+    async def get_by_code(self, code):
+        return await self.session.scalar(select(self.model).where(self.model.short_code == code))
+
+    async def get_target(self, code):
+        model = self.model
+        stmt = select(model.original_url, model.expires_at).where(model.short_code == code)
+        return live_target((await self.session.execute(stmt)).first())
+
+    async def get_original_url(self, code):
+        target = await self.get_target(code)
+        return target[0] if target else None
+
+    async def get_by_url(self, url):
+        digest = url_digest(url)
+        return (await self.get_by_hashes([digest])).get(digest)
+
+    async def get_by_hashes(self, digests):
+        records = await self.session.scalars(select(self.model).where(self.model.url_hash.in_(digests)))
+        return {r.url_hash: r for r in records}
+
+    async def taken_codes(self, codes):
+        model = self.model
+        return set(await self.session.scalars(select(model.short_code).where(model.short_code.in_(codes))))
+
+    async def insert(self, url, code, expires_at=None):
+        record = self.model(original_url=url, url_hash=url_digest(url), short_code=code, expires_at=expires_at)
+        self.session.add(record)
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise DuplicateError(code) from None
+        await self.session.refresh(record)
+        return record
+
+    async def renew(self, record, expires_at=None):
+        record.expires_at = expires_at
+        await self.session.commit()
+        return record
+
+    async def iter_recent(self, cursor=None, limit=None):
+        """A list of at most limit records, or an async iterable of all of them when limit is None."""
+        stmt = recent_select(self.model, cursor)
+        if limit is None:
+            return await self.session.stream_scalars(stmt.execution_options(yield_per=pagination.STREAM_CHUNK_SIZE))
+        return (await self.session.scalars(stmt.limit(limit))).all()
+
+    async def iter_recent_rows(self, cursor=None, limit=None):
+        """iter_recent as URL_COLUMNS rows."""
+        stmt = recent_select(self.model, cursor, URL_COLUMNS)
+        if limit is None:
+            return await self.session.stream(stmt.execution_options(yield_per=pagination.STREAM_CHUNK_SIZE))
+        return (await self.session.execute(stmt.limit(limit))).all()
+
+    async def version(self):
+        return url_version((await self.session.execute(text(URL_VERSION_SQL))).first())
+
+    async def run_sync(self, fn):
+        """fn(store) with a SQLAlchemyStore over this session's connection, run in a worker greenlet."""
+        return await self.session.run_sync(lambda session: fn(SQLAlchemyStore(session, self.model)))
+
+    @asynccontextmanager
+    async def own_session(self):
+        """
+        A store over a new session on the same engine, for work that may
+        outlive the request this store belongs to (a shared single-flight call).
+        """
+        async with type(self.session)(self.session.bind, expire_on_commit=False) as session:
+            yield AsyncSQLAlchemyStore(session, self.model)
@@ -0,0 +1,218 @@
+"""
+Worker startup: the schema step, optional warmup and boot timing.
+
+Importing an app no longer touches its database. Creating or upgrading the
+tables is an explicit step:
+
+    python -m common.startup migrate --app fastapi
+
+A server still runs that step itself when it starts serving (the FastAPI
+lifespan, ``python flask_app/app.py``; ``make run-django`` runs manage.py
+migrate) unless STARTUP_MIGRATE=0, which is what autoscaled workers should
+use once a deploy runs the command above.
+
+With STARTUP_WARMUP=1 a starting worker also fills its redirect cache with
+the most clicked short codes, then the newest ones (up to
+STARTUP_WARMUP_URLS, links that never expire only), and loads the Bloom
+filter of stored codes. It gives up
+when STARTUP_WARMUP_BUDGET_MS runs out, so a large table cannot stall boot;
+whatever is left loads lazily on the first lookups, as it would without
+warmup. FastAPI warms up in its lifespan and Django in wsgi.py. Flask warms
+up in ``python flask_app/app.py``; under another WSGI server, call
+flask_app.app.start_worker() from its post-fork hook. The same step starts
+the worker's expired-link sweeper (common.expiry).
+
+Boot time is exposed as url_shortener_startup_* gauges: seconds from process
+start until the app was ready and until the first redirect was served, plus
+what the warmup loaded.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+from common.cache import REDIRECT_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+STARTUP_MIGRATE = os.environ.get('STARTUP_MIGRATE', '1') != '0'
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', '0') == '1'
+STARTUP_WARMUP_BUDGET_MS = float(os.environ.get('STARTUP_WARMUP_BUDGET_MS', 2000))
+STARTUP_WARMUP_URLS = int(os.environ.get('STARTUP_WARMUP_URLS', REDIRECT_CACHE_SIZE))
+
+HOT_URLS_SQL = (
+    'SELECT u.short_code, u.original_url FROM shorten_url_clicks c '
+    'JOIN shorten_url u ON u.short_code = c.short_code WHERE u.expires_at IS NULL '
+    'ORDER BY c.clicks DESC LIMIT {limit}'
+)
+NEWEST_URLS_SQL = (
+    'SELECT short_code, original_url FROM shorten_url WHERE expires_at IS NULL ORDER BY id DESC LIMIT {limit}'
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _process_started() -> float:
+    """Wall-clock time this process started (from /proc on Linux, else now)."""
+    try:
+        with open('/proc/self/stat') as f:
+            ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_STARTED = _process_started()
+
+_ready = None
+_first_redirect = None
+_warmup = {}
+
+
+def since_start() -> float:
+    return time.time() - PROCESS_STARTED
+
+
+def mark_ready() -> None:
+    """Note that the app can serve requests (the first call counts)."""
+    global _ready
+    if _ready is None:
+        _ready = since_start()
+
+
+def mark_redirect() -> None:
+    """Note a served redirect; only the first one is timed."""
+    global _first_redirect
+    if _first_redirect is None:
+        _first_redirect = since_start()
+        logger.info('First redirect served %.3fs after process start', _first_redirect)
+
+
+def warmup_urls(execute, limit: int):
+    """
+    Lazily yield up to limit (short_code, original_url) pairs, most clicked
+    first, then newest. execute(sql) returns the rows of a query.
+    """
+    seen = set()
+    for sql in (HOT_URLS_SQL, NEWEST_URLS_SQL):
+        for code, url in execute(sql.format(limit=int(limit))):
+            if len(seen) >= limit:
+                return
+            if code not in seen:
+                seen.add(code)
+                yield code, url
+
+
+def sqlalchemy_warmup_urls(get_engine):
+    """fetch_urls(limit) for the SQLAlchemy apps."""
+    from sqlalchemy import text
+
+    def execute(sql):
+        with get_engine().connect() as conn:
+            yield from conn.execute(text(sql))
+    return lambda limit: warmup_urls(execute, limit)
+
+
+def store_warmup_urls(store):
+    """fetch_urls(limit) for a standalone store, which keeps no click counts: the newest URLs."""
+    return lambda limit: (
+        (row.short_code, row.original_url) for row in store.iter_recent_rows(limit=limit) if row.expires_at is None
+    )
+
+
+def warm_up(cache, code_filter, fetch_urls, limit: int = STARTUP_WARMUP_URLS,
+            budget: float = STARTUP_WARMUP_BUDGET_MS / 1000) -> dict:
+    """
+    Fill cache from fetch_urls(limit), then load code_filter, stopping wherever
+    budget seconds run out. Failures are logged, never raised: warmup only
+    saves work the first requests would otherwise do.
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    cached = 0
+    filter_loaded = False
+    try:
+        urls = fetch_urls(limit)
+        for code, url in urls:
+            cache.set(code, url)
+            cached += 1
+            if time.monotonic() >= deadline:
+                break
+        getattr(urls, 'close', lambda: None)()
+        if code_filter.enabled and time.monotonic() < deadline:
+            filter_loaded = code_filter.sync(deadline)
+    except Exception:
+        logger.warning('Startup warmup failed', exc_info=True)
+    _warmup.update(
+        warmup_seconds=time.monotonic() - started,
+        warmup_urls=cached,
+        warmup_filter_loaded=filter_loaded,
+    )
+    logger.info('Warmed up %d redirects in %.3fs (Bloom filter %s)', cached, _warmup['warmup_seconds'],
+                'loaded' if filter_loaded else 'deferred')
+    return dict(_warmup)
+
+
+def start(migrate, cache, code_filter, fetch_urls, sweeper=None) -> None:
+    """
+    A serving worker's boot steps: migrate() when given and STARTUP_MIGRATE is
+    on, warm_up() when STARTUP_WARMUP is on, starting the expired-link
+    sweeper when given, then mark_ready().
+    """
+    if migrate is not None and STARTUP_MIGRATE:
+        migrate()
+    if STARTUP_WARMUP:
+        warm_up(cache, code_filter, fetch_urls)
+    if sweeper is not None:
+        sweeper.start()
+    mark_ready()
+
+
+def stats() -> dict:
+    return {'ready_seconds': _ready, 'first_redirect_seconds': _first_redirect, **_warmup}
+
+
+def migrate(app: str) -> None:
+    """Create or upgrade the tables of app's database."""
+    if app == 'django':
+        sys.path.insert(0, str(ROOT / 'django_app'))
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_app.settings')
+        import django
+        from django.core.management import call_command
+        django.setup()
+        call_command('migrate', verbosity=0)
+    elif app == 'fastapi':
+        from fastapi_app.models import migrate as migrate_fastapi
+        migrate_fastapi()
+    elif app == 'flask':
+        from sqlalchemy import create_engine
+
+        from common.cli import database_url
+        from common.db import configure_engine, engine_options
+        from common.schema import upgrade_schema
+        from flask_app.models import db
+        url = database_url('flask')
+        engine = configure_engine(create_engine(url, **engine_options(url)))
+        try:
+            db.metadata.create_all(engine)
+            upgrade_schema(engine)
+        finally:
+            engine.dispose()
+    else:
+        raise ValueError(f'Unknown app: {app!r}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('command', choices=('migrate',))
+    parser.add_argument('--app', choices=('flask', 'django', 'fastapi'), required=True)
+    args = parser.parse_args(argv)
+    migrate(args.app)
+
+
+if __name__ == '__main__':
+    main()
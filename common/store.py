@@ -0,0 +1,536 @@
+"""
+Storage backends for shortened URLs behind one small interface.
+
+Every framework version reads and writes URLs through a Store, so the view
+code is the same whichever engine sits underneath:
+
+- ``sql`` (default): each app's own ORM and database
+  (common.sql_store.SQLAlchemyStore for Flask and FastAPI,
+  shortener.store.DjangoStore for Django).
+- ``memory``: plain dicts in the worker process. Nothing survives a restart;
+  meant for benchmarks and throwaway redirect nodes.
+- ``log``: the memory engine made durable by an append-only JSON-lines file.
+  The index is rebuilt by replaying the log on startup, and each process tails
+  the file for records other workers appended, so several workers can share
+  one log. Writers serialize on a lock on the file.
+- ``sharded``: the table split over several SQLite databases by consistent
+  hashing of the short code (common.sharding).
+
+Selected with STORE_BACKEND; the log lives in STORE_LOG_DIR. The memory and
+log engines only support the ``hash`` short code strategy, since the others
+reserve IDs from a SQL sequence table.
+
+Links may carry an expires_at (see common.expiry). Every engine hides expired
+links from redirects, revives them when their URL is shortened again and
+deletes them in batches for the sweeper.
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import islice
+
+from common import metrics, pagination
+from common.codes import CodeAllocationError
+from common.expiry import expired, live_target, naive_utc, utcnow
+from common.serializers import record_row, url_dict
+from common.shared_store import FileLock
+from common.utils import url_digest
+
+logger = logging.getLogger(__name__)
+
+STORE_BACKEND = os.environ.get('STORE_BACKEND', 'sql')
+STORE_LOG_DIR = os.environ.get('STORE_LOG_DIR', '.')
+STORE_LOG_FSYNC = os.environ.get('STORE_LOG_FSYNC', '0') == '1'
+
+# Plain-SQL insert for the paths that write many rows without the ORM (the
+# bulk import CLI and group commit); created_at is passed as DB_DATETIME_FORMAT
+# text, the naive-UTC form SQLAlchemy and Django store on SQLite.
+INSERT_URLS_SQL = (
+    'INSERT INTO shorten_url (original_url, url_hash, short_code, created_at, expires_at) '
+    'VALUES (:original_url, :url_hash, :short_code, :created_at, :expires_at) '
+    'ON CONFLICT DO NOTHING'
+)
+DB_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# One sweeper batch: the limit links with the oldest expires_at up to now,
+# found through the partial index on expires_at. The newest row is never
+# deleted: without AUTOINCREMENT SQLite would hand its id out again, and the
+# Bloom filter's incremental sync (ids above the last one seen) would miss
+# the row that reused it. Click counts go first, while their links still exist.
+EXPIRED_IDS_SQL = (
+    'SELECT id FROM shorten_url WHERE expires_at <= :now AND id < (SELECT MAX(id) FROM shorten_url) '
+    'ORDER BY expires_at, id LIMIT :limit'
+)
+DELETE_EXPIRED_CLICKS_SQL = (
+    'DELETE FROM shorten_url_clicks WHERE short_code IN '
+    f'(SELECT short_code FROM shorten_url WHERE id IN ({EXPIRED_IDS_SQL}))'
+)
+DELETE_EXPIRED_URLS_SQL = f'DELETE FROM shorten_url WHERE id IN ({EXPIRED_IDS_SQL}) RETURNING short_code'
+
+
+class DuplicateError(Exception):
+    """Raised by Store.insert when the short code or the URL is already stored."""
+
+
+class UrlRecord:
+    """A stored URL as returned by the memory and log engines (same shape as the ORM models)."""
+    __slots__ = ('id', 'original_url', 'url_hash', 'short_code', 'created_at', 'expires_at')
+
+    def __init__(self, id, original_url, url_hash, short_code, created_at, expires_at=None):
+        self.id = id
+        self.original_url = original_url
+        self.url_hash = url_hash
+        self.short_code = short_code
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+    def to_dict(self):
+        return url_dict(record_row(self))
+
+
+class Store:
+    """
+    Interface of a URL storage backend. Records expose id, original_url,
+    url_hash, short_code, created_at, expires_at and to_dict().
+    """
+
+    def get_by_code(self, code: str):
+        """The record for a short code, or None (expired or not)."""
+        raise NotImplementedError
+
+    def get_target(self, code: str):
+        """(original_url, expires_at) for a short code, or None if it is missing or expired (the redirect path)."""
+        record = self.get_by_code(code)
+        return live_target((record.original_url, record.expires_at) if record else None)
+
+    def get_original_url(self, code: str):
+        """Just the target URL of a live short code, or None."""
+        target = self.get_target(code)
+        return target[0] if target else None
+
+    def get_by_url(self, url: str):
+        """The record for an already shortened URL, or None."""
+        digest = url_digest(url)
+        return self.get_by_hashes([digest]).get(digest)
+
+    def get_by_hashes(self, digests) -> dict:
+        """{url_hash: record} for the digests that are stored."""
+        raise NotImplementedError
+
+    def taken_codes(self, codes) -> set:
+        """The subset of codes that are already in use."""
+        raise NotImplementedError
+
+    def insert(self, url: str, code: str, expires_at=None):
+        """Store url under code and return the new record. Raises DuplicateError."""
+        raise NotImplementedError
+
+    def renew(self, record, expires_at=None):
+        """Give a stored (typically expired) record a new expires_at and return it."""
+        raise NotImplementedError
+
+    def delete_expired(self, limit: int, now=None) -> list:
+        """Delete up to limit links expired by now in one transaction; return their short codes."""
+        raise NotImplementedError
+
+    def release(self) -> None:
+        """End any open read transaction so its pooled connection can be reused meanwhile."""
+
+    def insert_many(self, rows):
+        """
+        Insert rows ({'original_url', 'url_hash', 'short_code'} dicts, optionally
+        with 'expires_at') atomically.
+        Returns {url_hash: record}, or None if any code or URL was already taken.
+        """
+        raise NotImplementedError
+
+    def codes_after(self, after_id: int):
+        """(id, short_code) for every record with an id above after_id, in id order (lazily)."""
+        raise NotImplementedError
+
+    def iter_recent(self, cursor: str | None = None, limit: int | None = None):
+        """
+        Records newest first, starting after a pagination cursor; at most limit of
+        them, or all of them lazily when limit is None. Raises ValueError for a bad cursor.
+        """
+        raise NotImplementedError
+
+    def iter_recent_rows(self, cursor: str | None = None, limit: int | None = None):
+        """
+        Like iter_recent, but (id, original_url, short_code, created_at, expires_at)
+        tuples instead of records; engines backed by a database fetch only those columns.
+        """
+        return map(record_row, self.iter_recent(cursor, limit))
+
+    def version(self):
+        """
+        (tag, modified_at) for the stored links: tag changes whenever a link is
+        added, renewed or deleted, modified_at (naive UTC, or None) is when that
+        last happened. None when the engine keeps no version (common.http_cache).
+        """
+        return None
+
+
+def shorten(store: Store, generator, url: str, expires_at=None, flight=None):
+    """
+    Return (record, created) for url, reusing the record of an identical URL.
+    An identical URL whose link has expired (but is not swept yet) is revived
+    with expires_at and counts as created. Tries the generator's candidates in
+    turn and lets the store reject collisions; raises CodeAllocationError when
+    every candidate is taken.
+
+    With a common.singleflight.SingleFlight, concurrent calls for the same
+    url share one attempt: the caller that ran it gets created as usual, the
+    others get the same record with created False. The shared record is a
+    detached UrlRecord, since an ORM instance belongs to the session of the
+    thread that loaded it.
+    """
+    if flight is not None:
+        (record, created), shared = flight.do(url, _shorten_detached, store, generator, url, expires_at)
+        return record, created and not shared
+    with metrics.timed('shorten.dedupe_query'):
+        existing = store.get_by_url(url)
+    if existing:
+        if expired(existing.expires_at):
+            return store.renew(existing, expires_at), True
+        return existing, False
+    for code in metrics.timed_iter(generator.candidates(url), 'short_code'):
+        try:
+            with metrics.timed('shorten.commit'):
+                return store.insert(url, code, expires_at), True
+        except DuplicateError:
+            # Either the code collided or a concurrent request stored the same URL.
+            existing = store.get_by_url(url)
+            if existing:
+                return existing, False
+    raise CodeAllocationError('Could not allocate a short code')
+
+
+def _detached(record) -> UrlRecord:
+    return UrlRecord(record.id, record.original_url, record.url_hash, record.short_code, record.created_at,
+                     record.expires_at)
+
+
+def _shorten_detached(store: Store, generator, url: str, expires_at=None):
+    record, created = shorten(store, generator, url, expires_at)
+    return _detached(record), created
+
+
+async def ashorten(store, generator, url: str, expires_at=None, flight=None):
+    """
+    shorten() for a store with coroutine methods (common.sql_store.AsyncSQLAlchemyStore)
+    and a common.singleflight.AsyncSingleFlight. The shared attempt runs in a
+    session of its own (store.own_session()): it is a task that may outlive
+    the request that started it, whose session closes with that request.
+    """
+    if flight is not None:
+        (record, created), shared = await flight.do(url, _ashorten_detached, store, generator, url, expires_at)
+        return record, created and not shared
+    with metrics.timed('shorten.dedupe_query'):
+        existing = await store.get_by_url(url)
+    if existing:
+        if expired(existing.expires_at):
+            return await store.renew(existing, expires_at), True
+        return existing, False
+    for code in metrics.timed_iter(generator.candidates(url), 'short_code'):
+        try:
+            with metrics.timed('shorten.commit'):
+                return await store.insert(url, code, expires_at), True
+        except DuplicateError:
+            existing = await store.get_by_url(url)
+            if existing:
+                return existing, False
+    raise CodeAllocationError('Could not allocate a short code')
+
+
+async def _ashorten_detached(store, generator, url: str, expires_at=None):
+    async with store.own_session() as own:
+        record, created = await ashorten(own, generator, url, expires_at)
+        return _detached(record), created
+
+
+class MemoryStore(Store):
+    """Dict-backed store living in one process."""
+
+    def __init__(self):
+        self._by_code = {}
+        self._by_hash = {}
+        self._rows = []  # in id order, which is also insertion order; may hold deleted records
+        self._deleted = 0  # deleted records still in _rows, until the next compaction
+        self._expiring = []  # heap of (expires_at, id, short_code); stale entries are skipped
+        self._last_id = 0  # ids of deleted records are never handed out again
+        self._lock = threading.RLock()
+        # A fresh store restarts the count, so the tag also names this instance.
+        self._epoch = os.urandom(4).hex()
+        self._version = 0
+        self._modified_at = None
+
+    def _changed(self) -> None:
+        self._version += 1
+        self._modified_at = utcnow().replace(tzinfo=None)
+
+    def _add(self, record: UrlRecord) -> None:
+        self._by_code[record.short_code] = record
+        self._by_hash[record.url_hash] = record
+        self._rows.append(record)
+        self._last_id = max(self._last_id, record.id)
+        self._track_expiry(record)
+        self._changed()
+
+    def _track_expiry(self, record: UrlRecord) -> None:
+        if record.expires_at is not None:
+            heapq.heappush(self._expiring, (record.expires_at, record.id, record.short_code))
+
+    def _set_expiry(self, code: str, expires_at) -> None:
+        record = self._by_code.get(code)
+        if record is not None:
+            record.expires_at = expires_at
+            self._track_expiry(record)
+            self._changed()
+
+    def _remove(self, codes) -> None:
+        for code in codes:
+            record = self._by_code.pop(code, None)
+            if record is not None:
+                self._by_hash.pop(record.url_hash, None)
+                self._deleted += 1
+        # Deleted records stay in _rows as tombstones; rebuilding it only once
+        # they are half of it keeps a sweep of many small batches linear.
+        if self._deleted * 2 > len(self._rows):
+            self._rows = [record for record in self._rows if self._live(record)]
+            self._deleted = 0
+        self._changed()
+
+    def _live(self, record: UrlRecord) -> bool:
+        return self._by_code.get(record.short_code) is record
+
+    def _refresh(self) -> None:
+        """Hook for engines that can see records written elsewhere."""
+
+    def _new_records(self, rows) -> list:
+        next_id = self._last_id + 1
+        created_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        return [
+            UrlRecord(next_id + i, row['original_url'], row['url_hash'], row['short_code'], created_at,
+                      naive_utc(row.get('expires_at')))
+            for i, row in enumerate(rows)
+        ]
+
+    def _persist(self, records) -> None:
+        """Hook for durable engines; called under the write lock before records become visible."""
+
+    def _persist_change(self, entry: dict) -> None:
+        """Hook for durable engines: a renewal or deletion, called under the write lock before it applies."""
+
+    def get_by_code(self, code):
+        record = self._by_code.get(code)
+        if record is None:
+            self._refresh()
+            record = self._by_code.get(code)
+        return record
+
+    def get_by_hashes(self, digests):
+        self._refresh()
+        by_hash = self._by_hash
+        return {d: by_hash[d] for d in digests if d in by_hash}
+
+    def taken_codes(self, codes):
+        self._refresh()
+        return {code for code in codes if code in self._by_code}
+
+    def insert(self, url, code, expires_at=None):
+        digest = url_digest(url)
+        with self._write_lock():
+            if code in self._by_code or digest in self._by_hash:
+                raise DuplicateError(code)
+            [record] = self._new_records([
+                {'original_url': url, 'url_hash': digest, 'short_code': code, 'expires_at': expires_at},
+            ])
+            self._persist([record])
+            self._add(record)
+        return record
+
+    def renew(self, record, expires_at=None):
+        expires_at = naive_utc(expires_at)
+        with self._write_lock():
+            self._persist_change({'renew': record.short_code, 'expires_at': _isoformat(expires_at)})
+            self._set_expiry(record.short_code, expires_at)
+        return self._by_code.get(record.short_code, record)
+
+    def delete_expired(self, limit, now=None):
+        now = naive_utc(now or utcnow())
+        with self._write_lock():
+            heap = self._expiring
+            codes = []
+            while heap and heap[0][0] <= now and len(codes) < limit:
+                expires_at, row_id, code = heapq.heappop(heap)
+                record = self._by_code.get(code)
+                if record is not None and record.id == row_id and record.expires_at == expires_at:
+                    codes.append(code)  # otherwise deleted or renewed since it was pushed
+            if codes:
+                self._persist_change({'delete': codes})
+                self._remove(codes)
+        return codes
+
+    def insert_many(self, rows):
+        with self._write_lock():
+            codes = {row['short_code'] for row in rows}
+            digests = {row['url_hash'] for row in rows}
+            if (len(codes) < len(rows) or len(digests) < len(rows)
+                    or not codes.isdisjoint(self._by_code) or not digests.isdisjoint(self._by_hash)):
+                return None
+            records = self._new_records(rows)
+            self._persist(records)
+            for record in records:
+                self._add(record)
+        return {record.url_hash: record for record in records}
+
+    def codes_after(self, after_id):
+        self._refresh()
+        rows = self._rows
+        start = bisect_right(rows, after_id, key=lambda record: record.id)
+        return ((record.id, record.short_code) for record in rows[start:] if self._live(record))
+
+    def iter_recent(self, cursor=None, limit=None):
+        self._refresh()
+        rows = self._rows
+        end = len(rows)
+        if cursor:
+            _, row_id = pagination.decode_cursor(cursor)
+            end = bisect_left(rows, row_id, hi=end, key=lambda record: record.id)
+        recent = (rows[i] for i in range(end - 1, -1, -1) if self._live(rows[i]))
+        return recent if limit is None else islice(recent, limit)
+
+    def version(self):
+        self._refresh()
+        return f'{self._epoch}.{self._version}', self._modified_at
+
+    def _write_lock(self):
+        return self._lock
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _fromisoformat(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+class LogStore(MemoryStore):
+    """
+    MemoryStore persisted to an append-only log of JSON lines.
+    Opening the log replays it into memory (dropping a torn final line left by
+    a crash); afterwards the store only reads what other processes appended.
+    Besides one line per record, renewals ({"renew": code, "expires_at": ...})
+    and sweeper batches ({"delete": [codes]}) are logged as they happen.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        super().__init__()
+        self.path = path
+        self.fsync = fsync
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._offset = 0
+        with self._write_lock():
+            size = os.fstat(self._fd).st_size
+            if size != self._offset:
+                logger.warning('Truncating torn record at the end of %s', path)
+                os.ftruncate(self._fd, self._offset)
+
+    def _write_lock(self):
+        return _LockedLog(self)
+
+    def _refresh(self):
+        # A stat per call: cheap, and only reached on a miss or before a listing.
+        if os.fstat(self._fd).st_size != self._offset:
+            with self._lock:
+                self._catch_up()
+
+    def _catch_up(self):
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return
+        data = os.pread(self._fd, size - self._offset, self._offset)
+        end = data.rfind(b'\n') + 1  # a writer may be mid-line; leave it for next time
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+                if 'delete' in entry:
+                    self._remove(entry['delete'])
+                    continue
+                if 'renew' in entry:
+                    self._set_expiry(entry['renew'], _fromisoformat(entry['expires_at']))
+                    continue
+                record = UrlRecord(entry['id'], entry['url'], entry['hash'], entry['code'],
+                                   datetime.fromisoformat(entry['created_at']),
+                                   _fromisoformat(entry.get('expires_at')))
+            except (ValueError, KeyError):
+                logger.warning('Skipping corrupt record in %s', self.path)
+                continue
+            self._add(record)
+        self._offset += end
+
+    def _persist(self, records):
+        self._append([
+            {
+                'id': r.id, 'url': r.original_url, 'hash': r.url_hash, 'code': r.short_code,
+                'created_at': r.created_at.isoformat(), 'expires_at': _isoformat(r.expires_at),
+            }
+            for r in records
+        ])
+
+    def _persist_change(self, entry):
+        self._append([entry])
+
+    def _append(self, entries) -> None:
+        data = b''.join(json.dumps(entry, separators=(',', ':')).encode() + b'\n' for entry in entries)
+        os.write(self._fd, data)
+        if self.fsync:
+            os.fsync(self._fd)
+        self._offset += len(data)
+
+    def version(self):
+        # Every worker tailing the log agrees on its length, unlike on a count of its own.
+        self._refresh()
+        st = os.fstat(self._fd)
+        return f'{st.st_ino:x}.{self._offset}', datetime.fromtimestamp(st.st_mtime, timezone.utc).replace(tzinfo=None)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _LockedLog:
+    """Thread lock plus file lock for a LogStore write, catching up on other writers first."""
+
+    def __init__(self, store: LogStore):
+        self.store = store
+        self.file_lock = FileLock(store._fd, store._lock)
+
+    def __enter__(self):
+        self.file_lock.__enter__()
+        self.store._catch_up()
+
+    def __exit__(self, *exc):
+        self.file_lock.__exit__(*exc)
+
+
+def open_store(name: str):
+    """
+    The standalone store selected by STORE_BACKEND, or None for the default
+    ``sql`` backend, where each app builds a store over its own ORM session.
+    """
+    if STORE_BACKEND == 'sql':
+        return None
+    if STORE_BACKEND == 'memory':
+        return MemoryStore()
+    if STORE_BACKEND == 'log':
+        return LogStore(os.path.join(STORE_LOG_DIR, f'url-shortener-{name}.log'), STORE_LOG_FSYNC)
+    if STORE_BACKEND == 'sharded':
+        from common.sharding import open_sharded_store  # imports SQLAlchemy
+        return open_sharded_store(name)
+    raise ValueError(f'Unknown STORE_BACKEND: {STORE_BACKEND!r}')
@@ -2,8 +2,9 @@
 Shared utility functions for URL shortening across all framework versions.
 """
 import hashlib
-import re
-from urllib.parse import urlparse
+
+# Validation lives in common.validators; re-exported here for existing imports.
+from common.validators import is_valid_url, validate_many  # noqa: F401
 
 
 def short_code(url: str) -> str:
@@ -15,29 +16,9 @@ def short_code(url: str) -> str:
     return hash_value[:8]
 
 
-def is_valid_url(url: str) -> bool:
+def url_digest(url: str) -> str:
     """
-    Validate if the given string is a valid URL.
+    Return the fixed-width digest used to look up a URL by value.
+    SHA-256 hex, so it always fits the 64-character url_hash column.
     """
-    if not url or not isinstance(url, str):
-        return False
-    
-    url = url.strip()
-    if not url:
-        return False
-    
-    # Basic URL pattern
-    url_pattern = re.compile(
-        r'^https?://'  # http:// or https://
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain
-        r'localhost|'  # localhost
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # or IP
-        r'(?::\d+)?'  # optional port
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE
-    )
-    
-    try:
-        result = urlparse(url)
-        return all([result.scheme in ('http', 'https'), result.netloc, url_pattern.match(url)])
-    except Exception:
-        return False
+    return hashlib.sha256(url.encode()).hexdigest()
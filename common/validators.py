@@ -0,0 +1,59 @@
+"""
+URL validation shared by all framework versions.
+
+The pattern is compiled once at import. Cheap checks (type, length, scheme
+prefix, whitespace) run first so most invalid input is rejected without
+touching the regex.
+"""
+import re
+
+# Matches the original_url column width.
+MAX_URL_LENGTH = 2048
+
+_URL_PATTERN = re.compile(
+    r'^https?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain
+    r'localhost|'  # localhost
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # or IP
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE
+)
+_match = _URL_PATTERN.match
+_has_whitespace = re.compile(r'\s').search
+
+
+def is_valid_url(url) -> bool:
+    """
+    Validate if the given string is a valid http(s) URL.
+    Surrounding whitespace is ignored, as the views strip it before storing.
+    """
+    if not url or not isinstance(url, str):
+        return False
+    url = url.strip()
+    if not url or len(url) > MAX_URL_LENGTH:
+        return False
+    prefix = url[:8].lower()
+    if not (prefix.startswith('http://') or prefix == 'https://'):
+        return False
+    if _has_whitespace(url):
+        return False
+    return _match(url) is not None
+
+
+def validate_many(urls) -> list:
+    """
+    Validate a batch of URLs, returning one bool per input in order.
+    Repeated values are only validated once.
+    """
+    seen = {}
+    results = []
+    append = results.append
+    for url in urls:
+        try:
+            ok = seen[url]
+        except KeyError:
+            ok = seen[url] = is_valid_url(url)
+        except TypeError:  # unhashable input
+            ok = False
+        append(ok)
+    return results
@@ -9,6 +9,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 PROJECT_ROOT = BASE_DIR.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
+from common.db import CONN_MAX_AGE, SQLITE_PRAGMAS  # noqa: E402
+
 SECRET_KEY = 'django-insecure-dev-key-for-url-shortener'
 DEBUG = True
 ALLOWED_HOSTS = ['*']
@@ -20,6 +22,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shortener.middleware.FastRedirectMiddleware',
+    'shortener.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -32,7 +36,13 @@ WSGI_APPLICATION = 'django_app.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DJANGO_DB_PATH', BASE_DIR / 'db.sqlite3'),
+        # Keep connections open across requests; pragmas are applied once per
+        # connection by shortener.apps (see common.db).
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'OPTIONS': {
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
     }
 }
 
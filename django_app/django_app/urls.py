@@ -6,7 +6,10 @@ from shortener import views
 
 urlpatterns = [
     path('', views.home),
+    path('metrics', views.metrics_endpoint),
     path('api/urls', views.get_all_urls),
+    path('api/urls/<str:code>/stats', views.url_stats),
     path('api/shorten', views.shorten_url),
+    path('api/shorten/batch', views.shorten_url_batch),
     path('<str:code>', views.redirect_to_original),
 ]
@@ -1,8 +1,22 @@
 """
 WSGI config for django_app project.
+
+Cached redirects are answered by common.fast_redirect before Django builds a
+request; FastRedirectMiddleware covers the same case for the test client.
+Loading this module is also where a serving process runs its optional warmup
+(common.startup); migrations stay with manage.py migrate.
 """
 import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_app.settings')
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+from common import startup  # noqa: E402 (needs settings loaded)
+from common.fast_redirect import FastRedirectWSGI  # noqa: E402
+from shortener.views import (  # noqa: E402
+    click_recorder, code_filter, expiry_sweeper, redirect_cache, warmup_urls,
+)
+
+application = FastRedirectWSGI(django_application, redirect_cache, click_recorder, 'django', '/<str:code>')
+startup.start(None, redirect_cache, code_filter, warmup_urls, expiry_sweeper)
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def _tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        from common.db import apply_pragmas
+        apply_pragmas(connection.connection)
 
 
 class ShortenerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shortener'
+
+    def ready(self):
+        connection_created.connect(_tune_sqlite, dispatch_uid='shortener.tune_sqlite')
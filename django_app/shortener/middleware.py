@@ -0,0 +1,67 @@
+"""
+Middleware for Django URL shortener.
+"""
+from time import perf_counter
+
+from django.http import HttpResponse
+
+from common import fast_redirect, http_cache, metrics, startup
+
+
+class MetricsMiddleware:
+    """Time every request into common.metrics, labelled by URL pattern rather than raw path."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics.enabled():
+            return self.get_response(request)
+        started = perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        route = '/' + match.route if match else 'unmatched'
+        metrics.observe_request('django', request.method, route, response.status_code, perf_counter() - started)
+        return response
+
+
+class CachedRedirect(HttpResponse):
+    """
+    Redirect (302 unless common.http_cache says otherwise) with a pre-encoded
+    Location. Skips HttpResponseRedirect's IRI conversion and scheme check,
+    which stored URLs passed when they were shortened.
+    """
+    status_code = 302
+    url = property(lambda self: self['Location'])
+
+
+class FastRedirectMiddleware:
+    """
+    Answer GET /<code> for cached codes with a bare redirect before URL resolution,
+    the remaining middleware and the view run (see common.fast_redirect).
+    Must be first in MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        from shortener.views import click_recorder, redirect_cache
+        self.get_response = get_response
+        self.cache = redirect_cache
+        self.recorder = click_recorder
+
+    def __call__(self, request):
+        if fast_redirect.enabled() and request.method == 'GET':
+            started = perf_counter() if metrics.enabled() else None
+            code, url = fast_redirect.cached_target(self.cache, request.path_info)
+            if url is not None:
+                response = CachedRedirect(
+                    status=http_cache.redirect_status(url), headers=http_cache.redirect_headers(url)
+                )
+                response.headers['Location'] = fast_redirect.location(url)
+                self.recorder.record(code)
+                startup.mark_redirect()
+                if started is not None:
+                    metrics.observe_request(
+                        'django', 'GET', '/<str:code>', response.status_code, perf_counter() - started
+                    )
+                return response
+        return self.get_response(request)
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+from common.schema import RETAG_DUPLICATE_HASHES_SQL
+from common.utils import url_digest
+
+
+def backfill_url_hash(apps, schema_editor):
+    ShortenUrl = apps.get_model('shortener', 'ShortenUrl')
+    batch = []
+    for record in ShortenUrl.objects.filter(url_hash__isnull=True).only('id', 'original_url').iterator():
+        record.url_hash = url_digest(record.original_url)
+        batch.append(record)
+        if len(batch) >= 1000:
+            ShortenUrl.objects.bulk_update(batch, ['url_hash'])
+            batch = []
+    if batch:
+        ShortenUrl.objects.bulk_update(batch, ['url_hash'])
+    # Rows shortened more than once before dedupe existed would break the unique constraint below.
+    schema_editor.execute(RETAG_DUPLICATE_HASHES_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortenurl',
+            name='url_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_url_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='shortenurl',
+            name='url_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-17 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0002_shortenurl_url_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shortenurl',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
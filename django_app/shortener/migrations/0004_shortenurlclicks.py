@@ -0,0 +1,25 @@
+# Generated by Django 6.1.2 on 2026-10-17 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0003_shortenurl_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShortenUrlClicks',
+            fields=[
+                ('short_code', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('clicks', models.IntegerField(default=0)),
+                ('first_clicked_at', models.DateTimeField(null=True)),
+                ('last_clicked_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'shorten_url_clicks',
+            },
+        ),
+    ]
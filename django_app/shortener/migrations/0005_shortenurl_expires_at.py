@@ -0,0 +1,22 @@
+# Generated by Django 6.1.2 on 2026-10-17 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0004_shortenurlclicks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortenurl',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='shortenurl',
+            index=models.Index(condition=models.Q(('expires_at__isnull', False)), fields=['expires_at'], name='ix_shorten_url_expires_at'),
+        ),
+    ]
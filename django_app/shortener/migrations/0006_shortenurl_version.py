@@ -0,0 +1,15 @@
+from django.db import migrations
+
+from common.http_cache import CREATE_URL_VERSION_SQL, DROP_URL_VERSION_SQL
+
+
+# The trigger-maintained table version behind the listing ETags (see common.http_cache).
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0005_shortenurl_expires_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(list(CREATE_URL_VERSION_SQL), reverse_sql=list(DROP_URL_VERSION_SQL)),
+    ]
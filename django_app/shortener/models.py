@@ -2,21 +2,38 @@
 Models for Django URL shortener.
 """
 from django.db import models
+from django.db.models import Q
+
+from common.serializers import record_row, url_dict
 
 
 class ShortenUrl(models.Model):
     """Model for storing shortened URL details."""
     original_url = models.CharField(max_length=2048)
+    url_hash = models.CharField(max_length=64, unique=True)
     short_code = models.CharField(max_length=50, unique=True, db_index=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'shorten_url'
+        # Same partial index as the SQLAlchemy models create.
+        indexes = [
+            models.Index(
+                fields=['expires_at'], name='ix_shorten_url_expires_at', condition=Q(expires_at__isnull=False),
+            ),
+        ]
 
     def to_dict(self):
-        return {
-            'id': self.id,
-            'original_url': self.original_url,
-            'short_code': self.short_code,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-        }
+        return url_dict(record_row(self))
+
+
+class ShortenUrlClicks(models.Model):
+    """Aggregated click counts per short code, upserted by common.clicks."""
+    short_code = models.CharField(max_length=50, primary_key=True)
+    clicks = models.IntegerField(default=0)
+    first_clicked_at = models.DateTimeField(null=True)
+    last_clicked_at = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = 'shorten_url_clicks'
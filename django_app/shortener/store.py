@@ -0,0 +1,90 @@
+"""
+Django ORM implementation of common.store.Store.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+
+from common import pagination
+from common.batch import IN_CHUNK_SIZE
+from common.expiry import live_target, naive_utc, utcnow
+from common.http_cache import URL_VERSION_SQL, url_version
+from common.serializers import URL_COLUMNS
+from common.store import DB_DATETIME_FORMAT, DELETE_EXPIRED_CLICKS_SQL, DELETE_EXPIRED_URLS_SQL, DuplicateError, Store
+from common.utils import url_digest
+from shortener.models import ShortenUrl
+
+
+class DjangoStore(Store):
+    """Store over the shortener.ShortenUrl model."""
+
+    def get_by_code(self, code):
+        return ShortenUrl.objects.filter(short_code=code).first()
+
+    def get_target(self, code):
+        return live_target(ShortenUrl.objects.filter(short_code=code).values_list('original_url', 'expires_at').first())
+
+    def get_by_hashes(self, digests):
+        return {r.url_hash: r for r in ShortenUrl.objects.filter(url_hash__in=digests)}
+
+    def taken_codes(self, codes):
+        return set(ShortenUrl.objects.filter(short_code__in=codes).values_list('short_code', flat=True))
+
+    def insert(self, url, code, expires_at=None):
+        try:
+            with transaction.atomic():
+                return ShortenUrl.objects.create(original_url=url, url_hash=url_digest(url), short_code=code,
+                                                 expires_at=expires_at)
+        except IntegrityError:
+            raise DuplicateError(code) from None
+
+    def renew(self, record, expires_at=None):
+        record.expires_at = expires_at
+        record.save(update_fields=['expires_at'])
+        return record
+
+    def delete_expired(self, limit, now=None):
+        params = {'now': naive_utc(now or utcnow()).strftime(DB_DATETIME_FORMAT), 'limit': limit}
+        # Django's cursor uses pyformat placeholders rather than SQLAlchemy's :name.
+        clicks_sql, urls_sql = (
+            sql.replace(':now', '%(now)s').replace(':limit', '%(limit)s')
+            for sql in (DELETE_EXPIRED_CLICKS_SQL, DELETE_EXPIRED_URLS_SQL)
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(clicks_sql, params)
+            cursor.execute(urls_sql, params)
+            return [code for code, in cursor.fetchall()]
+
+    def insert_many(self, rows):
+        try:
+            with transaction.atomic():
+                created = ShortenUrl.objects.bulk_create([ShortenUrl(**row) for row in rows], batch_size=IN_CHUNK_SIZE)
+        except IntegrityError:
+            return None
+        return {r.url_hash: r for r in created}
+
+    def codes_after(self, after_id):
+        rows = ShortenUrl.objects.filter(id__gt=after_id).order_by('id').values_list('id', 'short_code')
+        return rows.iterator(chunk_size=pagination.STREAM_CHUNK_SIZE)
+
+    def _recent(self, cursor):
+        urls = ShortenUrl.objects.order_by('-created_at', '-id')
+        if cursor:
+            created_at, row_id = pagination.decode_cursor(cursor)
+            urls = urls.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=row_id))
+        return urls
+
+    def iter_recent(self, cursor=None, limit=None):
+        return self._slice(self._recent(cursor), limit)
+
+    def iter_recent_rows(self, cursor=None, limit=None):
+        return self._slice(self._recent(cursor).values_list(*URL_COLUMNS, named=True), limit)
+
+    def version(self):
+        with connection.cursor() as cursor:
+            cursor.execute(URL_VERSION_SQL)
+            return url_version(cursor.fetchone())
+
+    def _slice(self, urls, limit):
+        if limit is None:
+            return urls.iterator(chunk_size=pagination.STREAM_CHUNK_SIZE)
+        return iter(list(urls[:limit]))
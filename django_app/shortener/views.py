@@ -1,58 +1,176 @@
 """
 Views for Django URL shortener.
 """
-import time
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
 
-from django.http import JsonResponse, HttpResponseRedirect, HttpResponse
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 
-from common.utils import short_code, is_valid_url
-from shortener.models import ShortenUrl
+from common import batch, compression, http_cache, metrics, pagination, serializers, startup
+from common.bloom import make_code_filter
+from common.cache import cache_redirect, make_redirect_cache, cached_redirect_lookup
+from common.clicks import UPSERT_CLICKS_SQL, click_stats, make_click_recorder
+from common.codes import CodeAllocationError, RESERVE_BLOCK_SQL, SEQUENCE_TABLE_SQL, make_code_generator
+from common.expiry import make_expiry_sweeper, parse_expires_in
+from common.group_commit import claimed, make_group_committer, with_group_commit
+from common.home_page import HOME_PAGE_SIZE, iter_home_page
+from common.singleflight import make_single_flight
+from common.store import INSERT_URLS_SQL, open_store, shorten
+from common.validators import is_valid_url
+from shortener.models import ShortenUrl, ShortenUrlClicks
+from shortener.store import DjangoStore
+
+redirect_cache = make_redirect_cache('django')
+
+
+def _write_urls(rows):
+    """Insert a group of new URLs in one transaction (runs on the group commit thread)."""
+    sql = INSERT_URLS_SQL
+    for name in ('original_url', 'url_hash', 'short_code', 'created_at', 'expires_at'):
+        sql = sql.replace(f':{name}', f'%({name})s')
+    with transaction.atomic():
+        inserted = []
+        with connection.cursor() as cursor:
+            for row in rows:
+                cursor.execute(sql, row)
+                inserted.append(cursor.rowcount)
+        stored = ShortenUrl.objects.in_bulk([row['url_hash'] for row in rows], field_name='url_hash')
+    return claimed(rows, inserted, stored)
+
+
+def _query_rows(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchall()
+
+
+url_committer = make_group_committer(_write_urls)
+metrics.register_gauges('url_shortener_group_commit', url_committer.stats, 'django')
+standalone_store = open_store('django')
+store = standalone_store or with_group_commit(DjangoStore(), url_committer)
+warmup_urls = (
+    startup.store_warmup_urls(standalone_store) if standalone_store
+    else lambda limit: startup.warmup_urls(_query_rows, limit)
+)
+metrics.register_gauges('url_shortener_startup', startup.stats, 'django')
+code_filter = make_code_filter(lambda after_id: store.codes_after(after_id))
+metrics.register_gauges('url_shortener_bloom', code_filter.stats, 'django')
+redirect_flight = make_single_flight()
+metrics.register_gauges('url_shortener_redirect_flight', redirect_flight.stats, 'django')
+shorten_flight = make_single_flight()
+metrics.register_gauges('url_shortener_shorten_flight', shorten_flight.stats, 'django')
+list_snapshots = compression.make_list_snapshots()
+metrics.register_gauges('url_shortener_list_snapshot', list_snapshots.stats, 'django')
+expiry_sweeper = make_expiry_sweeper(store.delete_expired, redirect_cache.delete)
+metrics.register_gauges('url_shortener_expiry', expiry_sweeper.stats, 'django')
+
+
+def _reserve_block(size):
+    """Reserve size short code IDs from the shared sequence table."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(SEQUENCE_TABLE_SQL)
+        # Django's cursor uses pyformat placeholders rather than SQLAlchemy's :name.
+        cursor.execute(RESERVE_BLOCK_SQL.replace(':size', '%(size)s'), {'size': size})
+        return cursor.fetchone()[0]
+
+
+code_generator = make_code_generator(_reserve_block)
+
+
+def _write_clicks(rows):
+    """Upsert aggregated click counts (runs on the click flusher thread)."""
+    sql = UPSERT_CLICKS_SQL
+    for name in ('short_code', 'clicks', 'first_clicked_at', 'last_clicked_at'):
+        sql = sql.replace(f':{name}', f'%({name})s')
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+click_recorder = make_click_recorder(_write_clicks)
 
 
 @require_http_methods(["GET"])
 def home(request):
-    """Home page with API documentation and shortened URLs."""
+    """Home page with API documentation and one bounded window of recent URLs."""
     base = request.build_absolute_uri('/').rstrip('/')
-    urls = ShortenUrl.objects.all().order_by('-created_at')
-    url_rows = ''.join(
-        f'<tr><td>{u.short_code}</td><td><a href="{u.original_url}" target="_blank">{u.original_url[:60]}{"..." if len(u.original_url) > 60 else ""}</a></td><td><a href="{base}/{u.short_code}">{base}/{u.short_code}</a></td></tr>'
-        for u in urls
-    ) or '<tr><td colspan="3">No shortened URLs yet.</td></tr>'
-    html = f'''<!DOCTYPE html>
-<html>
-<head><meta charset="utf-8"><title>URL Shortener - Django</title>
-<style>body{{font-family:system-ui,sans-serif;max-width:800px;margin:2rem auto;padding:0 1rem}}h1{{color:#333}}code{{background:#f4f4f4;padding:2px 6px;border-radius:4px}}table{{width:100%;border-collapse:collapse}}th,td{{padding:8px;text-align:left;border-bottom:1px solid #ddd}}th{{background:#f8f8f8}}</style>
-</head>
-<body>
-<h1>🔗 URL Shortener API</h1>
-<p><strong>Framework:</strong> Django</p>
-<p>Shorten long URLs and redirect using compact short codes. Built with Django, Django ORM, and SQLite.</p>
-
-<h2>Available API Endpoints</h2>
-<table>
-<tr><th>Method</th><th>Endpoint</th><th>Description</th></tr>
-<tr><td><code>GET</code></td><td><a href="{base}/api/urls">{base}/api/urls</a></td><td>Get all shortened URLs (JSON)</td></tr>
-<tr><td><code>POST</code></td><td><a href="{base}/api/shorten">{base}/api/shorten</a></td><td>Shorten a URL (body: {"{ \"url\": \"https://example.com\" }"})</td></tr>
-<tr><td><code>GET</code></td><td><code>{base}/&#123;short_code&#125;</code></td><td>Redirect to original URL</td></tr>
-</table>
-
-<h2>Shortened URLs</h2>
-<table><tr><th>Short Code</th><th>Original URL</th><th>Short Link</th></tr>{url_rows}</table>
-</body>
-</html>'''
-    return HttpResponse(html)
+    version = store.version()
+    validators = http_cache.list_validators(version)
+    if http_cache.not_modified(validators, request.headers):
+        return HttpResponseNotModified(headers=validators)
+    cursor = request.GET.get('cursor')
+    accept_encoding = request.headers.get('Accept-Encoding')
+    if cursor:
+        body, headers = compression.encode_stream(_home_page(base, cursor), accept_encoding)
+        return StreamingHttpResponse(body, content_type='text/html; charset=utf-8', headers={**validators, **headers})
+    snapshot = list_snapshots.get(('home', base), version, lambda: (''.join(_home_page(base, None)).encode(), {}))
+    body, headers = list_snapshots.encode(snapshot, accept_encoding)
+    return HttpResponse(body, content_type='text/html; charset=utf-8', headers={**validators, **headers})
+
+
+def _home_page(base, cursor):
+    """The chunks of the home page window at cursor."""
+    try:
+        urls = store.iter_recent(cursor, HOME_PAGE_SIZE + 1)
+    except ValueError:
+        # A stale or hand-edited cursor just lands on the newest page.
+        cursor, urls = None, store.iter_recent(None, HOME_PAGE_SIZE + 1)
+    page, next_cursor = pagination.split_page(list(urls), HOME_PAGE_SIZE)
+    return iter_home_page('Django', 'Django, Django ORM', base, page, next_cursor, not cursor)
+
+
+@require_http_methods(["GET"])
+def metrics_endpoint(request):
+    """Request and hot-path timings in the Prometheus text format."""
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @require_http_methods(["GET"])
 def get_all_urls(request):
-    """Get all created shortened URLs."""
-    urls = ShortenUrl.objects.all().order_by('-created_at')
-    return JsonResponse([url.to_dict() for url in urls], safe=False)
+    """
+    Get created shortened URLs, newest first, one keyset page at a time.
+    ?limit=N&cursor=C pages through results; ?stream=json|ndjson streams every row.
+    """
+    version = store.version()
+    validators = http_cache.list_validators(version)
+    if http_cache.not_modified(validators, request.headers):
+        return HttpResponseNotModified(headers=validators)
+    stream = request.GET.get('stream')
+    if stream and stream not in pagination.STREAM_FORMATS:
+        return JsonResponse({'message': 'stream must be json or ndjson'}, status=400)
+    cursor = request.GET.get('cursor')
+    accept_encoding = request.headers.get('Accept-Encoding')
+    try:
+        limit = pagination.parse_limit(request.GET.get('limit'))
+        if stream:
+            with metrics.timed('list.db_query'):
+                rows = store.iter_recent_rows(cursor, None)
+        elif cursor:
+            body, headers = compression.encode_body(*_urls_page(cursor, limit), accept_encoding)
+        else:
+            snapshot = list_snapshots.get(('urls', limit), version, lambda: _urls_page(None, limit))
+            body, headers = list_snapshots.encode(snapshot, accept_encoding)
+    except ValueError as exc:
+        return JsonResponse({'message': str(exc)}, status=400)
+
+    if stream:
+        content_type, body = pagination.stream_body(stream, serializers.stream_dicts(rows))
+        body, headers = compression.encode_stream(body, accept_encoding)
+        return StreamingHttpResponse(body, content_type=content_type, headers={**validators, **headers})
+    return HttpResponse(body, content_type=serializers.CONTENT_TYPE, headers={**validators, **headers})
+
+
+def _urls_page(cursor, limit):
+    """(body, headers) of one /api/urls page. Raises ValueError for a bad cursor."""
+    with metrics.timed('list.db_query'):
+        rows = store.iter_recent_rows(cursor, limit + 1)
+    page, next_cursor = pagination.split_page(list(rows), limit)
+    with metrics.timed('serialize'):
+        body = serializers.encode_urls(page)
+    return body, {pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
 
 
 @csrf_exempt
@@ -70,26 +188,78 @@ def shorten_url(request):
         return JsonResponse({'message': 'URL is required'}, status=400)
 
     url = str(url).strip()
-    if not is_valid_url(url):
+    with metrics.timed('validate'):
+        valid = is_valid_url(url)
+    if not valid:
         return JsonResponse({'message': 'Invalid or unavailable URL'}, status=400)
+    try:
+        expires_at = parse_expires_in(data.get('expires_in'))
+    except ValueError as exc:
+        return JsonResponse({'message': str(exc)}, status=400)
+
+    try:
+        record, created = shorten(store, code_generator, url, expires_at, shorten_flight)
+    except CodeAllocationError as exc:
+        return JsonResponse({'message': str(exc)}, status=503)
+    if created:
+        cache_redirect(redirect_cache, record.short_code, url, expires_at)
+        code_filter.add(record.short_code)
+    with metrics.timed('serialize'):
+        return HttpResponse(serializers.encode_url(record), content_type=serializers.CONTENT_TYPE, status=201)
 
-    existing = ShortenUrl.objects.filter(original_url=url).first()
-    if existing:
-        return JsonResponse(existing.to_dict(), status=201)
 
-    code = short_code(url)
-    while ShortenUrl.objects.filter(short_code=code).exists():
-        code = short_code(url + str(time.time()))[:8]
+@csrf_exempt
+@require_http_methods(["POST"])
+def shorten_url_batch(request):
+    """
+    Shorten many URLs at once. Body is a JSON array, {"urls": [...]} or NDJSON.
+    Returns 200 with one result per input URL, in input order.
+    """
+    try:
+        items = batch.parse_batch_body(request.body, request.content_type)
+    except ValueError as exc:
+        return JsonResponse({'message': str(exc)}, status=400)
 
-    record = ShortenUrl.objects.create(original_url=url, short_code=code)
-    return JsonResponse(record.to_dict(), status=201)
+    try:
+        results = batch.shorten_batch_in_store(store, items, code_generator)
+    except CodeAllocationError as exc:
+        return JsonResponse({'message': str(exc)}, status=503)
+    for result in results:
+        if result.get('created'):
+            redirect_cache.set(result['short_code'], result['original_url'])
+            code_filter.add(result['short_code'])
+    return JsonResponse(results, safe=False)
 
 
 @require_http_methods(["GET"])
 def redirect_to_original(request, code):
     """Redirect short code to original URL."""
-    try:
-        record = ShortenUrl.objects.get(short_code=code)
-    except ShortenUrl.DoesNotExist:
+    with metrics.timed('redirect.lookup'):
+        url = cached_redirect_lookup(redirect_cache, code, _load_target, code_filter, redirect_flight)
+    if url is None:
+        return JsonResponse({'message': 'Short URL not found'}, status=404)
+    click_recorder.record(code)
+    startup.mark_redirect()
+    return HttpResponseRedirect(url, status=http_cache.redirect_status(url), headers=http_cache.redirect_headers(url))
+
+
+@require_http_methods(["GET"])
+def url_stats(request, code):
+    """Click count and first/last click time for a short code (updated by the background flusher)."""
+    url = _load_original_url(code)
+    if url is None:
         return JsonResponse({'message': 'Short URL not found'}, status=404)
-    return HttpResponseRedirect(record.original_url, status=302)
+    stats = ShortenUrlClicks.objects.filter(short_code=code).first()
+    if stats is None:
+        return JsonResponse(click_stats(code, url))
+    return JsonResponse(click_stats(code, url, stats.clicks, stats.first_clicked_at, stats.last_clicked_at))
+
+
+def _load_target(code):
+    with metrics.timed('redirect.db_query'):
+        return store.get_target(code)
+
+
+def _load_original_url(code):
+    target = _load_target(code)
+    return target[0] if target else None
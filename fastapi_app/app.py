@@ -2,99 +2,260 @@
 FastAPI URL Shortener Application
 """
 import sys
-import time
 import os
+from contextlib import asynccontextmanager
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from common.utils import short_code, is_valid_url
-from fastapi_app.models import ShortenUrl, get_db
+from common import batch, compression, http_cache, metrics, pagination, serializers, startup
+from common.bloom import make_code_filter, sqlalchemy_code_fetcher
+from common.cache import cache_redirect, make_redirect_cache, cached_redirect_lookup
+from common.clicks import click_stats, make_click_recorder, sqlalchemy_click_writer
+from common.codes import CodeAllocationError, make_code_generator, sqlalchemy_block_reserver
+from common.expiry import make_expiry_sweeper, parse_expires_in, sqlalchemy_expiry_deleter
+from common.fast_redirect import FastRedirectASGI
+from common.group_commit import make_group_committer, sqlalchemy_url_writer, with_group_commit
+from common.home_page import HOME_PAGE_SIZE, iter_home_page
+from common.singleflight import make_single_flight
+from common.sql_store import SQLAlchemyStore
+from common.store import Store, open_store, shorten
+from common.validators import is_valid_url
+from fastapi_app.models import ShortenUrl, ShortenUrlClicks, engine, get_db, migrate
 
-app = FastAPI(title="URL Shortener API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Schema step, optional warmup and the sweeper before the first request (see common.startup)."""
+    await run_in_threadpool(startup.start, migrate, redirect_cache, code_filter, warmup_urls, expiry_sweeper)
+    yield
+
+
+app = FastAPI(title="URL Shortener API", lifespan=lifespan)
+app.add_middleware(metrics.ASGIMetricsMiddleware, framework="fastapi")
+redirect_cache = make_redirect_cache('fastapi')
+standalone_store = open_store('fastapi')
+code_generator = make_code_generator(sqlalchemy_block_reserver(lambda: engine))
+click_recorder = make_click_recorder(sqlalchemy_click_writer(lambda: engine))
+code_filter = make_code_filter(
+    standalone_store.codes_after if standalone_store else sqlalchemy_code_fetcher(lambda: engine, ShortenUrl)
+)
+metrics.register_gauges("url_shortener_bloom", code_filter.stats, "fastapi")
+redirect_flight = make_single_flight()
+metrics.register_gauges("url_shortener_redirect_flight", redirect_flight.stats, "fastapi")
+shorten_flight = make_single_flight()
+metrics.register_gauges("url_shortener_shorten_flight", shorten_flight.stats, "fastapi")
+list_snapshots = compression.make_list_snapshots()
+metrics.register_gauges("url_shortener_list_snapshot", list_snapshots.stats, "fastapi")
+url_committer = make_group_committer(sqlalchemy_url_writer(lambda: engine, ShortenUrl))
+metrics.register_gauges("url_shortener_group_commit", url_committer.stats, "fastapi")
+warmup_urls = (
+    startup.store_warmup_urls(standalone_store) if standalone_store else startup.sqlalchemy_warmup_urls(lambda: engine)
+)
+metrics.register_gauges("url_shortener_startup", startup.stats, "fastapi")
+expiry_sweeper = make_expiry_sweeper(
+    standalone_store.delete_expired if standalone_store else sqlalchemy_expiry_deleter(lambda: engine, ShortenUrl),
+    redirect_cache.delete,
+)
+metrics.register_gauges("url_shortener_expiry", expiry_sweeper.stats, "fastapi")
+# Added last so it runs first: cached redirects never reach the router.
+app.add_middleware(FastRedirectASGI, cache=redirect_cache, recorder=click_recorder)
+
+
+def get_store(db: Session = Depends(get_db)) -> Store:
+    """The STORE_BACKEND store, or one over this request's session."""
+    return standalone_store or with_group_commit(SQLAlchemyStore(db, ShortenUrl), url_committer)
+
+
+def _home_page(store: Store, base: str, cursor: str | None):
+    """The chunks of the home page window at cursor."""
+    try:
+        urls = store.iter_recent(cursor, HOME_PAGE_SIZE + 1)
+    except ValueError:
+        # A stale or hand-edited cursor just lands on the newest page.
+        cursor, urls = None, store.iter_recent(None, HOME_PAGE_SIZE + 1)
+    urls, next_cursor = pagination.split_page(list(urls), HOME_PAGE_SIZE)
+    return iter_home_page('FastAPI', 'FastAPI, SQLAlchemy', base, urls, next_cursor, not cursor)
 
 
 @app.get("/", response_class=HTMLResponse)
-def home(request: Request, db: Session = Depends(get_db)):
-    """Home page with API documentation and shortened URLs."""
+def home(request: Request, cursor: str | None = None, store: Store = Depends(get_store)):
+    """Home page with API documentation and one bounded window of recent URLs."""
     base = str(request.base_url).rstrip('/')
-    urls = db.query(ShortenUrl).order_by(ShortenUrl.created_at.desc()).all()
-    url_rows = ''.join(
-        f'<tr><td>{u.short_code}</td><td><a href="{u.original_url}" target="_blank">{u.original_url[:60]}{"..." if len(u.original_url) > 60 else ""}</a></td><td><a href="{base}/{u.short_code}">{base}/{u.short_code}</a></td></tr>'
-        for u in urls
-    ) or '<tr><td colspan="3">No shortened URLs yet.</td></tr>'
-    return f'''<!DOCTYPE html>
-<html>
-<head><meta charset="utf-8"><title>URL Shortener - FastAPI</title>
-<style>body{{font-family:system-ui,sans-serif;max-width:800px;margin:2rem auto;padding:0 1rem}}h1{{color:#333}}code{{background:#f4f4f4;padding:2px 6px;border-radius:4px}}table{{width:100%;border-collapse:collapse}}th,td{{padding:8px;text-align:left;border-bottom:1px solid #ddd}}th{{background:#f8f8f8}}</style>
-</head>
-<body>
-<h1>🔗 URL Shortener API</h1>
-<p><strong>Framework:</strong> FastAPI</p>
-<p>Shorten long URLs and redirect using compact short codes. Built with FastAPI, SQLAlchemy, and SQLite.</p>
-
-<h2>Available API Endpoints</h2>
-<table>
-<tr><th>Method</th><th>Endpoint</th><th>Description</th></tr>
-<tr><td><code>GET</code></td><td><a href="{base}/api/urls">{base}/api/urls</a></td><td>Get all shortened URLs (JSON)</td></tr>
-<tr><td><code>POST</code></td><td><a href="{base}/api/shorten">{base}/api/shorten</a></td><td>Shorten a URL (body: {"{ \"url\": \"https://example.com\" }"})</td></tr>
-<tr><td><code>GET</code></td><td><code>{base}/&#123;short_code&#125;</code></td><td>Redirect to original URL</td></tr>
-</table>
-
-<h2>Shortened URLs</h2>
-<table><tr><th>Short Code</th><th>Original URL</th><th>Short Link</th></tr>{url_rows}</table>
-</body>
-</html>'''
+    version = store.version()
+    validators = http_cache.list_validators(version)
+    if http_cache.not_modified(validators, request.headers):
+        return Response(status_code=304, headers=validators)
+    accept_encoding = request.headers.get("accept-encoding")
+    if cursor:
+        body, headers = compression.encode_stream(_home_page(store, base, cursor), accept_encoding)
+        return StreamingResponse(body, media_type="text/html; charset=utf-8", headers={**validators, **headers})
+    snapshot = list_snapshots.get(
+        ("home", base), version, lambda: ("".join(_home_page(store, base, None)).encode(), {})
+    )
+    body, headers = list_snapshots.encode(snapshot, accept_encoding)
+    return Response(body, media_type="text/html; charset=utf-8", headers={**validators, **headers})
 
 
-class ShortenRequest(BaseModel):
-    url: str
+@app.get("/metrics")
+def metrics_endpoint():
+    """Request and hot-path timings in the Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
-@app.get("/api/urls")
-def get_all_urls(db: Session = Depends(get_db)):
-    """Get all created shortened URLs."""
-    urls = db.query(ShortenUrl).order_by(ShortenUrl.created_at.desc()).all()
-    return [url.to_dict() for url in urls]
+class ShortenRequest(BaseModel):
+    url: str
+    expires_in: int | None = None
 
 
-@app.post("/api/shorten", status_code=201)
-def shorten_url(data: ShortenRequest, db: Session = Depends(get_db)):
-    """Shorten a URL and save to database. Returns 201 on success, 400 on error."""
+def _validated_url(data: ShortenRequest) -> str:
+    """Return the stripped URL from a shorten request, or raise a 400."""
     url = data.url.strip() if data.url else ""
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
-
-    if not is_valid_url(url):
+    with metrics.timed("validate"):
+        valid = is_valid_url(url)
+    if not valid:
         raise HTTPException(status_code=400, detail="Invalid or unavailable URL")
+    return url
+
+
+def _expires_at(data: ShortenRequest):
+    """The expires_at requested by a shorten request (None for never), or raise a 400."""
+    try:
+        return parse_expires_in(data.expires_in)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-    existing = db.query(ShortenUrl).filter(ShortenUrl.original_url == url).first()
-    if existing:
-        return existing.to_dict()
 
-    code = short_code(url)
-    while db.query(ShortenUrl).filter(ShortenUrl.short_code == code).first():
-        code = short_code(url + str(time.time()))[:8]
+def _url_response(record) -> Response:
+    """The 201 shorten response for a stored record, encoded without jsonable_encoder."""
+    return Response(serializers.encode_url(record), status_code=201, media_type=serializers.CONTENT_TYPE)
 
-    record = ShortenUrl(original_url=url, short_code=code)
-    db.add(record)
-    db.commit()
-    db.refresh(record)
-    return record.to_dict()
+
+@app.get("/api/urls")
+def get_all_urls(
+    request: Request,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    stream: str | None = None,
+    store: Store = Depends(get_store),
+):
+    """
+    Get created shortened URLs, newest first, one keyset page at a time.
+    ?limit=N&cursor=C pages through results; ?stream=json|ndjson streams every row.
+    """
+    version = store.version()
+    validators = http_cache.list_validators(version)
+    if http_cache.not_modified(validators, request.headers):
+        return Response(status_code=304, headers=validators)
+    if stream and stream not in pagination.STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="stream must be json or ndjson")
+    accept_encoding = request.headers.get("accept-encoding")
+    try:
+        if stream:
+            with metrics.timed("list.db_query"):
+                rows = store.iter_recent_rows(cursor, None)
+        elif cursor:
+            body, headers = compression.encode_body(*_urls_page(store, cursor, limit), accept_encoding)
+        else:
+            snapshot = list_snapshots.get(("urls", limit), version, lambda: _urls_page(store, None, limit))
+            body, headers = list_snapshots.encode(snapshot, accept_encoding)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    if stream:
+        content_type, body = pagination.stream_body(stream, serializers.stream_dicts(rows))
+        body, headers = compression.encode_stream(body, accept_encoding)
+        return StreamingResponse(body, media_type=content_type, headers={**validators, **headers})
+    return Response(body, media_type=serializers.CONTENT_TYPE, headers={**validators, **headers})
+
+
+def _urls_page(store: Store, cursor: str | None, limit: int):
+    """(body, headers) of one /api/urls page. Raises ValueError for a bad cursor."""
+    with metrics.timed("list.db_query"):
+        rows = store.iter_recent_rows(cursor, limit + 1)
+    rows, next_cursor = pagination.split_page(list(rows), limit)
+    with metrics.timed("serialize"):
+        body = serializers.encode_urls(rows)
+    return body, {pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+
+@app.post("/api/shorten", status_code=201)
+def shorten_url(data: ShortenRequest, store: Store = Depends(get_store)):
+    """Shorten a URL and save to database. Returns 201 on success, 400 on error."""
+    url = _validated_url(data)
+    try:
+        record, created = shorten(store, code_generator, url, _expires_at(data), shorten_flight)
+    except CodeAllocationError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    if created:
+        cache_redirect(redirect_cache, record.short_code, url, record.expires_at)
+        code_filter.add(record.short_code)
+    with metrics.timed("serialize"):
+        return _url_response(record)
+
+
+@app.post("/api/shorten/batch")
+async def shorten_url_batch(request: Request, store: Store = Depends(get_store)):
+    """
+    Shorten many URLs at once. Body is a JSON array, {"urls": [...]} or NDJSON.
+    Returns 200 with one result per input URL, in input order.
+    """
+    try:
+        items = batch.parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    try:
+        results = await run_in_threadpool(batch.shorten_batch_in_store, store, items, code_generator)
+    except CodeAllocationError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    for result in results:
+        if result.get("created"):
+            redirect_cache.set(result["short_code"], result["original_url"])
+            code_filter.add(result["short_code"])
+    return results
 
 
 @app.get("/{code}")
-def redirect_to_original(code: str, db: Session = Depends(get_db)):
+def redirect_to_original(code: str, store: Store = Depends(get_store)):
     """Redirect short code to original URL."""
-    record = db.query(ShortenUrl).filter(ShortenUrl.short_code == code).first()
-    if not record:
+    def load(code):
+        with metrics.timed("redirect.db_query"):
+            return store.get_target(code)
+
+    with metrics.timed("redirect.lookup"):
+        url = cached_redirect_lookup(redirect_cache, code, load, code_filter, redirect_flight)
+    if url is None:
+        raise HTTPException(status_code=404, detail="Short URL not found")
+    click_recorder.record(code)
+    startup.mark_redirect()
+    status = http_cache.redirect_status(url)
+    return RedirectResponse(url=url, status_code=status, headers=http_cache.redirect_headers(url))
+
+
+def _stats_response(code: str, url: str | None, stats):
+    if url is None:
         raise HTTPException(status_code=404, detail="Short URL not found")
-    return RedirectResponse(url=record.original_url, status_code=302)
+    if stats is None:
+        return click_stats(code, url)
+    return click_stats(code, url, stats.clicks, stats.first_clicked_at, stats.last_clicked_at)
+
+
+@app.get("/api/urls/{code}/stats")
+def url_stats(code: str, store: Store = Depends(get_store), db: Session = Depends(get_db)):
+    """Click count and first/last click time for a short code (updated by the background flusher)."""
+    url = store.get_original_url(code)
+    return _stats_response(code, url, db.get(ShortenUrlClicks, code))
 
 
 if __name__ == "__main__":
     import uvicorn
+    # FASTAPI_DB_MODE=async serves the same API from async endpoints on AsyncSession.
+    if os.environ.get("FASTAPI_DB_MODE", "sync") == "async":
+        from fastapi_app.async_app import app
     uvicorn.run(app, host="0.0.0.0", port=8004)
@@ -0,0 +1,201 @@
+"""
+FastAPI URL Shortener Application (async database path)
+
+Same API as fastapi_app.app, with async def endpoints awaiting an AsyncSession
+(through common.sql_store.AsyncSQLAlchemyStore and common.store.ashorten) so
+requests never wait for a threadpool slot. Always uses the SQL database;
+STORE_BACKEND=memory|log applies to the sync app only. Select it with
+FASTAPI_DB_MODE=async (make run-fastapi / python fastapi_app/app.py), or serve
+fastapi_app.async_app:app directly.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common import batch, compression, http_cache, metrics, pagination, serializers, startup
+from common.cache import cache_redirect, cached_redirect_lookup_async
+from common.codes import CodeAllocationError
+from common.fast_redirect import FastRedirectASGI
+from common.home_page import HOME_PAGE_SIZE, iter_home_page
+from common.singleflight import make_async_single_flight
+from common.sql_store import AsyncSQLAlchemyStore
+from common.store import ashorten
+from fastapi_app.app import (
+    ShortenRequest, _expires_at, _stats_response, _url_response, _validated_url, click_recorder, code_filter,
+    code_generator, lifespan, list_snapshots, redirect_cache,
+)
+from fastapi_app.async_models import ShortenUrl, ShortenUrlClicks, get_async_db
+
+app = FastAPI(title="URL Shortener API", lifespan=lifespan)
+app.add_middleware(metrics.ASGIMetricsMiddleware, framework="fastapi")
+app.add_middleware(FastRedirectASGI, cache=redirect_cache, recorder=click_recorder)
+# Event-loop counterparts of fastapi_app.app's flights, which coordinate threads.
+redirect_flight = make_async_single_flight()
+metrics.register_gauges("url_shortener_redirect_flight", redirect_flight.stats, "fastapi_async")
+shorten_flight = make_async_single_flight()
+metrics.register_gauges("url_shortener_shorten_flight", shorten_flight.stats, "fastapi_async")
+
+
+def get_store(db: AsyncSession = Depends(get_async_db)) -> AsyncSQLAlchemyStore:
+    """An async store over this request's session."""
+    return AsyncSQLAlchemyStore(db, ShortenUrl)
+
+
+@app.get("/", response_class=HTMLResponse)
+async def home(request: Request, cursor: str | None = None, store: AsyncSQLAlchemyStore = Depends(get_store)):
+    """Home page with API documentation and one bounded window of recent URLs."""
+    base = str(request.base_url).rstrip('/')
+    version = await store.version()
+    validators = http_cache.list_validators(version)
+    if http_cache.not_modified(validators, request.headers):
+        return Response(status_code=304, headers=validators)
+    accept_encoding = request.headers.get("accept-encoding")
+    if cursor:
+        body, headers = compression.encode_stream(await _home_page(store, base, cursor), accept_encoding)
+        return StreamingResponse(body, media_type="text/html; charset=utf-8", headers={**validators, **headers})
+
+    async def build():
+        # A shared rebuild may outlive this request, so it gets a session of its own.
+        async with store.own_session() as own:
+            return "".join(await _home_page(own, base, None)).encode(), {}
+
+    snapshot = await list_snapshots.aget(("home", base), version, build)
+    body, headers = list_snapshots.encode(snapshot, accept_encoding)
+    return Response(body, media_type="text/html; charset=utf-8", headers={**validators, **headers})
+
+
+async def _home_page(store: AsyncSQLAlchemyStore, base: str, cursor: str | None):
+    """The chunks of the home page window at cursor."""
+    try:
+        urls = await store.iter_recent(cursor, HOME_PAGE_SIZE + 1)
+    except ValueError:
+        # A stale or hand-edited cursor just lands on the newest page.
+        cursor, urls = None, await store.iter_recent(None, HOME_PAGE_SIZE + 1)
+    urls, next_cursor = pagination.split_page(urls, HOME_PAGE_SIZE)
+    return iter_home_page('FastAPI', 'FastAPI, SQLAlchemy', base, urls, next_cursor, not cursor)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Request and hot-path timings in the Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/urls")
+async def get_all_urls(
+    request: Request,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    stream: str | None = None,
+    store: AsyncSQLAlchemyStore = Depends(get_store),
+):
+    """
+    Get created shortened URLs, newest first, one keyset page at a time.
+    ?limit=N&cursor=C pages through results; ?stream=json|ndjson streams every row.
+    """
+    version = await store.version()
+    validators = http_cache.list_validators(version)
+    if http_cache.not_modified(validators, request.headers):
+        return Response(status_code=304, headers=validators)
+    if stream and stream not in pagination.STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="stream must be json or ndjson")
+    accept_encoding = request.headers.get("accept-encoding")
+
+    async def page():
+        async with store.own_session() as own:
+            return await _urls_page(own, None, limit)
+
+    try:
+        if stream:
+            with metrics.timed("list.db_query"):
+                rows = await store.iter_recent_rows(cursor, None)
+        elif cursor:
+            body, headers = compression.encode_body(*await _urls_page(store, cursor, limit), accept_encoding)
+        else:
+            snapshot = await list_snapshots.aget(("urls", limit), version, page)
+            body, headers = list_snapshots.encode(snapshot, accept_encoding)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    if stream:
+        dicts = (serializers.url_dict(row, serializers.isoformat) async for row in rows)
+        body, headers = compression.aencode_stream(pagination.astream_body(stream, dicts), accept_encoding)
+        media_type = pagination.STREAM_CONTENT_TYPES[stream]
+        return StreamingResponse(body, media_type=media_type, headers={**validators, **headers})
+    return Response(body, media_type=serializers.CONTENT_TYPE, headers={**validators, **headers})
+
+
+async def _urls_page(store: AsyncSQLAlchemyStore, cursor: str | None, limit: int):
+    """(body, headers) of one /api/urls page. Raises ValueError for a bad cursor."""
+    with metrics.timed("list.db_query"):
+        rows = await store.iter_recent_rows(cursor, limit + 1)
+    rows, next_cursor = pagination.split_page(rows, limit)
+    with metrics.timed("serialize"):
+        body = serializers.encode_urls(rows)
+    return body, {pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+
+@app.post("/api/shorten", status_code=201)
+async def shorten_url(data: ShortenRequest, store: AsyncSQLAlchemyStore = Depends(get_store)):
+    """Shorten a URL and save to database. Returns 201 on success, 400 on error."""
+    url = _validated_url(data)
+    try:
+        record, created = await ashorten(store, code_generator, url, _expires_at(data), shorten_flight)
+    except CodeAllocationError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    if created:
+        cache_redirect(redirect_cache, record.short_code, url, record.expires_at)
+        code_filter.add(record.short_code)
+    with metrics.timed("serialize"):
+        return _url_response(record)
+
+
+@app.post("/api/shorten/batch")
+async def shorten_url_batch(request: Request, store: AsyncSQLAlchemyStore = Depends(get_store)):
+    """
+    Shorten many URLs at once. Body is a JSON array, {"urls": [...]} or NDJSON.
+    Returns 200 with one result per input URL, in input order.
+    """
+    try:
+        items = batch.parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    try:
+        results = await store.run_sync(lambda sync: batch.shorten_batch_in_store(sync, items, code_generator))
+    except CodeAllocationError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    for result in results:
+        if result.get("created"):
+            redirect_cache.set(result["short_code"], result["original_url"])
+            code_filter.add(result["short_code"])
+    return results
+
+
+@app.get("/{code}")
+async def redirect_to_original(code: str, store: AsyncSQLAlchemyStore = Depends(get_store)):
+    """Redirect short code to original URL."""
+    async def load(code):
+        with metrics.timed("redirect.db_query"):
+            return await store.get_target(code)
+
+    with metrics.timed("redirect.lookup"):
+        url = await cached_redirect_lookup_async(redirect_cache, code, load, code_filter, redirect_flight)
+    if url is None:
+        raise HTTPException(status_code=404, detail="Short URL not found")
+    click_recorder.record(code)
+    startup.mark_redirect()
+    status = http_cache.redirect_status(url)
+    return RedirectResponse(url=url, status_code=status, headers=http_cache.redirect_headers(url))
+
+
+@app.get("/api/urls/{code}/stats")
+async def url_stats(
+    code: str, store: AsyncSQLAlchemyStore = Depends(get_store), db: AsyncSession = Depends(get_async_db)
+):
+    """Click count and first/last click time for a short code (updated by the background flusher)."""
+    url = await store.get_original_url(code)
+    return _stats_response(code, url, await db.get(ShortenUrlClicks, code))
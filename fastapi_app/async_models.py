@@ -0,0 +1,21 @@
+"""
+Async database access for the FastAPI URL shortener.
+
+Same table and model as fastapi_app.models, reached through SQLAlchemy's
+AsyncEngine/AsyncSession on aiosqlite so endpoints can await the database
+instead of occupying a threadpool worker. Schema creation and upgrades still
+run through the sync engine, in fastapi_app.models.migrate().
+"""
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from common.db import configure_engine, engine_options
+from fastapi_app.models import DATABASE_URL, Base, ShortenUrl, ShortenUrlClicks  # noqa: F401
+
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+async_engine = configure_engine(create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL)))
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
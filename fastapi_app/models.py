@@ -1,14 +1,22 @@
 """
 SQLAlchemy models for FastAPI URL shortener.
 """
+import os
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, DateTime, create_engine
+from sqlalchemy import Column, Integer, Index, String, DateTime, create_engine, text
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 
-DATABASE_URL = "sqlite:///./fastapi_shorten_url.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+from common.db import configure_engine, engine_options
+from common.http_cache import sqlalchemy_url_version
+from common.serializers import record_row, url_dict
+from common.schema import upgrade_schema
+
+DATABASE_URL = os.environ.get("FASTAPI_DATABASE_URL", "sqlite:///./fastapi_shorten_url.db")
+engine = configure_engine(create_engine(DATABASE_URL, **engine_options(DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+# create_all also adds the shorten_url_version counter behind the listing ETags.
+sqlalchemy_url_version(Base.metadata)
 
 
 def get_db():
@@ -22,19 +30,31 @@ def get_db():
 class ShortenUrl(Base):
     """Model for storing shortened URL details."""
     __tablename__ = "shorten_url"
+    # expires_at IS NULL rows stay out of the index the sweeper scans.
+    __table_args__ = (Index("ix_shorten_url_expires_at", "expires_at", sqlite_where=text("expires_at IS NOT NULL")),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     original_url = Column(String(2048), nullable=False)
+    url_hash = Column(String(64), unique=True, nullable=False, index=True)
     short_code = Column(String(50), unique=True, nullable=False, index=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    expires_at = Column(DateTime, nullable=True)
 
     def to_dict(self):
-        return {
-            "id": self.id,
-            "original_url": self.original_url,
-            "short_code": self.short_code,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-        }
+        return url_dict(record_row(self))
+
+
+class ShortenUrlClicks(Base):
+    """Aggregated click counts per short code, upserted by common.clicks."""
+    __tablename__ = "shorten_url_clicks"
+
+    short_code = Column(String(50), primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
+    first_clicked_at = Column(DateTime)
+    last_clicked_at = Column(DateTime)
 
 
-Base.metadata.create_all(bind=engine)
+def migrate():
+    """Create missing tables and apply schema upgrades (see common.startup)."""
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
@@ -5,51 +5,110 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from flask import Flask, jsonify, request, redirect
-from common.utils import short_code, is_valid_url
-from flask_app.models import db, ShortenUrl
+from time import perf_counter
+
+from flask import Flask, Response, g, jsonify, request, redirect, stream_with_context
+from common import batch, compression, http_cache, metrics, pagination, serializers, startup
+from common.bloom import make_code_filter, sqlalchemy_code_fetcher
+from common.cache import cache_redirect, make_redirect_cache, cached_redirect_lookup
+from common.clicks import click_stats, make_click_recorder, sqlalchemy_click_writer
+from common.codes import CodeAllocationError, make_code_generator, sqlalchemy_block_reserver
+from common.db import configure_engine, engine_options
+from common.expiry import make_expiry_sweeper, parse_expires_in, sqlalchemy_expiry_deleter
+from common.fast_redirect import FastRedirectWSGI
+from common.group_commit import make_group_committer, sqlalchemy_url_writer, with_group_commit
+from common.home_page import HOME_PAGE_SIZE, iter_home_page
+from common.schema import upgrade_schema
+from common.singleflight import make_single_flight
+from common.sql_store import SQLAlchemyStore
+from common.store import open_store, shorten
+from common.validators import is_valid_url
+from flask_app.models import db, ShortenUrl, ShortenUrlClicks
 
 app = Flask(__name__)
+redirect_cache = make_redirect_cache('flask')
+standalone_store = open_store('flask')
+redirect_flight = make_single_flight()
+metrics.register_gauges('url_shortener_redirect_flight', redirect_flight.stats, 'flask')
+shorten_flight = make_single_flight()
+metrics.register_gauges('url_shortener_shorten_flight', shorten_flight.stats, 'flask')
+list_snapshots = compression.make_list_snapshots()
+metrics.register_gauges('url_shortener_list_snapshot', list_snapshots.stats, 'flask')
+code_generator = make_code_generator(sqlalchemy_block_reserver(lambda: db.engine))
+
+
+def _engine():
+    # The click flusher runs outside any request, so it needs its own app context.
+    with app.app_context():
+        return db.engine
+
+
+click_recorder = make_click_recorder(sqlalchemy_click_writer(_engine))
+url_committer = make_group_committer(sqlalchemy_url_writer(_engine, ShortenUrl))
+metrics.register_gauges('url_shortener_group_commit', url_committer.stats, 'flask')
+# Loaded by start_worker() outside any request, so it reads through the engine rather than db.session.
+code_filter = make_code_filter(
+    standalone_store.codes_after if standalone_store else sqlalchemy_code_fetcher(_engine, ShortenUrl)
+)
+metrics.register_gauges('url_shortener_bloom', code_filter.stats, 'flask')
+warmup_urls = startup.store_warmup_urls(standalone_store) if standalone_store else startup.sqlalchemy_warmup_urls(_engine)
+metrics.register_gauges('url_shortener_startup', startup.stats, 'flask')
+expiry_sweeper = make_expiry_sweeper(
+    standalone_store.delete_expired if standalone_store else sqlalchemy_expiry_deleter(_engine, ShortenUrl),
+    redirect_cache.delete,
+)
+metrics.register_gauges('url_shortener_expiry', expiry_sweeper.stats, 'flask')
+
+
+def _store():
+    """The STORE_BACKEND store, or one over this request's SQLAlchemy session."""
+    return standalone_store or with_group_commit(SQLAlchemyStore(db.session, ShortenUrl), url_committer)
 
 
 def _get_base_url():
     return request.url_root.rstrip('/')
 
 
+def _home_page(store, cursor):
+    """The chunks of the home page window at cursor."""
+    try:
+        urls = store.iter_recent(cursor, HOME_PAGE_SIZE + 1)
+    except ValueError:
+        # A stale or hand-edited cursor just lands on the newest page.
+        cursor, urls = None, store.iter_recent(None, HOME_PAGE_SIZE + 1)
+    urls, next_cursor = pagination.split_page(list(urls), HOME_PAGE_SIZE)
+    return iter_home_page('Flask', 'Flask, SQLAlchemy', _get_base_url(), urls, next_cursor, not cursor)
+
+
 def _render_home_page():
-    urls = ShortenUrl.query.order_by(ShortenUrl.created_at.desc()).all()
-    base = _get_base_url()
-    url_rows = ''.join(
-        f'<tr><td>{u.short_code}</td><td><a href="{u.original_url}" target="_blank">{u.original_url[:60]}{"..." if len(u.original_url) > 60 else ""}</a></td><td><a href="{base}/{u.short_code}">{base}/{u.short_code}</a></td></tr>'
-        for u in urls
-    ) or '<tr><td colspan="3">No shortened URLs yet.</td></tr>'
-    return f'''<!DOCTYPE html>
-<html>
-<head><meta charset="utf-8"><title>URL Shortener - Flask</title>
-<style>body{{font-family:system-ui,sans-serif;max-width:800px;margin:2rem auto;padding:0 1rem}}h1{{color:#333}}code{{background:#f4f4f4;padding:2px 6px;border-radius:4px}}table{{width:100%;border-collapse:collapse}}th,td{{padding:8px;text-align:left;border-bottom:1px solid #ddd}}th{{background:#f8f8f8}}</style>
-</head>
-<body>
-<h1>🔗 URL Shortener API</h1>
-<p><strong>Framework:</strong> Flask</p>
-<p>Shorten long URLs and redirect using compact short codes. Built with Flask, SQLAlchemy, and SQLite.</p>
-
-<h2>Available API Endpoints</h2>
-<table>
-<tr><th>Method</th><th>Endpoint</th><th>Description</th></tr>
-<tr><td><code>GET</code></td><td><a href="{base}/api/urls">{base}/api/urls</a></td><td>Get all shortened URLs (JSON)</td></tr>
-<tr><td><code>POST</code></td><td><a href="{base}/api/shorten">{base}/api/shorten</a></td><td>Shorten a URL (body: {"{ \"url\": \"https://example.com\" }"})</td></tr>
-<tr><td><code>GET</code></td><td><code>{base}/&#123;short_code&#125;</code></td><td>Redirect to original URL</td></tr>
-</table>
-
-<h2>Shortened URLs</h2>
-<table><tr><th>Short Code</th><th>Original URL</th><th>Short Link</th></tr>{url_rows}</table>
-</body>
-</html>'''
+    """The home page with one bounded window of recent URLs; the newest one comes from a snapshot."""
+    cursor = request.args.get('cursor')
+    store = _store()
+    version = store.version()
+    validators = http_cache.list_validators(version)
+    if http_cache.not_modified(validators, request.headers):
+        return Response(status=304, headers=validators)
+    accept_encoding = request.headers.get('Accept-Encoding')
+    if cursor:
+        body, headers = compression.encode_stream(_home_page(store, cursor), accept_encoding)
+    else:
+        snapshot = list_snapshots.get(
+            ('home', _get_base_url()), version, lambda: (''.join(_home_page(store, None)).encode(), {})
+        )
+        body, headers = list_snapshots.encode(snapshot, accept_encoding)
+    return Response(body, content_type='text/html; charset=utf-8', headers={**validators, **headers})
+
+
 _db_path = os.path.join(os.path.dirname(__file__), 'shorten_url.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{_db_path}'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('FLASK_DATABASE_URL', f'sqlite:///{_db_path}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+# Cached redirects are answered before Flask builds a request context.
+app.wsgi_app = FastRedirectWSGI(app.wsgi_app, redirect_cache, click_recorder)
 
 db.init_app(app)
+with app.app_context():
+    configure_engine(db.engine)
 
 
 @app.route('/')
@@ -59,16 +118,70 @@ def home():
 
 
 @app.before_request
-def _ensure_tables():
-    """Ensure database tables exist."""
-    pass  # Tables created in main block
+def _start_request_timer():
+    if metrics.enabled():
+        g.request_started = perf_counter()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request('flask', request.method, route, response.status_code, perf_counter() - started)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Request and hot-path timings in the Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route('/api/urls', methods=['GET'])
 def get_all_urls():
-    """Get all created shortened URLs."""
-    urls = ShortenUrl.query.order_by(ShortenUrl.created_at.desc()).all()
-    return jsonify([url.to_dict() for url in urls])
+    """
+    Get created shortened URLs, newest first, one keyset page at a time.
+    ?limit=N&cursor=C pages through results; ?stream=json|ndjson streams every row.
+    """
+    store = _store()
+    version = store.version()
+    validators = http_cache.list_validators(version)
+    if http_cache.not_modified(validators, request.headers):
+        return Response(status=304, headers=validators)
+    stream = request.args.get('stream')
+    if stream and stream not in pagination.STREAM_FORMATS:
+        return jsonify({'message': 'stream must be json or ndjson'}), 400
+    cursor = request.args.get('cursor')
+    accept_encoding = request.headers.get('Accept-Encoding')
+    try:
+        limit = pagination.parse_limit(request.args.get('limit'))
+        if stream:
+            with metrics.timed('list.db_query'):
+                rows = store.iter_recent_rows(cursor, None)
+        elif cursor:
+            body, headers = compression.encode_body(*_urls_page(store, cursor, limit), accept_encoding)
+        else:
+            snapshot = list_snapshots.get(('urls', limit), version, lambda: _urls_page(store, None, limit))
+            body, headers = list_snapshots.encode(snapshot, accept_encoding)
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    if stream:
+        content_type, body = pagination.stream_body(stream, serializers.stream_dicts(rows))
+        body, headers = compression.encode_stream(body, accept_encoding)
+        return Response(stream_with_context(body), content_type=content_type, headers={**validators, **headers})
+    return Response(body, content_type=serializers.CONTENT_TYPE, headers={**validators, **headers})
+
+
+def _urls_page(store, cursor, limit):
+    """(body, headers) of one /api/urls page. Raises ValueError for a bad cursor."""
+    with metrics.timed('list.db_query'):
+        rows = store.iter_recent_rows(cursor, limit + 1)
+    rows, next_cursor = pagination.split_page(list(rows), limit)
+    with metrics.timed('serialize'):
+        body = serializers.encode_urls(rows)
+    return body, {pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
 
 
 @app.route('/api/shorten', methods=['POST'])
@@ -82,37 +195,99 @@ def shorten_url():
     if not url:
         return jsonify({'message': 'URL is required'}), 400
 
+    try:
+        expires_at = parse_expires_in(data.get('expires_in'))
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
     url = url.strip()
-    if not is_valid_url(url):
+    with metrics.timed('validate'):
+        valid = is_valid_url(url)
+    if not valid:
         return jsonify({'message': 'Invalid or unavailable URL'}), 400
 
-    code = short_code(url)
-    existing = ShortenUrl.query.filter_by(original_url=url).first()
-    if existing:
-        return jsonify(existing.to_dict()), 201
+    try:
+        record, created = shorten(_store(), code_generator, url, expires_at, shorten_flight)
+    except CodeAllocationError as exc:
+        return jsonify({'message': str(exc)}), 503
+    if created:
+        cache_redirect(redirect_cache, record.short_code, url, record.expires_at)
+        code_filter.add(record.short_code)
+    with metrics.timed('serialize'):
+        body = serializers.encode_url(record)
+    return Response(body, status=201, content_type=serializers.CONTENT_TYPE)
 
-    existing_code = ShortenUrl.query.filter_by(short_code=code).first()
-    if existing_code:
-        import time
-        code = short_code(url + str(time.time()))[:8]
 
-    shorten_url_record = ShortenUrl(original_url=url, short_code=code)
-    db.session.add(shorten_url_record)
-    db.session.commit()
+@app.route('/api/shorten/batch', methods=['POST'])
+def shorten_url_batch():
+    """
+    Shorten many URLs at once. Body is a JSON array, {"urls": [...]} or NDJSON.
+    Returns 200 with one result per input URL, in input order.
+    """
+    try:
+        items = batch.parse_batch_body(request.get_data(), request.content_type)
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
 
-    return jsonify(shorten_url_record.to_dict()), 201
+    try:
+        results = batch.shorten_batch_in_store(_store(), items, code_generator)
+    except CodeAllocationError as exc:
+        return jsonify({'message': str(exc)}), 503
+    for result in results:
+        if result.get('created'):
+            redirect_cache.set(result['short_code'], result['original_url'])
+            code_filter.add(result['short_code'])
+    return jsonify(results)
 
 
 @app.route('/<code>', methods=['GET'])
 def redirect_to_original(code):
     """Redirect short code to original URL."""
-    record = ShortenUrl.query.filter_by(short_code=code).first()
-    if not record:
+    with metrics.timed('redirect.lookup'):
+        url = cached_redirect_lookup(redirect_cache, code, _load_target, code_filter, redirect_flight)
+    if url is None:
         return jsonify({'message': 'Short URL not found'}), 404
-    return redirect(record.original_url, code=302)
+    click_recorder.record(code)
+    startup.mark_redirect()
+    response = redirect(url, code=http_cache.redirect_status(url))
+    response.headers.update(http_cache.redirect_headers(url))
+    return response
 
 
-if __name__ == '__main__':
+@app.route('/api/urls/<code>/stats', methods=['GET'])
+def url_stats(code):
+    """Click count and first/last click time for a short code (updated by the background flusher)."""
+    url = _load_original_url(code)
+    if url is None:
+        return jsonify({'message': 'Short URL not found'}), 404
+    stats = db.session.get(ShortenUrlClicks, code)
+    if stats is None:
+        return jsonify(click_stats(code, url))
+    return jsonify(click_stats(code, url, stats.clicks, stats.first_clicked_at, stats.last_clicked_at))
+
+
+def _load_original_url(code):
+    with metrics.timed('redirect.db_query'):
+        return _store().get_original_url(code)
+
+
+def _load_target(code):
+    with metrics.timed('redirect.db_query'):
+        return _store().get_target(code)
+
+
+def migrate():
+    """Create missing tables and apply schema upgrades (see common.startup)."""
     with app.app_context():
         db.create_all()
+        upgrade_schema(db.engine)
+
+
+def start_worker(run_migrations: bool = False):
+    """Boot steps for a serving process: the schema step when asked, the optional warmup and the sweeper."""
+    startup.start(migrate if run_migrations else None, redirect_cache, code_filter, warmup_urls, expiry_sweeper)
+
+
+if __name__ == '__main__':
+    start_worker(run_migrations=True)
     app.run(host='0.0.0.0', port=8002)
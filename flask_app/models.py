@@ -4,22 +4,37 @@ SQLAlchemy models for Flask URL shortener.
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
 
+from common.http_cache import sqlalchemy_url_version
+from common.serializers import record_row, url_dict
+
 db = SQLAlchemy()
+sqlalchemy_url_version(db.metadata)
 
 
 class ShortenUrl(db.Model):
     """Model for storing shortened URL details."""
     __tablename__ = 'shorten_url'
+    # Partial index: the expiry sweeper (common.expiry) only ever looks for rows that can expire.
+    __table_args__ = (
+        db.Index('ix_shorten_url_expires_at', 'expires_at', sqlite_where=db.text('expires_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     original_url = db.Column(db.String(2048), nullable=False)
+    url_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
     short_code = db.Column(db.String(50), unique=True, nullable=False, index=True)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
 
     def to_dict(self):
-        return {
-            'id': self.id,
-            'original_url': self.original_url,
-            'short_code': self.short_code,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-        }
+        return url_dict(record_row(self))
+
+
+class ShortenUrlClicks(db.Model):
+    """Aggregated click counts per short code, upserted by common.clicks."""
+    __tablename__ = 'shorten_url_clicks'
+
+    short_code = db.Column(db.String(50), primary_key=True)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    first_clicked_at = db.Column(db.DateTime)
+    last_clicked_at = db.Column(db.DateTime)
@@ -0,0 +1,1105 @@
+"""
+Tests for shared helpers in common/.
+"""
+import gzip
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, inspect, text
+
+from common.batch import chunked, shorten_batch
+from common.bloom import BloomFilter, CodeFilter
+from common.cache import LRUCache, MISSING, ExpiringUrl, SharedBackedCache, cache_redirect, cached_redirect_lookup
+from common.cli import export_records, import_records, read_records, write_records
+from common.clicks import ClickRecorder, aggregate
+from common.codes import (
+    BASE62_ALPHABET, BlockCodeGenerator, HashCodeGenerator, sqlalchemy_block_reserver,
+)
+from common.compression import ListSnapshots, compress_stream, encode_body, negotiate
+from common.db import configure_engine, engine_options
+from common.expiry import ExpirySweeper, parse_expires_in, sqlalchemy_expiry_deleter
+from common.fast_redirect import cached_target, location
+from common.group_commit import GroupCommitter, sqlalchemy_url_writer
+from common.http_cache import DROP_URL_VERSION_SQL, list_validators, not_modified, redirect_cache_control
+from common.metrics import Histogram
+from common.pagination import decode_cursor, encode_cursor, stream_body
+from common.schema import upgrade_schema
+from common.serializers import encode_url, encode_urls, url_dict
+from common.sharding import HashRing, ShardedStore, rebalance, shard_urls
+from common.shared_store import SharedRedirectStore
+from common.singleflight import AsyncSingleFlight, SingleFlight
+from common.startup import warm_up, warmup_urls
+from common.store import DuplicateError, LogStore, MemoryStore, UrlRecord, ashorten, shorten
+from common.utils import url_digest
+from common.validators import MAX_URL_LENGTH, is_valid_url, validate_many
+
+
+def test_url_digest_is_fixed_width():
+    """Test url_digest returns a 64-character hex digest."""
+    assert len(url_digest('https://example.com')) == 64
+    assert len(url_digest('https://example.com/' + 'a' * 2000)) == 64
+
+
+def test_upgrade_schema_backfills_existing_rows():
+    """Test upgrade_schema adds, backfills and uniquely indexes url_hash."""
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE shorten_url (id INTEGER PRIMARY KEY, original_url VARCHAR(2048), '
+            'short_code VARCHAR(50), created_at DATETIME)'
+        ))
+        conn.execute(text("INSERT INTO shorten_url (original_url, short_code) VALUES ('https://a.com', 'aaaa')"))
+        # Duplicates were normal before dedupe; every one must keep its code.
+        conn.execute(text("INSERT INTO shorten_url (original_url, short_code) VALUES ('https://a.com', 'bbbb')"))
+    upgrade_schema(engine)
+    upgrade_schema(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text('SELECT short_code, url_hash FROM shorten_url ORDER BY id')).all()
+    assert rows == [('aaaa', url_digest('https://a.com')), ('bbbb', 'dup:2')]
+    indexes = {ix['name']: ix for ix in inspect(engine).get_indexes('shorten_url')}
+    assert indexes['ix_shorten_url_url_hash']['unique']
+    assert 'ix_shorten_url_created_at' in indexes
+    assert indexes['ix_shorten_url_expires_at']['dialect_options']['sqlite_where'] is not None
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test LRUCache drops the least recently used entry when full."""
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lru_cache_ttl_expiry():
+    """Test entries with a TTL expire."""
+    cache = LRUCache(maxsize=10)
+    cache.set('a', 1, ttl=0)
+    assert cache.get('a') is MISSING
+
+
+def test_cached_redirect_lookup_caches_misses():
+    """Test cached_redirect_lookup negatively caches unknown codes."""
+    cache = LRUCache(maxsize=10)
+    calls = []
+
+    def load(code):
+        calls.append(code)
+        return None
+
+    assert cached_redirect_lookup(cache, 'nope', load) is None
+    assert cached_redirect_lookup(cache, 'nope', load) is None
+    assert calls == ['nope']
+
+
+def test_negative_ttl_of_zero_disables_negative_caching(monkeypatch):
+    """Test REDIRECT_CACHE_NEGATIVE_TTL=0 is honoured rather than replaced by the default."""
+    from common import cache as cache_module
+    monkeypatch.setenv('REDIRECT_CACHE_NEGATIVE_TTL', '0')
+    assert cache_module._env_float('REDIRECT_CACHE_NEGATIVE_TTL', 30.0) == 0
+    monkeypatch.setattr(cache_module, 'REDIRECT_CACHE_NEGATIVE_TTL', 0.0)
+    cache = LRUCache(maxsize=10)
+    calls = []
+
+    def load(code):
+        calls.append(code)
+        return None
+
+    assert cached_redirect_lookup(cache, 'nope', load) is None
+    assert cached_redirect_lookup(cache, 'nope', load) is None
+    assert calls == ['nope', 'nope'] and len(cache) == 0
+
+
+def test_cursor_round_trip():
+    """Test pagination cursors decode back to (created_at, id)."""
+    created_at = datetime(2024, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+def test_hash_code_generator_matches_legacy_codes():
+    """Test the default hash generator keeps the historical MD5[:8] codes."""
+    gen = HashCodeGenerator()
+    first = next(gen.candidates('https://example.com'))
+    assert first == hashlib.md5(b'https://example.com').hexdigest()[:8]
+
+
+def test_hash_code_generator_custom_alphabet():
+    """Test hash codes honour length and alphabet, and retries differ."""
+    gen = HashCodeGenerator(length=6, alphabet=BASE62_ALPHABET)
+    codes = list(gen.candidates('https://example.com'))
+    assert len(set(codes)) == len(codes)
+    assert all(len(c) == 6 and set(c) <= set(BASE62_ALPHABET) for c in codes)
+
+
+def test_block_code_generator_reserves_once_per_block():
+    """Test block generator only calls reserve_block when a block runs out."""
+    engine = create_engine('sqlite://')
+    calls = []
+    reserver = sqlalchemy_block_reserver(lambda: engine)
+
+    def reserve(size):
+        calls.append(size)
+        return reserver(size)
+
+    gen = BlockCodeGenerator(reserve, block_size=3)
+    codes = [next(gen.candidates('u')) for _ in range(4)]
+    assert codes == ['1', '2', '3', '4']
+    assert calls == [3, 3]
+
+
+def test_shorten_batch_skips_taken_codes():
+    """Test shorten_batch moves past codes already in use, in one insert."""
+    gen = HashCodeGenerator()
+    taken = next(gen.candidates('https://a.com'))
+    inserts = []
+
+    def insert_rows(rows):
+        inserts.append(rows)
+        return {r['url_hash']: dict(r) for r in rows}
+
+    results = shorten_batch(
+        ['https://a.com', 'https://b.com'], gen,
+        fetch_existing=lambda digests: {},
+        fetch_taken_codes=lambda codes: {taken} & set(codes),
+        insert_rows=insert_rows,
+    )
+    assert len(inserts) == 1
+    assert results[0]['short_code'] != taken
+    assert [r['original_url'] for r in results] == ['https://a.com', 'https://b.com']
+
+
+def test_chunked_consumes_lazily():
+    """Test chunked pulls items only as each chunk is needed."""
+    pulled = []
+
+    def items():
+        for i in range(5):
+            pulled.append(i)
+            yield i
+
+    chunks = chunked(items(), 2)
+    assert next(chunks) == [0, 1]
+    assert pulled == [0, 1]
+    assert list(chunks) == [[2, 3], [4]]
+
+
+def test_configure_engine_applies_pragmas(tmp_path):
+    """Test tuned engines run in WAL mode with a busy timeout and a real pool."""
+    url = f"sqlite:///{tmp_path / 'tuned.db'}"
+    engine = configure_engine(create_engine(url, **engine_options(url)))
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() > 0
+    assert engine.pool.size() > 1
+    engine.dispose()
+
+
+def test_is_valid_url_cases():
+    """Test the validator accepts http(s) URLs and rejects everything else."""
+    assert is_valid_url('https://example.com')
+    assert is_valid_url('  http://localhost:8000/path?q=1  ')
+    assert is_valid_url('HTTPS://EXAMPLE.COM/')
+    assert not is_valid_url('ftp://example.com')
+    assert not is_valid_url('example.com')
+    assert not is_valid_url('https://exa mple.com')
+    assert not is_valid_url(None)
+    assert not is_valid_url('https://example.com/' + 'a' * MAX_URL_LENGTH)
+
+
+def test_validate_many_preserves_order():
+    """Test validate_many returns one result per input, including unhashable ones."""
+    assert validate_many(['https://a.com', 'bad', {'url': 'x'}, 'https://a.com']) == [True, False, False, True]
+
+
+def test_shared_store_visible_across_processes(tmp_path):
+    """Test a URL written by one process is read by another mapping the same file."""
+    path = str(tmp_path / 'redirects')
+    store = SharedRedirectStore(path, slots=64)
+    pid = os.fork()
+    if pid == 0:
+        child = SharedRedirectStore(path)
+        child.set('abc123', 'https://shared.example.com')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert store.get('abc123') == 'https://shared.example.com'
+    store.delete('abc123')
+    assert store.get('abc123') is None
+
+
+def test_shared_store_bucket_overwrites_when_full(tmp_path):
+    """Test inserts never fail: a full bucket evicts an entry."""
+    store = SharedRedirectStore(str(tmp_path / 'redirects'), slots=4)
+    for i in range(10):
+        assert store.set(f'code{i}', f'https://{i}.example.com')
+    assert store.get('code9') == 'https://9.example.com'
+    assert sum(store.get(f'code{i}') is not None for i in range(10)) == 4
+    assert not store.set('long', 'https://example.com/' + 'a' * 1000)
+
+
+def test_shared_backed_cache_promotes_shared_hits(tmp_path):
+    """Test a fresh process-local cache is filled from the shared store."""
+    shared = SharedRedirectStore(str(tmp_path / 'redirects'), slots=64)
+    SharedBackedCache(shared, maxsize=10).set('abc', 'https://a.com')
+    other = SharedBackedCache(shared, maxsize=10)
+    assert cached_redirect_lookup(other, 'abc', lambda code: None) == 'https://a.com'
+    assert other.stats()['shared_hits'] == 1
+
+
+def test_click_aggregate_counts_and_bounds():
+    totals = aggregate([('a', 3.0), ('b', 1.0), ('a', 1.0), ('a', 2.0)])
+    assert totals == {'a': [3, 1.0, 3.0], 'b': [1, 1.0, 1.0]}
+
+
+def test_click_recorder_retries_failed_writes_and_drops_oldest():
+    written = []
+
+    def write(rows):
+        if not written:
+            written.append(None)
+            raise RuntimeError('database is locked')
+        written.append(rows)
+
+    recorder = ClickRecorder(write, capacity=3, interval=0)
+    for code in ('a', 'a', 'b', 'a'):
+        recorder.record(code)
+    assert recorder.stats()['dropped'] == 1
+    assert recorder.flush() == 0  # first write fails, counts are kept
+    recorder.record('b')
+    assert recorder.flush() == 1
+    assert {row['short_code']: row['clicks'] for row in written[1]} == {'a': 2, 'b': 2}
+    assert recorder.flush() == 0
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('op_seconds', 'Op time.', ('operation',), buckets=(0.1, 1.0))
+    histogram.observe(('a',), 0.05)
+    histogram.observe(('a',), 0.5)
+    histogram.observe(('a',), 5)
+    lines = histogram.render()
+    assert 'op_seconds_bucket{operation="a",le="0.1"} 1' in lines
+    assert 'op_seconds_bucket{operation="a",le="1.0"} 2' in lines
+    assert 'op_seconds_bucket{operation="a",le="+Inf"} 3' in lines
+    assert 'op_seconds_count{operation="a"} 3' in lines
+
+
+def test_gauges_are_kept_per_framework():
+    from common import metrics
+    metrics.register_gauges('test_gauge', lambda: {'size': 1, 'name': 'x'}, 'one')
+    metrics.register_gauges('test_gauge', lambda: {'size': 2}, 'two')
+    try:
+        lines = metrics.render().splitlines()
+    finally:
+        metrics._gauge_sources.pop(('one', 'test_gauge'))
+        metrics._gauge_sources.pop(('two', 'test_gauge'))
+    assert lines.count('# TYPE test_gauge_size gauge') == 1
+    assert 'test_gauge_size{framework="one"} 1.0' in lines
+    assert 'test_gauge_size{framework="two"} 2.0' in lines
+    assert not any(line.startswith('test_gauge_name') for line in lines)
+
+
+def test_timed_is_a_shared_no_op_when_disabled():
+    from common import metrics
+    metrics.set_enabled(False)
+    assert metrics.timed('a') is metrics.timed('b')
+    iterable = ['x']
+    assert metrics.timed_iter(iterable, 'a') is iterable
+    metrics.set_enabled(True)
+    try:
+        assert list(metrics.timed_iter(iterable, 'test.iter')) == ['x']
+        assert metrics.OPERATION_SECONDS.snapshot()[('test.iter',)][0] == 1
+    finally:
+        metrics.set_enabled(False)
+        metrics.reset()
+
+
+def test_serializers_encode_rows_like_to_dict():
+    """Test the byte encoders produce the to_dict() shape, ISO timestamps included."""
+    import json
+    created_at = datetime(2024, 5, 1, 12, 30)
+    record = UrlRecord(7, 'https://example.com/é', url_digest('https://example.com/é'), 'abc', created_at)
+    row = (7, 'https://example.com/é', 'abc', created_at, None)
+    assert url_dict(row) == record.to_dict()
+    assert json.loads(encode_url(record)) == {
+        'id': 7, 'original_url': 'https://example.com/é', 'short_code': 'abc', 'created_at': '2024-05-01T12:30:00',
+        'expires_at': None,
+    }
+    assert json.loads(encode_urls([row, row])) == [record.to_dict()] * 2
+    assert url_dict((1, 'https://a.com', 'a', None, created_at)) == {
+        'id': 1, 'original_url': 'https://a.com', 'short_code': 'a', 'created_at': None,
+        'expires_at': '2024-05-01T12:30:00',
+    }
+
+
+def test_stream_body_chunks_rows():
+    """Test streamed listings are valid JSON/NDJSON bytes, batched into chunks."""
+    import json
+    items = [{'id': i} for i in range(2500)]
+    _, body = stream_body('json', iter(items))
+    chunks = list(body)
+    assert len(chunks) == 5  # '[', three chunks of up to 1000 rows, ']'
+    assert json.loads(b''.join(chunks)) == items
+    _, body = stream_body('ndjson', iter(items))
+    assert [json.loads(line) for line in b''.join(body).splitlines()] == items
+    _, body = stream_body('json', iter([]))
+    assert b''.join(body) == b'[]'
+
+
+def test_memory_store_shorten_dedupes_and_pages():
+    """Test shorten() on the memory engine reuses records and pages newest first."""
+    store = MemoryStore()
+    gen = HashCodeGenerator()
+    first, created = shorten(store, gen, 'https://a.com')
+    again, created_again = shorten(store, gen, 'https://a.com')
+    assert created and not created_again and again is first
+    shorten(store, gen, 'https://b.com')
+    assert store.get_original_url(first.short_code) == 'https://a.com'
+    assert [r.original_url for r in store.iter_recent(limit=1)] == ['https://b.com']
+    cursor = encode_cursor(first.created_at, first.id + 1)
+    assert [r.original_url for r in store.iter_recent(cursor)] == ['https://a.com']
+    [row] = store.iter_recent_rows(limit=1)
+    assert row.original_url == 'https://b.com' and url_dict(row)['id'] == row.id
+    try:
+        store.insert('https://c.com', first.short_code)
+    except DuplicateError:
+        pass
+    else:
+        raise AssertionError('expected DuplicateError')
+    assert store.insert_many([{'original_url': 'https://c.com', 'url_hash': url_digest('https://c.com'),
+                               'short_code': first.short_code}]) is None
+
+
+def test_log_store_replays_and_drops_torn_tail(tmp_path):
+    """Test a reopened log rebuilds the index and truncates a half-written record."""
+    path = str(tmp_path / 'urls.log')
+    store = LogStore(path)
+    record = store.insert('https://a.com', 'abc')
+    store.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"id":2,"url":"https://b')
+    reopened = LogStore(path)
+    assert reopened.get_by_code('abc').id == record.id
+    assert [r.short_code for r in reopened.iter_recent()] == ['abc']
+    assert reopened.insert('https://b.com', 'def').id == 2
+    reopened.close()
+    assert len(open(path, 'rb').read().splitlines()) == 2
+
+
+def test_log_store_sees_other_writers(tmp_path):
+    """Test two stores on one log pick up each other's records and never reuse ids."""
+    path = str(tmp_path / 'urls.log')
+    a, b = LogStore(path), LogStore(path)
+    a.insert('https://a.com', 'abc')
+    assert b.get_original_url('abc') == 'https://a.com'
+    assert b.insert('https://b.com', 'def').id == 2
+    assert a.get_by_url('https://b.com').short_code == 'def'
+    a.close()
+    b.close()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test every added key is found and the false-positive rate stays near the target."""
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f'k{i}' for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f'x{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+    assert bloom.hashes == 7
+
+
+def test_code_filter_syncs_new_rows_and_rebuilds():
+    """Test the filter loads once, catches up on rows stored elsewhere and grows past capacity."""
+    rows = [(1, 'aaa')]
+    fetched = []
+
+    def fetch(after_id):
+        fetched.append(after_id)
+        return [row for row in rows if row[0] > after_id]
+
+    code_filter = CodeFilter(fetch, capacity=2, error_rate=0.01, sync_interval=3600)
+    assert code_filter.might_exist('aaa')
+    rows.append((2, 'bbb'))
+    assert not code_filter.might_exist('bbb')  # within the sync interval
+    assert fetched == [0]
+    code_filter.sync_interval = 0
+    assert code_filter.might_exist('bbb')
+    assert fetched == [0, 1]
+    rows.append((3, 'ccc'))
+    code_filter.sync()
+    assert code_filter.stats()['rebuilds'] == 1
+    assert code_filter.stats()['capacity'] == 4
+    assert all(code_filter.might_exist(code) for code in ('aaa', 'bbb', 'ccc'))
+
+
+def test_code_filter_sync_stops_at_deadline_and_resumes():
+    """Test a sync past its deadline keeps its progress and the next sync finishes the rest."""
+    import time
+    rows = [(i, f'code{i}') for i in range(1, 3001)]
+    fetched = []
+
+    def fetch(after_id):
+        fetched.append(after_id)
+        return iter([row for row in rows if row[0] > after_id])
+
+    code_filter = CodeFilter(fetch, capacity=10000, error_rate=0.01)
+    assert code_filter.sync(time.monotonic()) is False
+    assert code_filter.stats()['codes'] == 1024
+    assert code_filter.might_exist('code3000')  # the first lookup finishes loading
+    assert fetched == [0, 1024]
+    assert code_filter.stats()['codes'] == 3000
+
+
+def test_warmup_urls_puts_most_clicked_first():
+    """Test warmup takes the most clicked codes, then the newest, without repeats."""
+    def execute(sql):
+        if 'shorten_url_clicks' in sql:
+            return [('hot', 'https://hot.com'), ('warm', 'https://warm.com')]
+        return [('new', 'https://new.com'), ('hot', 'https://hot.com'), ('old', 'https://old.com')]
+
+    assert [code for code, _ in warmup_urls(execute, 3)] == ['hot', 'warm', 'new']
+
+
+def test_warm_up_fills_cache_and_filter_within_budget():
+    """Test warmup loads the cache and Bloom filter, and stops early when out of time."""
+    store = MemoryStore()
+    gen = HashCodeGenerator()
+    records = [shorten(store, gen, f'https://example.com/{i}')[0] for i in range(20)]
+
+    def newest(limit):
+        return ((r.short_code, r.original_url) for r in store.iter_recent_rows(limit=limit))
+
+    cache = LRUCache(100)
+    code_filter = CodeFilter(store.codes_after)
+    loaded = warm_up(cache, code_filter, newest, limit=10, budget=5)
+    assert loaded['warmup_urls'] == 10 and loaded['warmup_filter_loaded']
+    assert cache.get(records[-1].short_code) == records[-1].original_url
+    assert cache.get(records[0].short_code, None) is None
+    assert code_filter.stats()['codes'] == 20
+
+    cache = LRUCache(100)
+    loaded = warm_up(cache, CodeFilter(store.codes_after), newest, limit=10, budget=0)
+    assert loaded['warmup_urls'] == 1 and not loaded['warmup_filter_loaded']
+
+
+def test_cli_import_export_round_trip(tmp_path):
+    """Test import skips bad and duplicate rows, restores deferred indexes and export streams it back."""
+    import io
+    from fastapi_app.models import Base
+    url = f"sqlite:///{tmp_path / 'cli.db'}"
+    engine = configure_engine(create_engine(url, **engine_options(url)))
+    Base.metadata.create_all(engine)
+    source = io.StringIO(
+        'url,code,created_at\n'
+        'https://a.com,aaa,2024-01-01T12:00:00+02:00\n'
+        'not-a-url,bbb,\n'
+        'https://b.com,bbb,\n'
+        'https://a.com,ccc,\n'
+    )
+    summary = import_records(engine, read_records(source, 'csv'), chunk_size=2, commit_every=2)
+    assert (summary['inserted'], summary['invalid'], summary['skipped']) == (2, 1, 1)
+    assert 'ix_shorten_url_created_at' in {i['name'] for i in inspect(engine).get_indexes('shorten_url')}
+
+    out = io.StringIO()
+    write_records(out, 'ndjson', export_records(engine))
+    rows = list(read_records(io.StringIO(out.getvalue()), 'ndjson'))
+    assert [(r['url'], r['code']) for r in rows] == [('https://a.com', 'aaa'), ('https://b.com', 'bbb')]
+    assert rows[0]['created_at'] == '2024-01-01T10:00:00'
+    engine.dispose()
+
+
+def test_cli_import_counts_malformed_lines_and_unroutable_codes(tmp_path):
+    """Test bad NDJSON lines and codes no redirect could reach are counted as invalid, not fatal."""
+    import io
+    from fastapi_app.models import Base
+    url = f"sqlite:///{tmp_path / 'cli.db'}"
+    engine = configure_engine(create_engine(url, **engine_options(url)))
+    Base.metadata.create_all(engine)
+    lines = [
+        '{"url": "https://a.com", "code": "aaa"}',
+        '{not json',
+        '"x"',
+        '[]',
+        '{"url": "https://b.com", "code": 123}',
+        '{"url": ["https://b.com"], "code": "bbb"}',
+        '{"url": "https://b.com", "code": "api"}',
+        '{"url": "https://b.com", "code": "metrics"}',
+        '{"url": "https://b.com", "code": "a/b"}',
+        '{"url": "https://b.com", "code": "' + 'c' * 51 + '"}',
+        '{"url": "https://b.com", "code": "' + 'c' * 50 + '"}',
+    ]
+    summary = import_records(engine, read_records(io.StringIO('\n'.join(lines)), 'ndjson'))
+    assert (summary['inserted'], summary['invalid']) == (2, 9)
+    assert [code for _, code, _, _ in export_records(engine)] == ['aaa', 'c' * 50]
+    engine.dispose()
+
+
+def test_fast_redirect_only_serves_cached_codes():
+    """Test the fast path skips reserved paths, nested paths and known-missing codes."""
+    cache = LRUCache()
+    cache.set('abc', 'https://a.com/ü?q=1')
+    cache.set('metrics', 'https://shadowed.example.com')
+    cache.set('gone', None)
+    assert cached_target(cache, '/abc') == ('abc', 'https://a.com/ü?q=1')
+    assert location('https://a.com/ü?q=1') == 'https://a.com/%C3%BC?q=1'
+    for path in ('/metrics', '/', '/api/urls', '/gone', '/unknown'):
+        assert cached_target(cache, path) == (None, None)
+
+
+def test_group_committer_batches_concurrent_inserts():
+    """Test concurrent inserts share one write and duplicates come back as DuplicateError."""
+    from concurrent.futures import ThreadPoolExecutor
+    writes = []
+
+    def write(rows):
+        writes.append(len(rows))
+        return [None if row['short_code'] == 'taken' else UrlRecord(1, row['original_url'], row['url_hash'],
+                                                                      row['short_code'], None) for row in rows]
+
+    committer = GroupCommitter(write, max_batch=8, max_delay=0.2)
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            records = list(pool.map(lambda i: committer.insert(f'https://{i}.com', f'c{i}'), range(8)))
+        assert [r.short_code for r in records] == [f'c{i}' for i in range(8)]
+        assert writes == [8]
+        try:
+            committer.insert('https://x.com', 'taken')
+        except DuplicateError:
+            pass
+        else:
+            raise AssertionError('expected DuplicateError')
+        assert committer.stats()['largest_batch'] == 8
+    finally:
+        committer.stop()
+
+
+def test_sqlalchemy_url_writer_claims_first_row_per_url(tmp_path):
+    """Test one group insert stores each new URL once and reports the losers as None."""
+    from fastapi_app.models import Base, ShortenUrl
+    url = f"sqlite:///{tmp_path / 'group.db'}"
+    engine = configure_engine(create_engine(url, **engine_options(url)))
+    Base.metadata.create_all(engine)
+    write = sqlalchemy_url_writer(lambda: engine, ShortenUrl)
+
+    def row(u, code):
+        return {'original_url': u, 'url_hash': url_digest(u), 'short_code': code,
+                'created_at': '2024-01-01 00:00:00.000000', 'expires_at': None}
+
+    first = write([row('https://a.com', 'aaa'), row('https://a.com', 'aaa'), row('https://b.com', 'aaa')])
+    assert first[0].short_code == 'aaa' and first[0].id == 1
+    assert first[0].created_at == datetime(2024, 1, 1)
+    assert first[1:] == [None, None]
+    assert write([row('https://a.com', 'zzz')]) == [None]
+    # The same URL and code stored before the batch is a conflict, not a new record.
+    assert write([row('https://a.com', 'aaa')]) == [None]
+    engine.dispose()
+
+
+def test_group_committer_writes_directly_without_a_writer():
+    """Test a caller neither waits forever on a stuck writer nor queues behind a dead one."""
+    import threading
+    release = threading.Event()
+    writes = []
+
+    def write(rows):
+        writes.append([row['short_code'] for row in rows])
+        if rows[0]['short_code'] == 'slow':
+            release.wait(5)
+        return [UrlRecord(len(writes), row['original_url'], row['url_hash'], row['short_code'], None)
+                for row in rows]
+
+    committer = GroupCommitter(write, max_batch=1, max_delay=0, timeout=0.3)
+    slow = []
+    try:
+        stuck = threading.Thread(target=lambda: slow.append(committer.insert('https://slow.com', 'slow')))
+        stuck.start()
+        while not writes:
+            time.sleep(0.01)
+        assert committer.insert('https://a.com', 'aaa').short_code == 'aaa'
+        assert writes == [['slow'], ['aaa']]
+        time.sleep(0.4)  # a row the writer has taken is waited for past the timeout
+        release.set()
+        stuck.join()
+        assert slow[0].short_code == 'slow'
+        time.sleep(0.05)
+        assert writes == [['slow'], ['aaa']]  # the abandoned row is not written again
+        assert committer.stats()['direct_writes'] == 1
+    finally:
+        release.set()
+        committer.stop()
+
+    committer._thread = threading.Thread(target=lambda: None)
+    committer._thread.start()
+    committer._thread.join()
+    assert committer.insert('https://b.com', 'bbb').short_code == 'bbb'
+    assert committer.stats()['direct_writes'] == 2
+
+
+def test_memory_store_expiry_hides_revives_and_sweeps():
+    """Test expired links stop resolving, revive when shortened again and are deleted by the sweeper."""
+    store = MemoryStore()
+    gen = HashCodeGenerator()
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    record, _ = shorten(store, gen, 'https://a.com', past)
+    shorten(store, gen, 'https://b.com', past)
+    shorten(store, gen, 'https://c.com')
+    assert store.get_by_code(record.short_code) is not None
+    assert store.get_target(record.short_code) is None
+
+    revived, created = shorten(store, gen, 'https://a.com', parse_expires_in(60))
+    assert created and revived.short_code == record.short_code
+    assert store.get_target(record.short_code)[0] == 'https://a.com'
+
+    evicted = []
+    sweeper = ExpirySweeper(store.delete_expired, evicted.append, batch_size=1, pause=0)
+    assert sweeper.sweep() == 1
+    assert store.get_by_url('https://b.com') is None and len(evicted) == 1
+    assert sweeper.stats()['batches'] == 2
+    assert shorten(store, gen, 'https://d.com')[0].id == 4  # ids are never reused
+
+
+def test_memory_store_sweeps_leave_listings_whole():
+    """Test swept records drop out of listings and pages at once, and the row list is compacted lazily."""
+    store = MemoryStore()
+    gen = HashCodeGenerator()
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    records = [shorten(store, gen, f'https://{i}.com', past if i % 4 else None)[0] for i in range(8)]
+    assert store.delete_expired(1) == [records[1].short_code]
+    assert len(store._rows) == 8  # a small batch only leaves a tombstone
+    live = [r.short_code for r in records if r is not records[1]]
+    assert [r.short_code for r in store.iter_recent(limit=3)] == live[:-4:-1]
+    assert [code for _, code in store.codes_after(0)] == live
+    cursor = encode_cursor(records[3].created_at, records[3].id)
+    assert [r.short_code for r in store.iter_recent(cursor, 2)] == [records[2].short_code, records[0].short_code]
+
+    assert len(store.delete_expired(10)) == 5
+    assert store._rows == [records[0], records[4]]
+    assert [r.short_code for r in store.iter_recent()] == [records[4].short_code, records[0].short_code]
+
+
+def test_log_store_replays_renewals_and_deletions(tmp_path):
+    """Test a reopened log store sees expiries, revivals and sweeps made before."""
+    path = str(tmp_path / 'urls.log')
+    store = LogStore(path)
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    a, _ = shorten(store, HashCodeGenerator(), 'https://a.com', past)
+    shorten(store, HashCodeGenerator(), 'https://b.com', past)
+    store.renew(a)
+    assert len(store.delete_expired(10)) == 1
+    store.close()
+
+    reopened = LogStore(path)
+    assert reopened.get_target(a.short_code) == ('https://a.com', None)
+    assert reopened.get_by_url('https://b.com') is None
+    reopened.close()
+
+
+def test_cache_redirect_bounds_expiring_links(tmp_path):
+    """Test expiring links are cached no longer than they live and never shared."""
+    cache = LRUCache()
+    cache_redirect(cache, 'old', 'https://a.com', datetime.now(timezone.utc) - timedelta(seconds=1))
+    assert cache.get('old') is MISSING
+    shared = SharedRedirectStore(str(tmp_path / 'redirects'), slots=64)
+    cache = SharedBackedCache(shared)
+    cache_redirect(cache, 'soon', 'https://b.com', parse_expires_in(60))
+    cache_redirect(cache, 'never', 'https://c.com')
+    assert cache.get('soon') == 'https://b.com'
+    assert shared.get('soon') is None and shared.get('never') == 'https://c.com'
+
+
+def test_sqlalchemy_delete_expired_keeps_newest_row(tmp_path):
+    """Test the SQL sweep deletes expired links with their clicks but never the newest row."""
+    from fastapi_app.models import Base, ShortenUrl
+    url = f"sqlite:///{tmp_path / 'expiry.db'}"
+    engine = configure_engine(create_engine(url, **engine_options(url)))
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for i in range(3):
+            conn.execute(text(
+                'INSERT INTO shorten_url (original_url, url_hash, short_code, created_at, expires_at) '
+                "VALUES (:u, :h, :c, '2024-01-01 00:00:00', '2024-01-02 00:00:00')"
+            ), {'u': f'https://{i}.com', 'h': url_digest(f'https://{i}.com'), 'c': f'c{i}'})
+        conn.execute(text("INSERT INTO shorten_url_clicks (short_code, clicks) VALUES ('c0', 5)"))
+    delete_expired = sqlalchemy_expiry_deleter(lambda: engine, ShortenUrl)
+    assert delete_expired(1) == ['c0']
+    assert delete_expired(10) == ['c1']
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT short_code FROM shorten_url')).scalars().all() == ['c2']
+        assert conn.execute(text('SELECT COUNT(*) FROM shorten_url_clicks')).scalar() == 0
+    engine.dispose()
+
+
+def test_hash_ring_only_moves_keys_to_an_added_shard():
+    """Test growing the ring moves a fair share of keys, all of them onto the new shard."""
+    keys = [f'code{i}' for i in range(4000)]
+    four, five = HashRing(4), HashRing(5)
+    moved = [key for key in keys if four.shard_for(key) != five.shard_for(key)]
+    assert all(five.shard_for(key) == 4 for key in moved)
+    assert 0.1 < len(moved) / len(keys) < 0.3
+    assert set(four.group(keys)) == {0, 1, 2, 3}
+
+
+def test_sharded_store_dedupes_and_merges_listings(tmp_path):
+    """Test links spread over shards, dedupe across them and page back newest first without gaps."""
+    store = ShardedStore(shard_urls('test', 3, tmp_path))
+    gen = HashCodeGenerator()
+    records = [shorten(store, gen, f'https://{i}.example.com')[0] for i in range(30)]
+    assert len({record.id % 256 for record in records}) == 3
+    again, created = shorten(store, gen, 'https://7.example.com')
+    assert not created and again.short_code == records[7].short_code
+    assert store.get_target(records[3].short_code) == ('https://3.example.com', None)
+
+    from common.pagination import split_page
+    seen, cursor = [], None
+    while True:
+        page, cursor = split_page(list(store.iter_recent_rows(cursor, 8)), 7)
+        seen += [row.short_code for row in page]
+        if not cursor:
+            break
+    assert seen == [record.short_code for record in reversed(records)]
+    assert sorted(code for _, code in store.codes_after(0)) == sorted(r.short_code for r in records)
+    position = max(position for position, _ in store.codes_after(0))
+    new, _ = shorten(store, gen, 'https://new.example.com')
+    assert [code for _, code in store.codes_after(position)] == [new.short_code]
+    store.close()
+
+
+def test_sharded_store_sweeps_and_releases_claims(tmp_path):
+    """Test expired links are swept from every shard and their URLs can be shortened again."""
+    store = ShardedStore(shard_urls('test', 2, tmp_path))
+    gen = HashCodeGenerator()
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    expiring = [shorten(store, gen, f'https://{i}.example.com', past)[0] for i in range(6)]
+    # Each shard keeps its newest row, so give both a newer link that never expires.
+    kept, i = set(), 0
+    while len(kept) < 2:
+        kept.add(shorten(store, gen, f'https://keep{i}.example.com')[0].id % 256)
+        i += 1
+    assert sorted(store.delete_expired(10)) == sorted(r.short_code for r in expiring)
+    assert store.get_by_url('https://0.example.com') is None
+    record, created = shorten(store, gen, 'https://0.example.com')
+    assert created and store.get_by_url('https://0.example.com').short_code == record.short_code
+    store.close()
+
+
+def test_sharded_store_never_reuses_a_dropped_id(tmp_path):
+    """Test a code stored after the newest row of its shard was dropped still shows up in codes_after."""
+    store = ShardedStore(shard_urls('test', 1, tmp_path))
+    store.insert('https://a.com', 'aaaa')
+    [(position, _)] = store.codes_after(0)
+    store._drop(['aaaa'])
+    store.insert('https://b.com', 'bbbb')
+    assert [code for _, code in store.codes_after(position)] == ['bbbb']
+    store.close()
+
+
+def test_rebalance_keeps_every_link_reachable(tmp_path):
+    """Test links and dedupe survive growing and shrinking the number of shards."""
+    store = ShardedStore(shard_urls('test', 2, tmp_path))
+    gen = HashCodeGenerator()
+    records = [shorten(store, gen, f'https://{i}.example.com')[0] for i in range(40)]
+    store.close()
+    for old, new in ((2, 5), (5, 3)):
+        summary = rebalance('test', old, new, tmp_path)
+        assert 0 < summary['links'] < len(records)
+        store = ShardedStore(shard_urls('test', new, tmp_path))
+        assert all(store.get_target(r.short_code) == (r.original_url, None) for r in records)
+        assert not shorten(store, gen, 'https://11.example.com')[1]
+        assert len(list(store.iter_recent_rows())) == len(records)
+        store.close()
+    assert len(summary['removed']) == 2 and not os.path.exists(summary['removed'][0])
+
+
+def _join_flight(flight, key, fn, callers):
+    """Run flight.do(key, fn) on callers threads, holding the first call until all have joined."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    release = threading.Event()
+
+    def held():
+        release.wait(5)
+        return fn()
+
+    def call(_):
+        try:
+            return flight.do(key, held)
+        except ValueError as exc:
+            return exc
+
+    with ThreadPoolExecutor(callers) as pool:
+        results = [pool.submit(call, i) for i in range(callers)]
+        deadline = time.monotonic() + 5
+        while flight.shared < callers - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        return [future.result() for future in results]
+
+
+def test_single_flight_shares_one_call_across_threads():
+    """Test concurrent calls for one key run it once, share its result or error, and nothing is cached."""
+    flight = SingleFlight()
+    calls = []
+    results = _join_flight(flight, 'k', lambda: calls.append(1) or len(calls), 8)
+    assert calls == [1]
+    assert sorted(results) == [(1, False)] + [(1, True)] * 7
+    assert flight.do('k', lambda: 'again') == ('again', False)
+
+    def fail():
+        raise ValueError('boom')
+
+    errors = _join_flight(flight, 'k', fail, 4)
+    assert all(str(error) == 'boom' for error in errors)
+    assert flight.stats() == {'enabled': True, 'calls': 3, 'shared': 10, 'in_flight': 0}
+
+
+def test_async_single_flight_survives_a_cancelled_caller():
+    """Test awaits for one key share a single call, which outlives the caller that started it."""
+    import asyncio
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def load(code):
+        calls.append(code)
+        await asyncio.sleep(0.01)
+        return code.upper()
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do('abc', load, 'abc'))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.do('abc', load, 'abc')) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == [('ABC', True)] * 3
+    assert calls == ['abc']
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_cached_redirect_lookup_coalesces_concurrent_misses():
+    """Test concurrent misses for one code share a single load."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    cache = LRUCache(maxsize=10)
+    flight = SingleFlight()
+    barrier = threading.Barrier(8)
+    calls = []
+
+    def load(code):
+        calls.append(code)
+        time.sleep(0.05)
+        return 'https://example.com', None
+
+    def lookup(_):
+        barrier.wait()
+        return cached_redirect_lookup(cache, 'hot', load, flight=flight)
+
+    with ThreadPoolExecutor(8) as pool:
+        assert list(pool.map(lookup, range(8))) == ['https://example.com'] * 8
+    # A caller arriving after the load finished is served by the cache instead.
+    assert calls == ['hot']
+
+
+def test_shorten_with_single_flight_creates_once():
+    """Test concurrent shortens of one URL share one attempt, which alone reports the creation."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    release = threading.Event()
+
+    class SlowStore(MemoryStore):
+        def get_by_url(self, url):
+            release.wait(5)
+            return super().get_by_url(url)
+
+    store, gen, flight = SlowStore(), HashCodeGenerator(), SingleFlight()
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(shorten, store, gen, 'https://example.com', None, flight) for _ in range(4)]
+        deadline = time.monotonic() + 5
+        while flight.shared < 3 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+    assert sorted(created for _, created in results) == [False, False, False, True]
+    assert len({id(record) for record, _ in results}) == 1
+    assert isinstance(results[0][0], UrlRecord) and len(list(store.iter_recent_rows())) == 1
+
+
+def test_ashorten_survives_the_leaders_session_closing(tmp_path):
+    """Test a shared async shorten runs in its own session and hands every caller a detached record."""
+    import asyncio
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from common.sql_store import AsyncSQLAlchemyStore
+    from fastapi_app.models import Base, ShortenUrl
+    path = tmp_path / 'async.db'
+    Base.metadata.create_all(create_engine(f'sqlite:///{path}'))
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    gen = HashCodeGenerator()
+    flight = AsyncSingleFlight()
+
+    async def main():
+        leader_session = AsyncSession(engine, expire_on_commit=False)
+        leader = asyncio.ensure_future(
+            ashorten(AsyncSQLAlchemyStore(leader_session, ShortenUrl), gen, 'https://a.example.com', flight=flight)
+        )
+        await asyncio.sleep(0)
+        async with AsyncSession(engine) as session:
+            store = AsyncSQLAlchemyStore(session, ShortenUrl)
+            followers = [
+                asyncio.ensure_future(ashorten(store, gen, 'https://a.example.com', flight=flight)) for _ in range(3)
+            ]
+            await asyncio.sleep(0)
+            leader.cancel()
+            await leader_session.close()
+            results = await asyncio.gather(*followers)
+            again, created = await ashorten(store, gen, 'https://a.example.com')
+        await engine.dispose()
+        return results, again, created
+
+    results, again, created = asyncio.run(main())
+    assert all(isinstance(record, UrlRecord) and not created for record, created in results)
+    assert {record.short_code for record, _ in results} == {again.short_code}
+    assert not created
+
+
+def test_not_modified_matches_etags_weakly_and_dates():
+    """Test If-None-Match wins over If-Modified-Since and compares ETags weakly."""
+    validators = list_validators(('7', datetime(2024, 1, 2, 3, 4, 5, 600000)))
+    assert validators['ETag'] == 'W/"7"' and validators['Last-Modified'] == 'Tue, 02 Jan 2024 03:04:06 GMT'
+    assert not_modified(validators, {'If-None-Match': '"6", "7"'})
+    assert not_modified(validators, {'If-None-Match': '*'})
+    assert not not_modified(validators, {'If-None-Match': 'W/"6"', 'If-Modified-Since': validators['Last-Modified']})
+    assert not_modified(validators, {'If-Modified-Since': validators['Last-Modified']})
+    assert not not_modified(validators, {'If-Modified-Since': 'Tue, 02 Jan 2024 03:04:05 GMT'})
+    assert not not_modified(validators, {'If-Modified-Since': 'yesterday'})
+    assert list_validators(None) == {} and not not_modified({}, {'If-None-Match': '*'})
+    # Within the second of the last write another write could still share its Last-Modified.
+    fresh = list_validators(('8', datetime.now(timezone.utc)))
+    assert 'Last-Modified' not in fresh
+    assert not not_modified(fresh, {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+
+
+def test_redirect_cache_control_caps_expiring_links(monkeypatch):
+    """Test an expiring link's max-age never outlives it."""
+    from common import http_cache
+    soon = ExpiringUrl('https://a.com', datetime.now(timezone.utc) + timedelta(seconds=30))
+    assert redirect_cache_control(soon) is None
+    monkeypatch.setattr(http_cache, 'REDIRECT_CACHE_CONTROL', 'public, max-age=600, s-maxage=20')
+    assert redirect_cache_control('https://a.com') == 'public, max-age=600, s-maxage=20'
+    assert redirect_cache_control(soon) in ('public, max-age=29, s-maxage=20', 'public, max-age=30, s-maxage=20')
+    monkeypatch.setattr(http_cache, 'REDIRECT_CACHE_CONTROL', 'public')
+    assert redirect_cache_control(soon).startswith('public, max-age=')
+
+
+def test_store_versions_change_with_every_write(tmp_path):
+    """Test each engine's version moves on inserts, renewals and sweeps, and workers agree on a log's."""
+    gen = HashCodeGenerator()
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    log_path = str(tmp_path / 'urls.log')
+    stores = [MemoryStore(), LogStore(log_path), ShardedStore(shard_urls('test', 2, tmp_path))]
+    for store in stores:
+        seen = [store.version()]
+        record = shorten(store, gen, 'https://a.example.com', past)[0]
+        seen.append(store.version())
+        shorten(store, gen, 'https://b.example.com')
+        seen.append(store.version())
+        store.renew(record, past)
+        seen.append(store.version())
+        assert seen[-1] == store.version()
+        assert len({tag for tag, _ in seen}) == len(seen)
+        assert seen[-1][1] is not None
+    assert LogStore(log_path).version()[0] == stores[1].version()[0]
+    stores[2].close()
+
+
+def test_url_version_triggers_count_every_writer(tmp_path):
+    """Test the SQL table version also moves for plain-SQL writers such as group commit and the sweeper."""
+    from fastapi_app.models import Base, ShortenUrl
+    from common.sql_store import SQLAlchemyStore
+    from sqlalchemy.orm import Session
+    url = f"sqlite:///{tmp_path / 'version.db'}"
+    engine = configure_engine(create_engine(url, **engine_options(url)))
+    Base.metadata.create_all(engine)
+    Base.metadata.create_all(engine)
+
+    def version():
+        with Session(engine) as session:
+            return SQLAlchemyStore(session, ShortenUrl).version()
+
+    epoch, count = version()[0].split('.')
+    assert count == '0' and version()[1] is None
+    sqlalchemy_url_writer(lambda: engine, ShortenUrl)([
+        {'original_url': f'https://{i}.com', 'url_hash': url_digest(f'https://{i}.com'), 'short_code': f'c{i}',
+         'created_at': '2024-01-01 00:00:00.000000', 'expires_at': '2024-01-02 00:00:00.000000'}
+        for i in range(3)
+    ])
+    tag, modified_at = version()
+    assert tag == f'{epoch}.3' and isinstance(modified_at, datetime)
+    assert sqlalchemy_expiry_deleter(lambda: engine, ShortenUrl)(10) == ['c0', 'c1']
+    assert version()[0] == f'{epoch}.5'
+    engine.dispose()
+
+    # A recreated database starts counting again under a new epoch.
+    Base.metadata.drop_all(engine)
+    for sql in DROP_URL_VERSION_SQL:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(sql)
+    Base.metadata.create_all(engine)
+    assert version()[0].endswith('.0') and not version()[0].startswith(epoch)
+    engine.dispose()
+
+
+def test_negotiate_honours_quality_values():
+    """Test Accept-Encoding picks the best supported encoding and respects q=0."""
+    assert negotiate('gzip, deflate') == 'gzip'
+    assert negotiate('deflate') is None
+    assert negotiate('gzip;q=0, *;q=0.5') is None
+    assert negotiate('*') == negotiate('br, gzip')
+    assert negotiate('identity;q=1, gzip;q=0.1') == 'gzip'
+    assert negotiate(None) is None
+
+
+def test_encode_body_skips_small_bodies_and_streams_compress_whole():
+    """Test small bodies go out as they are, and streamed chunks decompress to the whole body."""
+    body, headers = encode_body(b'[]', {'X-Next-Cursor': 'c'}, 'gzip')
+    assert body == b'[]' and headers == {'X-Next-Cursor': 'c', 'Vary': 'Accept-Encoding'}
+    big = b'{"short_code":"abc"},' * 200
+    body, headers = encode_body(big, {}, 'gzip')
+    assert headers['Content-Encoding'] == 'gzip' and gzip.decompress(body) == big
+    streamed = b''.join(compress_stream(['<p>', b'x' * 5000, '</p>'], 'gzip'))
+    assert gzip.decompress(streamed) == b'<p>' + b'x' * 5000 + b'</p>'
+
+
+def test_list_snapshots_build_once_per_version_and_compress_once():
+    """Test concurrent requests at one version share a build, and each encoding is compressed once."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    snapshots = ListSnapshots()
+    barrier = threading.Barrier(8)
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)
+        return b'[' + b'{"id":1},' * 200 + b']', {'X-Next-Cursor': 'c'}
+
+    def request(_):
+        barrier.wait()
+        return snapshots.encode(snapshots.get(('urls', 50), ('1', None), build), 'gzip')
+
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(request, range(8)))
+    assert len(builds) == 1 and len({body for body, _ in responses}) == 1
+    assert responses[0][1]['Content-Encoding'] == 'gzip' and responses[0][1]['X-Next-Cursor'] == 'c'
+    assert snapshots.stats()['compressions'] == 1
+    snapshots.get(('urls', 50), ('2', None), build)
+    snapshots.get(('urls', 50), None, build)
+    assert len(builds) == 3 and snapshots.stats()['snapshots'] == 1
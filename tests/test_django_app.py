@@ -3,13 +3,17 @@ Tests for Django URL shortener.
 """
 import os
 import sys
+import gzip
 import json
+from datetime import timedelta
+from unittest import mock
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'django_app')))
 
 import pytest
 from django.test import TestCase, Client
+from django.utils import timezone
 from django.urls import reverse
 
 # Setup Django
@@ -17,12 +21,25 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_app.settings')
 import django
 django.setup()
 
+from common import http_cache, metrics, startup
+from common.startup import warm_up
+from common.store import MemoryStore
+from shortener.middleware import CachedRedirect
+from shortener.models import ShortenUrl
+from shortener.views import click_recorder, code_filter, expiry_sweeper, redirect_cache, warmup_urls
+
 
 class URLShortenerTests(TestCase):
     """Test cases for Django URL shortener APIs."""
 
     def setUp(self):
         self.client = Client()
+        redirect_cache.clear()
+        code_filter.clear()
+        click_recorder.interval = 0  # tests flush clicks explicitly
+
+    def tearDown(self):
+        click_recorder.clear()
 
     def test_get_all_urls_empty(self):
         """Test get_all_urls returns empty list when no URLs exist."""
@@ -103,6 +120,51 @@ class URLShortenerTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, 'https://python.org')
 
+    def test_url_stats_counts_clicks(self):
+        """Test redirects are counted once the click buffer is flushed."""
+        shorten_resp = self.client.post(
+            '/api/shorten',
+            data=json.dumps({'url': 'https://clicks.example.com'}),
+            content_type='application/json'
+        )
+        short_code = json.loads(shorten_resp.content)['short_code']
+        self.assertEqual(json.loads(self.client.get(f'/api/urls/{short_code}/stats').content)['clicks'], 0)
+        for _ in range(3):
+            self.client.get(f'/{short_code}')
+        click_recorder.flush()
+        self.client.get(f'/{short_code}')
+        click_recorder.flush()
+        data = json.loads(self.client.get(f'/api/urls/{short_code}/stats').content)
+        self.assertEqual(data['clicks'], 4)
+        self.assertLessEqual(data['first_clicked_at'], data['last_clicked_at'])
+
+    def test_url_stats_not_found(self):
+        """Test stats for an unknown short code return 404."""
+        self.assertEqual(self.client.get('/api/urls/nonexistent/stats').status_code, 404)
+
+    def test_metrics_endpoint_reports_requests_and_operations(self):
+        """Test /metrics exposes request and hot-path histograms when enabled."""
+        metrics.set_enabled(True)
+        try:
+            shorten_resp = self.client.post(
+                '/api/shorten',
+                data=json.dumps({'url': 'https://metrics.example.com'}),
+                content_type='application/json'
+            )
+            self.client.get(f"/{json.loads(shorten_resp.content)['short_code']}")
+            response = self.client.get('/metrics')
+        finally:
+            metrics.set_enabled(False)
+            metrics.reset()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count{framework="django",method="GET",route="/<str:code>",status="302"} 1',
+            body,
+        )
+        self.assertIn('url_shortener_operation_seconds_count{operation="shorten.commit"} 1', body)
+
     def test_redirect_not_found(self):
         """Test redirect returns 404 for non-existent short code."""
         response = self.client.get('/nonexistent')
@@ -129,3 +191,248 @@ class URLShortenerTests(TestCase):
         d1, d2 = json.loads(r1.content), json.loads(r2.content)
         self.assertEqual(d1['short_code'], d2['short_code'])
         self.assertEqual(d1['original_url'], d2['original_url'])
+
+    def test_redirect_served_from_cache(self):
+        """Test repeated redirects hit the cache instead of the database."""
+        shorten_resp = self.client.post(
+            '/api/shorten',
+            data=json.dumps({'url': 'https://cache.example.com'}),
+            content_type='application/json'
+        )
+        short_code = json.loads(shorten_resp.content)['short_code']
+        ShortenUrl.objects.filter(short_code=short_code).delete()
+        response = self.client.get(f'/{short_code}')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, 'https://cache.example.com')
+        self.assertEqual(redirect_cache.stats()['hits'], 1)
+
+    def test_get_all_urls_paginates_with_cursor(self):
+        """Test get_all_urls pages newest first and follows X-Next-Cursor."""
+        for i in range(3):
+            self.client.post(
+                '/api/shorten',
+                data=json.dumps({'url': f'https://page{i}.example.com'}),
+                content_type='application/json'
+            )
+        first = self.client.get('/api/urls', {'limit': 2})
+        self.assertEqual(
+            [u['original_url'] for u in json.loads(first.content)],
+            ['https://page2.example.com', 'https://page1.example.com']
+        )
+        second = self.client.get('/api/urls', {'limit': 2, 'cursor': first['X-Next-Cursor']})
+        self.assertEqual(
+            [u['original_url'] for u in json.loads(second.content)],
+            ['https://page0.example.com']
+        )
+        self.assertNotIn('X-Next-Cursor', second)
+
+    def test_get_all_urls_invalid_cursor(self):
+        """Test get_all_urls returns 400 for a malformed cursor."""
+        response = self.client.get('/api/urls', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_all_urls_stream_ndjson(self):
+        """Test get_all_urls streams NDJSON rows."""
+        for i in range(2):
+            self.client.post(
+                '/api/shorten',
+                data=json.dumps({'url': f'https://stream{i}.example.com'}),
+                content_type='application/json'
+            )
+        response = self.client.get('/api/urls', {'stream': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)['original_url'] for line in lines],
+            ['https://stream1.example.com', 'https://stream0.example.com']
+        )
+
+    def test_home_page_is_bounded(self):
+        """Test the home page renders one window of recent URLs with an older-page link."""
+        from common.home_page import HOME_PAGE_SIZE
+        for i in range(HOME_PAGE_SIZE + 1):
+            self.client.post(
+                '/api/shorten',
+                data=json.dumps({'url': f'https://home{i}.example.com'}),
+                content_type='application/json'
+            )
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        html = response.getvalue().decode()
+        self.assertIn(f'https://home{HOME_PAGE_SIZE}.example.com', html)
+        self.assertNotIn('https://home0.example.com', html)
+        self.assertIn('Older &raquo;', html)
+
+    def test_shorten_url_retries_on_code_collision(self):
+        """Test a colliding short code falls through to the next candidate."""
+        from shortener.views import code_generator
+        url = 'https://collide.example.com'
+        taken = next(code_generator.candidates(url))
+        ShortenUrl.objects.create(original_url='https://other.example.com', url_hash='x' * 64, short_code=taken)
+        response = self.client.post(
+            '/api/shorten',
+            data=json.dumps({'url': url}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(json.loads(response.content)['short_code'], taken)
+
+    def test_reserve_block_is_monotonic(self):
+        """Test code ID blocks never overlap."""
+        from shortener.views import _reserve_block
+        self.assertEqual(_reserve_block(10), 1)
+        self.assertEqual(_reserve_block(10), 11)
+
+    def test_shorten_batch_mixed_items(self):
+        """Test batch shorten returns one result per input, in order."""
+        self.client.post(
+            '/api/shorten',
+            data=json.dumps({'url': 'https://existing.example.com'}),
+            content_type='application/json'
+        )
+        items = ['https://new.example.com', 'not-a-url', {'url': 'https://existing.example.com'},
+                 'https://new.example.com']
+        response = self.client.post('/api/shorten/batch', data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)
+        self.assertEqual([r['status'] for r in results], [201, 400, 201, 201])
+        self.assertTrue(results[0]['created'])
+        self.assertFalse(results[2]['created'])
+        self.assertEqual(results[0]['short_code'], results[3]['short_code'])
+        redirect = self.client.get(f"/{results[0]['short_code']}")
+        self.assertEqual(redirect.url, 'https://new.example.com')
+
+    def test_shorten_batch_ndjson(self):
+        """Test batch shorten accepts NDJSON bodies."""
+        body = '"https://a.example.com"\n{"url": "https://b.example.com"}\n'
+        response = self.client.post('/api/shorten/batch', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [r['original_url'] for r in json.loads(response.content)],
+            ['https://a.example.com', 'https://b.example.com']
+        )
+
+    def test_memory_store_backend(self):
+        """Test the API runs unchanged on the memory store engine."""
+        with mock.patch('shortener.views.store', MemoryStore()):
+            response = self.client.post('/api/shorten', data=json.dumps({'url': 'https://memory.example.com'}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            code = json.loads(response.content)['short_code']
+            self.assertEqual(self.client.get(f'/{code}').url, 'https://memory.example.com')
+            self.assertEqual([u['short_code'] for u in json.loads(self.client.get('/api/urls').content)], [code])
+        self.assertEqual(ShortenUrl.objects.count(), 0)
+
+    def test_unknown_code_rejected_by_bloom_filter(self):
+        """Test a never-stored code 404s without a lookup or a negative cache entry."""
+        self.assertEqual(self.client.get('/wp-login.php').status_code, 404)
+        self.assertEqual(code_filter.stats()['rejected'], 1)
+        self.assertEqual(redirect_cache.stats()['size'], 0)
+
+    def test_cached_redirect_bypasses_view(self):
+        """Test a cached code is answered by the middleware fast path."""
+        redirect_cache.set('cachedfp', 'https://cached.example.com')
+        response = self.client.get('/cachedfp')
+        self.assertIsInstance(response, CachedRedirect)
+        self.assertEqual(response.url, 'https://cached.example.com')
+
+    def test_cached_redirect_marks_first_redirect(self):
+        """Test a fast-path hit counts as the worker's first redirect for the startup gauges."""
+        redirect_cache.set('firstfp', 'https://first.example.com')
+        with mock.patch.object(startup, '_first_redirect', None):
+            self.assertIsInstance(self.client.get('/firstfp'), CachedRedirect)
+            self.assertIsNotNone(startup.stats()['first_redirect_seconds'])
+
+    def test_warm_up_loads_stored_redirects(self):
+        """Test startup warmup fills the redirect cache and Bloom filter from the database."""
+        response = self.client.post('/api/shorten', data=json.dumps({'url': 'https://warm.example.com'}),
+                                    content_type='application/json')
+        code = json.loads(response.content)['short_code']
+        redirect_cache.clear()
+        code_filter.clear()
+        loaded = warm_up(redirect_cache, code_filter, warmup_urls, budget=5)
+        self.assertEqual(loaded['warmup_urls'], 1)
+        self.assertTrue(loaded['warmup_filter_loaded'])
+        self.assertEqual(redirect_cache.get(code, None), 'https://warm.example.com')
+
+    def test_expiring_link_404s_once_expired_and_is_swept(self):
+        """Test expires_in sets expires_at, expired links 404 and the sweeper deletes them."""
+        response = self.client.post('/api/shorten', data=json.dumps({'url': 'https://expiring.example.com',
+                                                                     'expires_in': 60}),
+                                    content_type='application/json')
+        data = json.loads(response.content)
+        self.assertIsNotNone(data['expires_at'])
+        invalid = self.client.post('/api/shorten', data=json.dumps({'url': 'https://example.com', 'expires_in': 0}),
+                                   content_type='application/json')
+        self.assertEqual(invalid.status_code, 400)
+
+        self.client.post('/api/shorten', data=json.dumps({'url': 'https://newest.example.com'}),
+                         content_type='application/json')
+        expired = ShortenUrl.objects.filter(short_code=data['short_code'])
+        expired.update(expires_at=timezone.now() - timedelta(seconds=1))
+        redirect_cache.clear()
+        self.assertEqual(self.client.get(f"/{data['short_code']}").status_code, 404)
+        self.assertEqual(expiry_sweeper.sweep(), 1)
+        self.assertFalse(ShortenUrl.objects.filter(short_code=data['short_code']).exists())
+
+    def test_listings_answer_conditional_gets(self):
+        """Test /api/urls and / send validators that turn repeat GETs into 304s until a link is added."""
+        etag = self.client.get('/api/urls')['ETag']
+        not_modified = self.client.get('/api/urls', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+        self.client.post('/api/shorten', data=json.dumps({'url': 'https://etag.example.com'}),
+                         content_type='application/json')
+        changed = self.client.get('/api/urls', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=changed['ETag']).status_code, 304)
+        # Last-Modified waits until the second of the last write is over, so a date can't hide this one.
+        self.assertFalse(changed.has_header('Last-Modified'))
+        since = self.client.get('/api/urls', HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(since.status_code, 200)
+
+    def test_redirect_cache_control_and_permanent_status(self):
+        """Test configured redirect caching: permanent status for lasting links, capped max-age for expiring ones."""
+        lasting = json.loads(self.client.post('/api/shorten', data=json.dumps({'url': 'https://lasting.example.com'}),
+                                              content_type='application/json').content)['short_code']
+        expiring = json.loads(self.client.post('/api/shorten', data=json.dumps({'url': 'https://brief.example.com',
+                                                                                'expires_in': 60}),
+                                               content_type='application/json').content)['short_code']
+        redirect_cache.clear()
+        with mock.patch.object(http_cache, 'REDIRECT_CACHE_CONTROL', 'public, max-age=86400'), \
+                mock.patch.object(http_cache, 'REDIRECT_PERMANENT_STATUS', 308):
+            for _ in range(2):  # through the view, which caches the links, then from the middleware
+                response = self.client.get(f'/{lasting}')
+                self.assertEqual(response.status_code, 308)
+                self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+                response = self.client.get(f'/{expiring}')
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(55 <= int(response['Cache-Control'].rsplit('=', 1)[1]) <= 60)
+
+
+    def test_listings_are_compressed_from_a_snapshot(self):
+        """Test gzip listings match the plain ones and come from a snapshot rebuilt only after a new link."""
+        from shortener.views import list_snapshots
+        for i in range(20):
+            self.client.post('/api/shorten', data=json.dumps({'url': f'https://gzip{i}.example.com'}),
+                             content_type='application/json')
+        builds = list_snapshots.stats()['builds']
+        plain = self.client.get('/api/urls')
+        self.assertEqual(plain['Vary'], 'Accept-Encoding')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        zipped = self.client.get('/api/urls', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(zipped.content), plain.content)
+        self.assertEqual(list_snapshots.stats()['builds'], builds + 1)
+
+        self.client.post('/api/shorten', data=json.dumps({'url': 'https://gzip-new.example.com'}),
+                         content_type='application/json')
+        fresh = self.client.get('/api/urls', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(json.loads(gzip.decompress(fresh.content))[0]['original_url'], 'https://gzip-new.example.com')
+        self.assertEqual(list_snapshots.stats()['builds'], builds + 2)
+        home = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertIn(b'gzip-new.example.com', gzip.decompress(home.content))
+        streamed = self.client.get('/api/urls?stream=ndjson', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(streamed.streaming_content)).splitlines()), 21)
@@ -12,7 +12,12 @@ from fastapi.testclient import TestClient
 # Import after path setup
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from fastapi_app.models import Base, get_db
+from common import metrics
+from common.bloom import sqlalchemy_code_fetcher
+from common.clicks import sqlalchemy_click_writer
+from common.group_commit import sqlalchemy_url_writer
+from common.store import MemoryStore
+from fastapi_app.models import Base, ShortenUrl, get_db
 
 # Use temp file for test DB - in-memory has connection isolation issues
 _test_db_path = os.path.join(os.path.dirname(__file__), 'fastapi_test.db')
@@ -34,10 +39,16 @@ def client():
     """Create test client with temporary database."""
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
-    from fastapi_app.app import app
+    from fastapi_app.app import app, click_recorder, code_filter, redirect_cache
+    redirect_cache.clear()
+    code_filter.clear()
+    code_filter.fetch = sqlalchemy_code_fetcher(lambda: engine, ShortenUrl)
+    click_recorder.interval = 0  # tests flush clicks explicitly
+    click_recorder.write = sqlalchemy_click_writer(lambda: engine)
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as c:
         yield c
+    click_recorder.clear()
     app.dependency_overrides.clear()
 
 
@@ -100,6 +111,51 @@ def test_redirect_to_original(client):
     assert response.headers["location"] == "https://python.org"
 
 
+def test_url_stats_counts_clicks(client):
+    """Test redirects are counted once the click buffer is flushed."""
+    from fastapi_app.app import click_recorder
+    short_code = client.post("/api/shorten", json={"url": "https://clicks.example.com"}).json()["short_code"]
+    assert client.get(f"/api/urls/{short_code}/stats").json()["clicks"] == 0
+    for _ in range(3):
+        client.get(f"/{short_code}", follow_redirects=False)
+    click_recorder.flush()
+    client.get(f"/{short_code}", follow_redirects=False)
+    click_recorder.flush()
+    data = client.get(f"/api/urls/{short_code}/stats").json()
+    assert data["clicks"] == 4
+    assert data["first_clicked_at"] <= data["last_clicked_at"]
+
+
+def test_url_stats_not_found(client):
+    """Test stats for an unknown short code return 404."""
+    assert client.get("/api/urls/nonexistent/stats").status_code == 404
+
+
+def test_metrics_endpoint_reports_requests_and_operations(client):
+    """Test /metrics exposes request and hot-path histograms when enabled."""
+    metrics.set_enabled(True)
+    try:
+        short_code = client.post("/api/shorten", json={"url": "https://metrics.example.com"}).json()["short_code"]
+        client.get(f"/{short_code}", follow_redirects=False)
+        response = client.get("/metrics")
+    finally:
+        metrics.set_enabled(False)
+        metrics.reset()
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{framework="fastapi",method="GET",route="/{code}",status="302"} 1' in response.text
+    assert 'url_shortener_operation_seconds_count{operation="shorten.commit"} 1' in response.text
+
+
+def test_startup_gauges_track_lifespan_and_first_redirect(client):
+    """Test the lifespan marks the app ready and the first redirect is timed from process start."""
+    short_code = client.post("/api/shorten", json={"url": "https://boot.example.com"}).json()["short_code"]
+    client.get(f"/{short_code}", follow_redirects=False)
+    text = client.get("/metrics").text
+    assert "url_shortener_startup_ready_seconds" in text
+    assert "url_shortener_startup_first_redirect_seconds" in text
+
+
 def test_redirect_not_found(client):
     """Test redirect returns 404 for non-existent short code."""
     response = client.get("/nonexistent")
@@ -119,3 +175,231 @@ def test_shorten_same_url_twice(client):
     d1, d2 = r1.json(), r2.json()
     assert d1["short_code"] == d2["short_code"]
     assert d1["original_url"] == d2["original_url"]
+
+
+def test_redirect_served_from_cache(client):
+    """Test repeated redirects hit the cache instead of the database."""
+    from fastapi_app.app import redirect_cache
+    shorten_resp = client.post("/api/shorten", json={"url": "https://cache.example.com"})
+    short_code = shorten_resp.json()["short_code"]
+    with TestingSessionLocal() as db:
+        db.query(ShortenUrl).filter(ShortenUrl.short_code == short_code).delete()
+        db.commit()
+    response = client.get(f"/{short_code}", follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["location"] == "https://cache.example.com"
+    assert redirect_cache.stats()["hits"] == 1
+
+
+def test_get_all_urls_paginates_with_cursor(client):
+    """Test get_all_urls pages newest first and follows X-Next-Cursor."""
+    for i in range(3):
+        client.post("/api/shorten", json={"url": f"https://page{i}.example.com"})
+    first = client.get("/api/urls", params={"limit": 2})
+    assert [u["original_url"] for u in first.json()] == [
+        "https://page2.example.com", "https://page1.example.com"]
+    cursor = first.headers["x-next-cursor"]
+    second = client.get("/api/urls", params={"limit": 2, "cursor": cursor})
+    assert [u["original_url"] for u in second.json()] == ["https://page0.example.com"]
+    assert "x-next-cursor" not in second.headers
+
+
+def test_get_all_urls_invalid_cursor(client):
+    """Test get_all_urls returns 400 for a malformed cursor."""
+    response = client.get("/api/urls", params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_get_all_urls_stream_json(client):
+    """Test get_all_urls streams a JSON array."""
+    for i in range(2):
+        client.post("/api/shorten", json={"url": f"https://stream{i}.example.com"})
+    response = client.get("/api/urls", params={"stream": "json"})
+    assert response.status_code == 200
+    assert [u["original_url"] for u in response.json()] == [
+        "https://stream1.example.com", "https://stream0.example.com"]
+
+
+def test_home_page_is_bounded(client):
+    """Test the home page renders one window of recent URLs with an older-page link."""
+    from common.home_page import HOME_PAGE_SIZE
+    for i in range(HOME_PAGE_SIZE + 1):
+        client.post("/api/shorten", json={"url": f"https://home{i}.example.com"})
+    response = client.get("/")
+    assert response.status_code == 200
+    assert f"https://home{HOME_PAGE_SIZE}.example.com" in response.text
+    assert "https://home0.example.com" not in response.text
+    assert "Older &raquo;" in response.text
+
+
+def test_shorten_url_retries_on_code_collision(client):
+    """Test a colliding short code falls through to the next candidate."""
+    from fastapi_app.app import code_generator
+    url = "https://collide.example.com"
+    taken = next(code_generator.candidates(url))
+    with TestingSessionLocal() as db:
+        db.add(ShortenUrl(original_url="https://other.example.com", url_hash="x" * 64, short_code=taken))
+        db.commit()
+    response = client.post("/api/shorten", json={"url": url})
+    assert response.status_code == 201
+    assert response.json()["short_code"] != taken
+
+
+def test_shorten_batch_mixed_items(client):
+    """Test batch shorten returns one result per input, in order."""
+    client.post("/api/shorten", json={"url": "https://existing.example.com"})
+    items = ["https://new.example.com", "not-a-url", {"url": "https://existing.example.com"},
+             "https://new.example.com"]
+    response = client.post("/api/shorten/batch", json=items)
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["status"] for r in results] == [201, 400, 201, 201]
+    assert results[0]["created"] and not results[2]["created"] and not results[3]["created"]
+    assert results[0]["short_code"] == results[3]["short_code"]
+    redirect = client.get(f"/{results[0]['short_code']}", follow_redirects=False)
+    assert redirect.headers["location"] == "https://new.example.com"
+
+
+def test_shorten_batch_ndjson(client):
+    """Test batch shorten accepts NDJSON bodies."""
+    body = '"https://a.example.com"\n{"url": "https://b.example.com"}\n'
+    response = client.post("/api/shorten/batch", content=body,
+                           headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert [r["original_url"] for r in response.json()] == [
+        "https://a.example.com", "https://b.example.com"]
+
+
+def test_memory_store_backend(client, monkeypatch):
+    """Test the API runs unchanged on the memory store engine."""
+    monkeypatch.setattr("fastapi_app.app.standalone_store", MemoryStore())
+    response = client.post("/api/shorten", json={"url": "https://memory.example.com"})
+    assert response.status_code == 201
+    code = response.json()["short_code"]
+    redirect = client.get(f"/{code}", follow_redirects=False)
+    assert redirect.headers["location"] == "https://memory.example.com"
+    assert [u["short_code"] for u in client.get("/api/urls").json()] == [code]
+    with TestingSessionLocal() as db:
+        assert db.query(ShortenUrl).count() == 0
+
+
+def test_unknown_code_rejected_by_bloom_filter(client):
+    """Test a never-stored code 404s without a lookup, and one stored behind the app's back is found."""
+    from fastapi_app.app import code_filter, redirect_cache
+    assert client.get("/wp-login.php", follow_redirects=False).status_code == 404
+    assert code_filter.stats()["rejected"] == 1
+    assert redirect_cache.stats()["size"] == 0
+    with TestingSessionLocal() as db:
+        db.add(ShortenUrl(original_url="https://other.example.com", url_hash="x" * 64, short_code="direct01"))
+        db.commit()
+    code_filter.sync_interval = 0
+    try:
+        redirect = client.get("/direct01", follow_redirects=False)
+    finally:
+        code_filter.sync_interval = 1.0
+    assert redirect.headers["location"] == "https://other.example.com"
+
+
+def test_cached_redirect_bypasses_routing_and_db(client):
+    """Test a cached code is answered by the ASGI fast path without opening a session."""
+    from fastapi_app.app import app, redirect_cache
+
+    def no_db():
+        raise AssertionError("fast path must not open a database session")
+
+    redirect_cache.set("cachedfp", "https://cached.example.com")
+    app.dependency_overrides[get_db] = no_db
+    response = client.get("/cachedfp", follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["location"] == "https://cached.example.com"
+
+
+def test_shorten_with_group_commit(client, monkeypatch):
+    """Test shorten works unchanged when inserts go through the group committer."""
+    from fastapi_app.app import url_committer
+    monkeypatch.setattr(url_committer, "enabled", True)
+    monkeypatch.setattr(url_committer, "write", sqlalchemy_url_writer(lambda: engine, ShortenUrl))
+    try:
+        response = client.post("/api/shorten", json={"url": "https://group.example.com"})
+    finally:
+        url_committer.stop()
+    assert response.status_code == 201
+    data = response.json()
+    assert data["original_url"] == "https://group.example.com"
+    redirect = client.get(f"/{data['short_code']}", follow_redirects=False)
+    assert redirect.headers["location"] == "https://group.example.com"
+
+
+def test_expiring_link_404s_once_expired_and_is_swept(client, monkeypatch):
+    """Test expires_in sets expires_at, expired links 404 and the sweeper deletes them."""
+    from datetime import datetime, timedelta, timezone
+    from common.expiry import sqlalchemy_expiry_deleter
+    from fastapi_app.app import expiry_sweeper, redirect_cache
+    monkeypatch.setattr(expiry_sweeper, "delete_expired", sqlalchemy_expiry_deleter(lambda: engine, ShortenUrl))
+    data = client.post("/api/shorten", json={"url": "https://expiring.example.com", "expires_in": 60}).json()
+    assert data["expires_at"] is not None
+    assert client.get(f"/{data['short_code']}", follow_redirects=False).status_code == 302
+    assert client.post("/api/shorten", json={"url": "https://example.com", "expires_in": -5}).status_code == 400
+
+    client.post("/api/shorten", json={"url": "https://newest.example.com"})
+    with TestingSessionLocal() as db:
+        record = db.query(ShortenUrl).filter_by(short_code=data["short_code"]).one()
+        record.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.commit()
+    redirect_cache.clear()
+    assert client.get(f"/{data['short_code']}").status_code == 404
+    assert expiry_sweeper.sweep() == 1
+    with TestingSessionLocal() as db:
+        assert db.query(ShortenUrl).filter_by(short_code=data["short_code"]).first() is None
+
+
+def test_listings_answer_conditional_gets(client):
+    """Test /api/urls and / send validators that turn repeat GETs into 304s until a link is added."""
+    etag = client.get("/api/urls").headers["ETag"]
+    not_modified = client.get("/api/urls", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    client.post("/api/shorten", json={"url": "https://etag.example.com"})
+    changed = client.get("/api/urls", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert client.get("/", headers={"If-None-Match": changed.headers["ETag"]}).status_code == 304
+    assert client.get("/api/urls?stream=ndjson", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_redirect_cache_control_and_permanent_status(client, monkeypatch):
+    """Test configured redirect caching: permanent status for lasting links, capped max-age for expiring ones."""
+    from common import http_cache
+    from fastapi_app.app import redirect_cache
+    monkeypatch.setattr(http_cache, "REDIRECT_CACHE_CONTROL", "public, max-age=86400")
+    monkeypatch.setattr(http_cache, "REDIRECT_PERMANENT_STATUS", 301)
+    lasting = client.post("/api/shorten", json={"url": "https://lasting.example.com"}).json()["short_code"]
+    expiring = client.post("/api/shorten", json={"url": "https://brief.example.com", "expires_in": 60}).json()
+    redirect_cache.clear()
+    for _ in range(2):  # through the view, which caches the links, then from the fast path
+        response = client.get(f"/{lasting}", follow_redirects=False)
+        assert response.status_code == 301
+        assert response.headers["Cache-Control"] == "public, max-age=86400"
+        response = client.get(f"/{expiring['short_code']}", follow_redirects=False)
+        assert response.status_code == 302
+        assert 55 <= int(response.headers["Cache-Control"].rsplit("=", 1)[1]) <= 60
+
+
+def test_listings_are_compressed_from_a_snapshot(client):
+    """Test gzip listings match the plain ones and come from a snapshot rebuilt only after a new link."""
+    from fastapi_app.app import list_snapshots
+    for i in range(20):
+        client.post("/api/shorten", json={"url": f"https://gzip{i}.example.com"})
+    builds = list_snapshots.stats()["builds"]
+    plain = client.get("/api/urls", headers={"Accept-Encoding": "identity"})
+    assert plain.headers["Vary"] == "Accept-Encoding" and "Content-Encoding" not in plain.headers
+    zipped = client.get("/api/urls", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip" and zipped.content == plain.content
+    assert list_snapshots.stats()["builds"] == builds + 1
+
+    client.post("/api/shorten", json={"url": "https://gzip-new.example.com"})
+    fresh = client.get("/api/urls", headers={"Accept-Encoding": "gzip"})
+    assert fresh.json()[0]["original_url"] == "https://gzip-new.example.com"
+    assert list_snapshots.stats()["builds"] == builds + 2
+    home = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert home.headers["Content-Encoding"] == "gzip" and "gzip-new.example.com" in home.text
+    streamed = client.get("/api/urls?stream=ndjson", headers={"Accept-Encoding": "gzip"})
+    assert streamed.headers["Content-Encoding"] == "gzip" and len(streamed.text.splitlines()) == 21
@@ -0,0 +1,167 @@
+"""
+Tests for the async database path of the FastAPI URL shortener.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from common.bloom import sqlalchemy_code_fetcher
+from common.clicks import sqlalchemy_click_writer
+from fastapi_app.models import Base, ShortenUrl
+from fastapi_app.async_models import get_async_db
+
+_test_db_path = os.path.join(os.path.dirname(__file__), 'fastapi_async_test.db')
+engine = create_engine(f"sqlite:///{_test_db_path}")
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{_test_db_path}")
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+@pytest.fixture
+def client():
+    """Create test client for the async app with a temporary database."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    from fastapi_app.async_app import app, click_recorder, code_filter, redirect_cache
+    redirect_cache.clear()
+    code_filter.clear()
+    code_filter.fetch = sqlalchemy_code_fetcher(lambda: engine, ShortenUrl)
+    click_recorder.interval = 0  # tests flush clicks explicitly
+    click_recorder.write = sqlalchemy_click_writer(lambda: engine)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with TestClient(app) as c:
+        yield c
+    click_recorder.clear()
+    app.dependency_overrides.clear()
+
+
+def test_shorten_and_redirect(client):
+    """Test shorten returns 201 and the code redirects to the original URL."""
+    response = client.post("/api/shorten", json={"url": "https://python.org"})
+    assert response.status_code == 201
+    data = response.json()
+    assert len(data["short_code"]) == 8
+    redirect = client.get(f"/{data['short_code']}", follow_redirects=False)
+    assert redirect.status_code == 302
+    assert redirect.headers["location"] == "https://python.org"
+
+
+def test_url_stats_counts_clicks(client):
+    """Test redirects are counted once the click buffer is flushed."""
+    from fastapi_app.async_app import click_recorder
+    short_code = client.post("/api/shorten", json={"url": "https://clicks.example.com"}).json()["short_code"]
+    client.get(f"/{short_code}", follow_redirects=False)
+    client.get(f"/{short_code}", follow_redirects=False)
+    click_recorder.flush()
+    assert client.get(f"/api/urls/{short_code}/stats").json()["clicks"] == 2
+    assert client.get("/api/urls/nonexistent/stats").status_code == 404
+
+
+def test_shorten_same_url_twice(client):
+    """Test shortening the same URL twice returns the same record."""
+    r1 = client.post("/api/shorten", json={"url": "https://github.com"})
+    r2 = client.post("/api/shorten", json={"url": "https://github.com"})
+    assert r1.status_code == r2.status_code == 201
+    assert r1.json()["short_code"] == r2.json()["short_code"]
+
+
+def test_shorten_url_invalid_url(client):
+    """Test shorten returns 400 for an invalid URL."""
+    response = client.post("/api/shorten", json={"url": "not-a-valid-url"})
+    assert response.status_code == 400
+
+
+def test_redirect_not_found(client):
+    """Test redirect returns 404 for a non-existent short code."""
+    response = client.get("/nonexistent")
+    assert response.status_code == 404
+
+
+def test_get_all_urls_paginates_and_streams(client):
+    """Test keyset pages and NDJSON streaming on the async path."""
+    for i in range(3):
+        client.post("/api/shorten", json={"url": f"https://page{i}.example.com"})
+    first = client.get("/api/urls", params={"limit": 2})
+    assert len(first.json()) == 2
+    second = client.get("/api/urls", params={"limit": 2, "cursor": first.headers["x-next-cursor"]})
+    assert [u["original_url"] for u in second.json()] == ["https://page0.example.com"]
+    stream = client.get("/api/urls", params={"stream": "ndjson"})
+    assert len(stream.text.splitlines()) == 3
+
+
+def test_shorten_batch(client):
+    """Test the batch endpoint on the async path."""
+    response = client.post("/api/shorten/batch", json=["https://a.example.com", "bad"])
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()] == [201, 400]
+
+
+def test_home_page(client):
+    """Test the home page renders."""
+    response = client.get("/")
+    assert response.status_code == 200
+    assert "FastAPI" in response.text
+
+
+def test_expired_link_404s_and_revives_when_shortened_again(client):
+    """Test the async path hides expired links and revives them with the new expiry."""
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import update
+    from fastapi_app.async_app import redirect_cache
+    data = client.post("/api/shorten", json={"url": "https://expiring.example.com", "expires_in": 60}).json()
+    assert data["expires_at"] is not None
+    with engine.begin() as conn:
+        conn.execute(update(ShortenUrl).values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)))
+    redirect_cache.clear()
+    assert client.get(f"/{data['short_code']}", follow_redirects=False).status_code == 404
+    assert client.get(f"/api/urls/{data['short_code']}/stats").status_code == 404
+
+    redirect_cache.clear()
+    revived = client.post("/api/shorten", json={"url": "https://expiring.example.com"}).json()
+    assert revived["short_code"] == data["short_code"] and revived["expires_at"] is None
+    assert client.get(f"/{data['short_code']}", follow_redirects=False).status_code == 302
+
+
+def test_listings_answer_conditional_gets(client):
+    """Test the async listings read the same table version and answer matching GETs with 304."""
+    etag = client.get("/api/urls").headers["ETag"]
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/api/shorten", json={"url": "https://etag.example.com"})
+    changed = client.get("/api/urls", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()[0]["original_url"] == "https://etag.example.com"
+    assert client.get("/api/urls", headers={"If-None-Match": changed.headers["ETag"]}).status_code == 304
+
+
+def test_listings_are_compressed_from_a_snapshot(client):
+    """Test the async listings are gzipped, from a snapshot that follows the table version."""
+    for i in range(20):
+        client.post("/api/shorten", json={"url": f"https://gzip{i}.example.com"})
+    zipped = client.get("/api/urls", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip" and len(zipped.json()) == 20
+    client.post("/api/shorten", json={"url": "https://gzip-new.example.com"})
+    fresh = client.get("/api/urls", headers={"Accept-Encoding": "gzip"})
+    assert fresh.json()[0]["original_url"] == "https://gzip-new.example.com"
+    home = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert home.headers["Content-Encoding"] == "gzip" and "gzip-new.example.com" in home.text
+    streamed = client.get("/api/urls?stream=json", headers={"Accept-Encoding": "gzip"})
+    assert streamed.headers["Content-Encoding"] == "gzip" and len(streamed.json()) == 21
+
+
+def test_unknown_code_rejected_by_bloom_filter(client):
+    """Test a never-stored code 404s without touching the database."""
+    from fastapi_app.async_app import code_filter
+    code = client.post("/api/shorten", json={"url": "https://bloom.example.com"}).json()["short_code"]
+    assert client.get("/favicon.ico", follow_redirects=False).status_code == 404
+    assert client.get(f"/{code}", follow_redirects=False).status_code == 302
+    assert code_filter.stats()["rejected"] == 1
+
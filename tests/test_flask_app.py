@@ -3,14 +3,20 @@ Tests for Flask URL shortener.
 """
 import os
 import sys
+import gzip
 import json
 import tempfile
+import threading
 
 # Add project root to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import pytest
-from flask_app.app import app
+from common import http_cache, metrics
+from common.store import MemoryStore
+from flask_app.app import (
+    app, click_recorder, code_filter, expiry_sweeper, redirect_cache, start_worker, url_committer,
+)
 from flask_app.models import db, ShortenUrl
 
 
@@ -19,10 +25,14 @@ def client():
     """Create test client with temporary database."""
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['TESTING'] = True
+    redirect_cache.clear()
+    code_filter.clear()
+    click_recorder.interval = 0  # tests flush clicks explicitly
     with app.test_client() as client:
         with app.app_context():
             db.create_all()
         yield client
+        click_recorder.clear()
         with app.app_context():
             db.drop_all()
 
@@ -100,6 +110,65 @@ def test_redirect_to_original(client):
     assert response.location == 'https://python.org'
 
 
+def test_url_stats_counts_clicks(client):
+    """Test redirects are counted once the click buffer is flushed."""
+    shorten_resp = client.post('/api/shorten', data=json.dumps({'url': 'https://clicks.example.com'}),
+                               content_type='application/json')
+    short_code = json.loads(shorten_resp.data)['short_code']
+    assert json.loads(client.get(f'/api/urls/{short_code}/stats').data)['clicks'] == 0
+    for _ in range(3):
+        client.get(f'/{short_code}')
+    client.get('/nonexistent')
+    click_recorder.flush()
+    client.get(f'/{short_code}')
+    click_recorder.flush()
+    data = json.loads(client.get(f'/api/urls/{short_code}/stats').data)
+    assert data['clicks'] == 4
+    assert data['original_url'] == 'https://clicks.example.com'
+    assert data['first_clicked_at'] <= data['last_clicked_at']
+
+
+def test_url_stats_not_found(client):
+    """Test stats for an unknown short code return 404."""
+    assert client.get('/api/urls/nonexistent/stats').status_code == 404
+
+
+def test_metrics_endpoint_reports_requests_and_operations(client):
+    """Test /metrics exposes request and hot-path histograms when enabled."""
+    metrics.set_enabled(True)
+    try:
+        shorten_resp = client.post('/api/shorten', data=json.dumps({'url': 'https://metrics.example.com'}),
+                                   content_type='application/json')
+        client.get(f"/{json.loads(shorten_resp.data)['short_code']}")
+        response = client.get('/metrics')
+    finally:
+        metrics.set_enabled(False)
+        metrics.reset()
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    body = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{framework="flask",method="GET",route="/<code>",status="302"} 1' in body
+    assert 'url_shortener_operation_seconds_count{operation="shorten.commit"} 1' in body
+
+
+def test_start_worker_warms_cache_and_filter(client, monkeypatch):
+    """Test STARTUP_WARMUP preloads stored redirects and the Bloom filter before the first request."""
+    from common import startup
+    resp = client.post('/api/shorten', data=json.dumps({'url': 'https://warm.example.com'}),
+                       content_type='application/json')
+    code = json.loads(resp.data)['short_code']
+    redirect_cache.clear()
+    code_filter.clear()
+    monkeypatch.setattr(startup, 'STARTUP_WARMUP', True)
+    # The test client keeps the last request's context pushed; boot on a thread without one, like a real worker.
+    worker = threading.Thread(target=start_worker)
+    worker.start()
+    worker.join()
+    assert redirect_cache.get(code, None) == 'https://warm.example.com'
+    assert code_filter.stats()['codes'] == 1
+    assert startup.stats()['warmup_urls'] == 1
+
+
 def test_redirect_not_found(client):
     """Test redirect returns 404 for non-existent short code."""
     response = client.get('/nonexistent')
@@ -119,3 +188,288 @@ def test_shorten_same_url_twice(client):
     d1, d2 = json.loads(r1.data), json.loads(r2.data)
     assert d1['short_code'] == d2['short_code']
     assert d1['original_url'] == d2['original_url']
+
+
+def test_redirect_served_from_cache(client):
+    """Test repeated redirects hit the cache instead of the database."""
+    shorten_resp = client.post('/api/shorten', data=json.dumps({'url': 'https://cache.example.com'}),
+                               content_type='application/json')
+    short_code = json.loads(shorten_resp.data)['short_code']
+    with app.app_context():
+        ShortenUrl.query.filter_by(short_code=short_code).delete()
+        db.session.commit()
+    response = client.get(f'/{short_code}', follow_redirects=False)
+    assert response.status_code == 302
+    assert response.location == 'https://cache.example.com'
+    assert redirect_cache.stats()['hits'] == 1
+
+
+def test_get_all_urls_paginates_with_cursor(client):
+    """Test get_all_urls pages newest first and follows X-Next-Cursor."""
+    for i in range(3):
+        client.post('/api/shorten', data=json.dumps({'url': f'https://page{i}.example.com'}),
+                    content_type='application/json')
+    first = client.get('/api/urls?limit=2')
+    assert [u['original_url'] for u in json.loads(first.data)] == [
+        'https://page2.example.com', 'https://page1.example.com']
+    cursor = first.headers['X-Next-Cursor']
+    second = client.get(f'/api/urls?limit=2&cursor={cursor}')
+    assert [u['original_url'] for u in json.loads(second.data)] == ['https://page0.example.com']
+    assert 'X-Next-Cursor' not in second.headers
+
+
+def test_get_all_urls_invalid_cursor(client):
+    """Test get_all_urls returns 400 for a malformed cursor."""
+    response = client.get('/api/urls?cursor=garbage')
+    assert response.status_code == 400
+
+
+def test_get_all_urls_stream_ndjson(client):
+    """Test get_all_urls streams NDJSON rows."""
+    for i in range(2):
+        client.post('/api/shorten', data=json.dumps({'url': f'https://stream{i}.example.com'}),
+                    content_type='application/json')
+    response = client.get('/api/urls?stream=ndjson')
+    assert response.status_code == 200
+    assert response.content_type == 'application/x-ndjson'
+    lines = response.data.decode().splitlines()
+    assert [json.loads(line)['original_url'] for line in lines] == [
+        'https://stream1.example.com', 'https://stream0.example.com']
+
+
+def test_home_page_is_bounded(client):
+    """Test the home page renders one window of recent URLs with an older-page link."""
+    from common.home_page import HOME_PAGE_SIZE
+    for i in range(HOME_PAGE_SIZE + 1):
+        client.post('/api/shorten', data=json.dumps({'url': f'https://home{i}.example.com'}),
+                    content_type='application/json')
+    response = client.get('/')
+    assert response.status_code == 200
+    html = response.data.decode()
+    assert f'https://home{HOME_PAGE_SIZE}.example.com' in html
+    assert 'https://home0.example.com' not in html
+    assert 'Older &raquo;' in html
+
+
+def test_shorten_url_retries_on_code_collision(client):
+    """Test a colliding short code falls through to the next candidate."""
+    from flask_app.app import code_generator
+    url = 'https://collide.example.com'
+    taken = next(code_generator.candidates(url))
+    with app.app_context():
+        db.session.add(ShortenUrl(original_url='https://other.example.com',
+                                  url_hash='x' * 64, short_code=taken))
+        db.session.commit()
+    response = client.post('/api/shorten', data=json.dumps({'url': url}), content_type='application/json')
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['short_code'] != taken
+    assert len(data['short_code']) == 8
+
+
+def test_shorten_batch_mixed_items(client):
+    """Test batch shorten returns one result per input, in order."""
+    client.post('/api/shorten', data=json.dumps({'url': 'https://existing.example.com'}),
+                content_type='application/json')
+    items = ['https://new.example.com', 'not-a-url', {'url': 'https://existing.example.com'},
+             'https://new.example.com']
+    response = client.post('/api/shorten/batch', data=json.dumps(items), content_type='application/json')
+    assert response.status_code == 200
+    results = json.loads(response.data)
+    assert [r['status'] for r in results] == [201, 400, 201, 201]
+    assert results[0]['created'] and not results[2]['created'] and not results[3]['created']
+    assert results[0]['short_code'] == results[3]['short_code']
+    assert results[2]['original_url'] == 'https://existing.example.com'
+    redirect = client.get(f"/{results[0]['short_code']}", follow_redirects=False)
+    assert redirect.location == 'https://new.example.com'
+
+
+def test_shorten_batch_revives_expired_link(client):
+    """Test a batch reviving an expired, unswept link reports it created and its code redirects again."""
+    from datetime import datetime, timedelta, timezone
+    response = client.post('/api/shorten', data=json.dumps({'url': 'https://revived.example.com', 'expires_in': 60}),
+                           content_type='application/json')
+    code = json.loads(response.data)['short_code']
+    with app.app_context():
+        record = ShortenUrl.query.filter_by(short_code=code).one()
+        record.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.session.commit()
+    redirect_cache.clear()
+    assert client.get(f'/{code}').status_code == 404  # now cached as missing
+
+    items = ['https://revived.example.com', 'https://revived.example.com']
+    results = json.loads(client.post('/api/shorten/batch', data=json.dumps(items),
+                                     content_type='application/json').data)
+    assert [(r['short_code'], r['created']) for r in results] == [(code, True), (code, False)]
+    assert client.get(f'/{code}').location == 'https://revived.example.com'
+
+
+def test_shorten_batch_ndjson(client):
+    """Test batch shorten accepts NDJSON bodies."""
+    body = '"https://a.example.com"\n{"url": "https://b.example.com"}\n'
+    response = client.post('/api/shorten/batch', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert [r['original_url'] for r in json.loads(response.data)] == [
+        'https://a.example.com', 'https://b.example.com']
+
+
+def test_memory_store_backend(client, monkeypatch):
+    """Test the API runs unchanged on the memory store engine."""
+    monkeypatch.setattr('flask_app.app.standalone_store', MemoryStore())
+    response = client.post('/api/shorten', data=json.dumps({'url': 'https://memory.example.com'}),
+                           content_type='application/json')
+    assert response.status_code == 201
+    code = json.loads(response.data)['short_code']
+    assert client.get(f'/{code}').location == 'https://memory.example.com'
+    assert [u['short_code'] for u in json.loads(client.get('/api/urls').data)] == [code]
+    with app.app_context():
+        assert ShortenUrl.query.count() == 0
+
+
+def test_sharded_store_backend(client, monkeypatch, tmp_path):
+    """Test the API runs unchanged on the sharded engine, listing across shards."""
+    from common.sharding import ShardedStore, shard_urls
+    store = ShardedStore(shard_urls('flask', 3, tmp_path))
+    monkeypatch.setattr('flask_app.app.standalone_store', store)
+    codes = []
+    for i in range(6):
+        response = client.post('/api/shorten', data=json.dumps({'url': f'https://shard{i}.example.com'}),
+                               content_type='application/json')
+        assert response.status_code == 201
+        codes.append(json.loads(response.data)['short_code'])
+    assert client.get(f'/{codes[2]}').location == 'https://shard2.example.com'
+    assert [u['short_code'] for u in json.loads(client.get('/api/urls').data)] == codes[::-1]
+    store.close()
+
+
+def test_unknown_code_rejected_by_bloom_filter(client):
+    """Test a never-stored code 404s without a lookup or a negative cache entry."""
+    code = json.loads(client.post('/api/shorten', data=json.dumps({'url': 'https://bloom.example.com'}),
+                                  content_type='application/json').data)['short_code']
+    redirect_cache.clear()
+    assert client.get('/wp-login.php').status_code == 404
+    assert client.get(f'/{code}').location == 'https://bloom.example.com'
+    assert code_filter.stats()['rejected'] == 1
+    assert redirect_cache.stats()['size'] == 1
+    assert 'url_shortener_bloom_rejected{framework="flask"} 1.0' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_cached_redirect_bypasses_flask(client):
+    """Test a cached code is answered by the WSGI fast path with a bare 302."""
+    redirect_cache.set('cachedfp', 'https://cached.example.com/ü')
+    response = client.get('/cachedfp')
+    assert response.status_code == 302
+    assert response.headers['Location'] == 'https://cached.example.com/%C3%BC'
+    assert response.data == b''  # flask.redirect() would have rendered an HTML body
+
+
+def test_shorten_with_group_commit(client, monkeypatch):
+    """Test shorten works unchanged when inserts go through the group committer."""
+    monkeypatch.setattr(url_committer, 'enabled', True)
+    try:
+        codes = set()
+        for _ in range(2):
+            response = client.post('/api/shorten', data=json.dumps({'url': 'https://group.example.com'}),
+                                   content_type='application/json')
+            assert response.status_code == 201
+            codes.add(json.loads(response.data)['short_code'])
+    finally:
+        url_committer.stop()
+    assert len(codes) == 1
+    assert url_committer.stats()['rows'] >= 1
+    assert client.get(f'/{codes.pop()}').location == 'https://group.example.com'
+
+
+def test_expiring_link_404s_once_expired_and_is_swept(client):
+    """Test expires_in sets expires_at, expired links 404 and the sweeper deletes them."""
+    from datetime import datetime, timedelta, timezone
+    response = client.post('/api/shorten', data=json.dumps({'url': 'https://expiring.example.com', 'expires_in': 60}),
+                           content_type='application/json')
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['expires_at'] is not None
+    assert client.get(f"/{data['short_code']}").status_code == 302
+    invalid = client.post('/api/shorten', data=json.dumps({'url': 'https://example.com', 'expires_in': 'soon'}),
+                          content_type='application/json')
+    assert invalid.status_code == 400
+
+    client.post('/api/shorten', data=json.dumps({'url': 'https://newest.example.com'}), content_type='application/json')
+    with app.app_context():
+        record = ShortenUrl.query.filter_by(short_code=data['short_code']).one()
+        record.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.session.commit()
+    redirect_cache.clear()
+    assert client.get(f"/{data['short_code']}").status_code == 404
+    assert expiry_sweeper.sweep() == 1
+    with app.app_context():
+        assert ShortenUrl.query.filter_by(short_code=data['short_code']).first() is None
+
+
+def test_listings_answer_conditional_gets(client):
+    """Test /api/urls and / send validators that turn repeat GETs into 304s until a link is added."""
+    first = client.get('/api/urls')
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"') and first.headers['Cache-Control'] == 'no-cache'
+    not_modified = client.get('/api/urls', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304 and not_modified.data == b''
+    assert not_modified.headers['ETag'] == etag
+
+    client.post('/api/shorten', data=json.dumps({'url': 'https://etag.example.com'}), content_type='application/json')
+    changed = client.get('/api/urls', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    home = client.get('/')
+    assert home.headers['ETag'] == changed.headers['ETag']
+    assert client.get('/', headers={'If-None-Match': home.headers['ETag']}).status_code == 304
+    # Last-Modified waits until the second of the last write is over, so a date can't hide this one.
+    assert 'Last-Modified' not in changed.headers
+    since = client.get('/api/urls', headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert since.status_code == 200
+
+
+def test_redirect_cache_control_and_permanent_status(client, monkeypatch):
+    """Test configured redirect caching: permanent status for lasting links, capped max-age for expiring ones."""
+    monkeypatch.setattr(http_cache, 'REDIRECT_CACHE_CONTROL', 'public, max-age=86400')
+    monkeypatch.setattr(http_cache, 'REDIRECT_PERMANENT_STATUS', 308)
+    lasting = json.loads(client.post('/api/shorten', data=json.dumps({'url': 'https://lasting.example.com'}),
+                                     content_type='application/json').data)['short_code']
+    expiring = json.loads(client.post('/api/shorten', data=json.dumps({'url': 'https://brief.example.com',
+                                                                        'expires_in': 60}),
+                                      content_type='application/json').data)['short_code']
+    redirect_cache.clear()
+    for _ in range(2):  # through the view, which caches the links, then from the fast path
+        response = client.get(f'/{lasting}')
+        assert response.status_code == 308
+        assert response.headers['Cache-Control'] == 'public, max-age=86400'
+        response = client.get(f'/{expiring}')
+        assert response.status_code == 302
+        assert 55 <= int(response.headers['Cache-Control'].rsplit('=', 1)[1]) <= 60
+
+
+def test_shorten_batch_empty(client):
+    """Test batch shorten returns 400 for an empty list."""
+    response = client.post('/api/shorten/batch', data='[]', content_type='application/json')
+    assert response.status_code == 400
+
+
+def test_listings_are_compressed_from_a_snapshot(client):
+    """Test gzip listings match the plain ones and come from a snapshot rebuilt only after a new link."""
+    from flask_app.app import list_snapshots
+    for i in range(20):
+        client.post('/api/shorten', data=json.dumps({'url': f'https://gzip{i}.example.com'}),
+                    content_type='application/json')
+    builds = list_snapshots.stats()['builds']
+    plain = client.get('/api/urls')
+    assert plain.headers['Vary'] == 'Accept-Encoding' and 'Content-Encoding' not in plain.headers
+    zipped = client.get('/api/urls', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip' and gzip.decompress(zipped.data) == plain.data
+    assert list_snapshots.stats()['builds'] == builds + 1
+
+    client.post('/api/shorten', data=json.dumps({'url': 'https://gzip-new.example.com'}),
+                content_type='application/json')
+    fresh = client.get('/api/urls', headers={'Accept-Encoding': 'gzip'})
+    assert json.loads(gzip.decompress(fresh.data))[0]['original_url'] == 'https://gzip-new.example.com'
+    assert list_snapshots.stats()['builds'] == builds + 2
+    home = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert b'gzip-new.example.com' in gzip.decompress(home.data)
+    streamed = client.get('/api/urls?stream=ndjson', headers={'Accept-Encoding': 'gzip'})
+    assert len(gzip.decompress(streamed.data).splitlines()) == 21